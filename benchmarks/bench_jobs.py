@@ -0,0 +1,66 @@
+"""Time process_path --stat on a trash with many directory entries for several --jobs values
+
+    poetry run python benchmarks/bench_jobs.py --entries 2000 --files 50 --jobs 1 2 4 8
+
+The trash is created in --directory (default: a temporary directory). Every --jobs value is timed
+after an untimed warm-up run, so all of them see the same warm cache. The numbers are most
+meaningful on the storage that needs them, like a network filesystem.
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import tempfile
+import time
+
+from trashgen import dry_run_options
+
+from autotrash import app
+
+
+def make_trash(root: str, entries: int, files: int) -> str:
+    info_path = os.path.join(root, "info")
+    os.makedirs(info_path)
+    deletion_date = datetime.datetime(2019, 10, 17, 15, 33, 57).isoformat()
+    for i in range(entries):
+        directory = os.path.join(root, "files", "entry%d" % i)
+        for j in range(files):
+            if j % 10 == 0:
+                os.makedirs(os.path.join(directory, "sub%d" % j))
+            with open(os.path.join(directory, "sub%d" % (j - j % 10), "file%d" % j), "wb") as f:
+                f.write(b"x" * 100)
+        with open(os.path.join(info_path, "entry%d.trashinfo" % i), "w") as f:
+            f.write("[Trash Info]\nPath=/entry%d\nDeletionDate=%s\n" % (i, deletion_date))
+    return info_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--directory", default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as root:
+        info_path = make_trash(root, args.entries, args.files)
+        os_access = app.new_os_access()
+        # One untimed run first, so the first --jobs value does not pay for a cold cache alone
+        app.process_path(info_path, dry_run_options(stat=True), app.StatsClass(), os_access)
+        baseline = None
+        for jobs in args.jobs:
+            options = dry_run_options(stat=True, jobs=jobs)
+            stats = app.StatsClass()
+            start = time.perf_counter()
+            app.process_path(info_path, options, stats, os_access)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = (elapsed, stats.total_size)
+            assert stats.total_size == baseline[1]
+            print("--jobs %-3d %8.3f s  %5.2fx" % (jobs, elapsed, baseline[0] / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Measure the peak memory use of process_path --dry-run on a large generated trash
+
+    poetry run python benchmarks/bench_memory.py --entries 200000
+    poetry run python benchmarks/bench_memory.py --entries 200000 --baseline HEAD~10
+
+Every mode runs in a child process of its own, its peak resident set size is reported next to
+that of a child that only imports autotrash. With --baseline, the modes also run on the autotrash
+of that git revision, on the same trash, and both are reported side by side.
+"""
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, Optional, Tuple
+
+from trashgen import Ratios, dry_run_options, make_trash
+
+MODES = {
+    "import": {},
+    "age": {"days": 180},
+    "delete": {"delete": 1},
+    "stat": {"days": 180, "stat": True},
+}
+
+
+def child(mode: str, info_path: str) -> None:
+    from autotrash import app
+
+    logging.basicConfig(level=logging.WARNING)
+    if mode == "import":
+        return
+    app.process_path(
+        info_path, dry_run_options(**MODES[mode]), app.StatsClass(), app.new_os_access()
+    )
+
+
+def peak_rss(mode: str, info_path: str, source: Optional[str] = None) -> int:
+    """Peak resident set size in bytes of a child process running mode on autotrash of source"""
+    env = dict(os.environ)
+    if source is not None:
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [source, env.get("PYTHONPATH")]))
+    process = subprocess.Popen([sys.executable, __file__, "--child", mode, info_path], env=env)
+    (_, status, rusage) = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError("%s failed with exit status %d" % (mode, process.returncode))
+    # Kilobytes on Linux
+    return rusage.ru_maxrss * 1024
+
+
+def export_source(revision: str, root: str) -> str:
+    """Extract src/ of the git revision into root, the directory to import its autotrash from"""
+    repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    archive = subprocess.run(
+        ["git", "-C", repository, "archive", "--format=tar", revision, "src"],
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    os.makedirs(root)
+    subprocess.run(["tar", "-x", "-C", root], check=True, input=archive)
+    return os.path.join(root, "src")
+
+
+def measure(
+    info_path: str, entries: int, source: Optional[str] = None
+) -> Dict[str, Tuple[int, float]]:
+    """Per mode the peak resident set size and the bytes per entry above that of import"""
+    results: Dict[str, Tuple[int, float]] = {}
+    for mode in MODES:
+        rss = peak_rss(mode, info_path, source)
+        results[mode] = (rss, (rss - results["import"][0]) / entries if results else 0.0)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--entries", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--directory", default=None)
+    parser.add_argument("--baseline", metavar="REVISION", help="compare with this git revision")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "INFO_PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as root:
+        # Only empty plain files, the number of entries is what matters here
+        trash = make_trash(
+            os.path.join(root, "Trash"),
+            args.entries,
+            args.seed,
+            ratios=Ratios(0, 0, 0, 0, 0, 0),
+            sizes=[0],
+        )
+        columns = [("current", measure(trash.info_path, args.entries))]
+        if args.baseline:
+            source = export_source(args.baseline, os.path.join(root, "baseline"))
+            columns.insert(0, (args.baseline, measure(trash.info_path, args.entries, source)))
+        # Peak resident set size and the bytes per entry above that of only importing autotrash
+        print("%-8s" % "mode" + "".join("  %-26s" % title for (title, _) in columns))
+        for mode in MODES:
+            print(
+                "%-8s" % mode
+                + "".join(
+                    "  %8.1f MB %6.0f B/entry" % (results[mode][0] / 2**20, results[mode][1])
+                    for (_, results) in columns
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Compare .trashinfo parsing against the configparser and strptime based implementation
+
+poetry run python benchmarks/bench_trashinfo.py --entries 20000
+"""
+
+import argparse
+import configparser
+import datetime
+import os
+import tempfile
+import timeit
+from typing import Union
+
+from autotrash.app import get_trash_info_date
+
+
+def configparser_read_datetime(value: str) -> datetime.datetime:
+    for format in ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%S.%fZ"]:
+        try:
+            return datetime.datetime.strptime(value, format)
+        except ValueError as ve:
+            failure = ve
+    raise failure
+
+
+def configparser_get_trash_info_date(fname: str) -> Union[datetime.datetime, None]:
+    """The configparser based get_trash_info_date replaced by autotrash.trashinfo"""
+    try:
+        parser = configparser.ConfigParser()
+        read_correctly = parser.read(fname)
+        section = "Trash Info"
+        key = "DeletionDate"
+        if read_correctly.count(fname) and parser.has_option(section, key):
+            return configparser_read_datetime(parser.get(section, key))
+    except Exception:
+        pass
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_names = []
+        start = datetime.datetime(2019, 10, 17, 15, 33, 57)
+        for i in range(args.entries):
+            file_name = os.path.join(directory, "file %d.trashinfo" % i)
+            deletion_date = (start - datetime.timedelta(minutes=i)).isoformat()
+            if i % 2:
+                deletion_date += ".710Z"
+            with open(file_name, "w") as f:
+                f.write(
+                    "[Trash Info]\nPath=/home/user/file%%20%d\nDeletionDate=%s\n"
+                    % (i, deletion_date)
+                )
+            file_names.append(file_name)
+
+        for fname in file_names:
+            assert get_trash_info_date(fname) == configparser_get_trash_info_date(fname)
+
+        for name, function in [
+            ("configparser", configparser_get_trash_info_date),
+            ("trashinfo", get_trash_info_date),
+        ]:
+            best = min(
+                timeit.repeat(
+                    lambda: [function(fname) for fname in file_names],
+                    number=1,
+                    repeat=args.repeat,
+                )
+            )
+            print(
+                "%-12s %8.3f s  %6.2f us/entry"
+                % (name, best, best * 1000000 / max(1, len(file_names)))
+            )
+
+
+if __name__ == "__main__":
+    main()
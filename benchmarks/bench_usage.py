@@ -0,0 +1,77 @@
+"""Compare the tree walker of get_consumed_size against the recursive os.path based implementation
+
+poetry run python benchmarks/bench_usage.py --files 1000000
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from typing import Callable, List, Tuple
+
+from autotrash.usage import get_tree_usage
+
+
+def recursive_get_consumed_size(path: str) -> int:
+    """The recursive get_consumed_size replaced by autotrash.usage.get_tree_usage"""
+    size = 0
+    try:
+        if os.path.islink(path):
+            size = os.lstat(path).st_size
+        else:
+            size = os.stat(path).st_blocks * 512
+            if os.path.isdir(path):
+                for entry_name in os.listdir(path):
+                    size += recursive_get_consumed_size(os.path.join(path, entry_name))
+    except OSError:
+        logging.error("Error getting size for %s", path)
+    return size
+
+
+def make_tree(root: str, files: int, fanout: int) -> None:
+    """Spread files over nested directories holding at most fanout files or directories each"""
+    directories = [root]
+    while len(directories) * fanout < files:
+        parents, directories = directories, []
+        for parent in parents:
+            for i in range(fanout):
+                directory = os.path.join(parent, "directory%d" % i)
+                os.mkdir(directory)
+                directories.append(directory)
+    for i in range(files):
+        directory = directories[i % len(directories)]
+        with open(os.path.join(directory, "file%d" % i), "wb") as f:
+            if i % 10 == 0:
+                f.write(b"x" * 5000)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--fanout", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        make_tree(root, args.files, args.fanout)
+        print("created %d files in %.1f s" % (args.files, time.perf_counter() - start))
+
+        usage = get_tree_usage(root)
+        assert usage.size == recursive_get_consumed_size(root)
+        functions: List[Tuple[str, Callable[[str], object]]] = [
+            ("recursive", recursive_get_consumed_size),
+            ("get_tree_usage", get_tree_usage),
+        ]
+        for name, function in functions:
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                function(root)
+                best = min(best, time.perf_counter() - start)
+            print("%-15s %8.3f s  %6.2f us/entry" % (name, best, best * 1000000 / usage.files))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Time the hot paths of autotrash on generated trash directories and write the results as JSON
+
+    poetry run python benchmarks/run.py --scales 1000 100000 --output results.json
+    poetry run python benchmarks/run.py --scales 1000 100000 --compare results.json
+
+Every benchmark runs --repeat times per scale and the fastest run counts. With --compare, the
+results are compared against an earlier JSON file and the exit status is 1 if a benchmark got
+slower than --fail-above times its earlier time. Generating a trash with 1000000 entries takes
+a few minutes and about 10GB; use --directory to put it on the filesystem of interest.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import optparse
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from trashgen import GeneratedTrash, dry_run_options, make_trash
+
+from autotrash import __version__, app
+
+
+def time_runs(function: Callable[[], object], repeat: int) -> List[float]:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def process_path(trash: GeneratedTrash, process_options: optparse.Values) -> Callable[[], object]:
+    def run():
+        stats = app.StatsClass()
+        app.process_path(trash.info_path, process_options, stats, app.new_os_access())
+
+    return run
+
+
+def file_benchmarks(trash: GeneratedTrash) -> Dict[str, Callable[[], object]]:
+    info_files = [entry.path for entry in app.scan_info_directory(trash.info_path)]
+    payloads = [entry.path for entry in app.scan_files_directory(trash.files_path).values()]
+    return {
+        "scan": lambda: (
+            app.scan_info_directory(trash.info_path),
+            app.scan_files_directory(trash.files_path),
+        ),
+        "get_trash_info_date": lambda: [app.get_trash_info_date(path) for path in info_files],
+        "get_consumed_size": lambda: [app.get_consumed_size(path) for path in payloads],
+    }
+
+
+def process_path_benchmarks(trash: GeneratedTrash) -> Dict[str, Callable[[], object]]:
+    """process_path --dry-run with the different ways of choosing what to purge"""
+    # process_path stops at the first corrupt .trashinfo file, so move those aside
+    for path in trash.corrupt:
+        os.rename(path, os.path.join(trash.path, os.path.basename(path)))
+    megabytes = max(
+        2, sum(app.get_consumed_size(path) for path in [trash.info_path, trash.files_path]) >> 20
+    )
+    return {
+        "process_path:age": process_path(trash, dry_run_options(days=180)),
+        "process_path:delete": process_path(trash, dry_run_options(delete=megabytes // 2)),
+        "process_path:trash_limit": process_path(
+            trash, dry_run_options(trash_limit=megabytes // 2)
+        ),
+        "process_path:delete_first": process_path(
+            trash, dry_run_options(delete=megabytes // 4, delete_first=[r".*\.bak", r".*\.avi"])
+        ),
+    }
+
+
+def benchmark_purge(root: str, entries: int, seed: int, repeat: int) -> List[float]:
+    """Time purging every entry of freshly generated trash directories"""
+    runs = []
+    for run in range(repeat):
+        path = os.path.join(root, "purge%d" % run)
+        trash = make_trash(path, entries, seed)
+        real_files = app.scan_files_directory(trash.files_path)
+        targets = [
+            (entry.path, real_files.get(entry.name[: -len(app.TRASHINFO_EXTENSION)]))
+            for entry in app.scan_info_directory(trash.info_path)
+        ]
+        start = time.perf_counter()
+        for trash_info, target_entry in targets:
+            app.purge(None, trash_info, False, target_entry)
+        runs.append(time.perf_counter() - start)
+        shutil.rmtree(path)
+    return runs
+
+
+def result(name: str, entries: int, runs: List[float]) -> dict:
+    return {
+        "benchmark": name,
+        "entries": entries,
+        "best": min(runs),
+        "median": statistics.median(runs),
+        "runs": runs,
+        "best_us_per_entry": min(runs) * 1000000 / entries,
+    }
+
+
+def run_scale(args, root: str, entries: int, results: Dict[str, dict]) -> None:
+    start = time.perf_counter()
+    trash = make_trash(os.path.join(root, "Trash%d" % entries), entries, args.seed)
+    print(
+        "generated %d entries in %.1f s" % (entries, time.perf_counter() - start), file=sys.stderr
+    )
+    for benchmarks in [file_benchmarks, process_path_benchmarks]:
+        for name, function in benchmarks(trash).items():
+            if not args.only or name in args.only:
+                report(results, result(name, entries, time_runs(function, args.repeat)))
+    shutil.rmtree(trash.path)
+    if not args.only or "purge" in args.only:
+        runs = benchmark_purge(root, entries, args.seed, args.purge_repeat)
+        report(results, result("purge", entries, runs))
+
+
+def report(results: Dict[str, dict], benchmark: dict) -> None:
+    key = "%s/%d" % (benchmark["benchmark"], benchmark["entries"])
+    results[key] = benchmark
+    print(
+        "%-35s %10.3f s  %8.2f us/entry" % (key, benchmark["best"], benchmark["best_us_per_entry"]),
+        file=sys.stderr,
+    )
+
+
+def compare(results: Dict[str, dict], baseline_path: str, fail_above: float) -> int:
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    slower = 0
+    print("%-35s %10s %10s %8s" % ("benchmark", "before", "after", "ratio"))
+    for key, benchmark in results.items():
+        if key not in baseline:
+            continue
+        ratio = benchmark["best"] / baseline[key]["best"]
+        marker = ""
+        if ratio > fail_above:
+            marker = "  slower"
+            slower += 1
+        print(
+            "%-35s %10.3f %10.3f %7.2fx%s"
+            % (key, baseline[key]["best"], benchmark["best"], ratio, marker)
+        )
+    return 1 if slower else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--purge-repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", help="only run these benchmarks")
+    parser.add_argument("--directory", default=None)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against the results in this JSON file")
+    parser.add_argument("--fail-above", type=float, default=1.25)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    results: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory(dir=args.directory) as root:
+        for entries in args.scales:
+            run_scale(args, root, entries, results)
+
+    document = {
+        "meta": {
+            "autotrash": __version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    if args.compare:
+        return compare(results, args.compare, args.fail_above)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
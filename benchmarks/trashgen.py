@@ -0,0 +1,168 @@
+"""Generate a realistic FreeDesktop.org trash directory for benchmarks
+
+    poetry run python benchmarks/trashgen.py --entries 100000 /tmp/Trash
+
+Deletion dates are spread over --days days. Besides plain files the trash holds wide and deep
+directories, symlinks to other entries, broken symlinks, hardlinks and corrupt .trashinfo files.
+The same --seed always gives the same trash.
+"""
+
+import argparse
+import datetime
+import optparse
+import os
+import random
+from typing import List, NamedTuple, Sequence
+from urllib.parse import quote
+
+NAMES = [
+    "document%d.pdf",
+    "photo %d.jpg",
+    "backup%d.bak",
+    "video%d.avi",
+    "notes-%d.txt",
+    "archive%d.tar.gz",
+    "Überweisung %d.odt",
+]
+
+NOW = datetime.datetime(2024, 6, 1, 12, 0, 0)
+
+
+class GeneratedTrash(NamedTuple):
+    path: str
+    info_path: str
+    files_path: str
+    entries: int
+    corrupt: List[str]
+
+
+class Ratios(NamedTuple):
+    directories: float = 0.01
+    deep_directories: float = 0.001
+    symlinks: float = 0.02
+    broken_symlinks: float = 0.01
+    hardlinks: float = 0.02
+    corrupt: float = 0.001
+
+
+def write_file(path: str, size: int) -> None:
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+
+
+def make_wide_directory(path: str, files: int, rng: random.Random) -> None:
+    os.mkdir(path)
+    for i in range(files):
+        if i % 10 == 0:
+            directory = os.path.join(path, "sub%d" % i)
+            os.mkdir(directory)
+        write_file(os.path.join(directory, "file%d" % i), rng.randrange(4096))
+
+
+def make_deep_directory(path: str, depth: int, rng: random.Random) -> None:
+    os.mkdir(path)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        for level in range(depth):
+            os.mkdir("level%d" % level, dir_fd=fd)
+            parent_fd, fd = fd, os.open("level%d" % level, os.O_RDONLY, dir_fd=fd)
+            os.close(parent_fd)
+            with open(
+                "file", "wb", opener=lambda name, flags: os.open(name, flags, dir_fd=fd)
+            ) as f:
+                f.write(b"x" * rng.randrange(4096))
+    finally:
+        os.close(fd)
+
+
+def trash_info(name: str, deletion_date: datetime.datetime, fraction: bool) -> str:
+    date = deletion_date.strftime("%Y-%m-%dT%H:%M:%S")
+    if fraction:
+        date += ".%03dZ" % (deletion_date.microsecond // 1000)
+    return "[Trash Info]\nPath=%s\nDeletionDate=%s\n" % (quote("/home/user/" + name), date)
+
+
+def make_trash(
+    path: str,
+    entries: int,
+    seed: int = 0,
+    days: int = 365,
+    ratios: Ratios = Ratios(),
+    files_per_directory: int = 20,
+    depth: int = 40,
+    sizes: Sequence[int] = (0, 100, 2000, 5000, 20000),
+) -> GeneratedTrash:
+    """Create a trash directory at path with the given number of .trashinfo files
+
+    Trashed files get one of sizes, picked at random.
+    """
+    rng = random.Random(seed)
+    info_path = os.path.join(path, "info")
+    files_path = os.path.join(path, "files")
+    os.makedirs(info_path)
+    os.makedirs(files_path)
+    thresholds = []
+    total = 0.0
+    for kind in Ratios._fields:
+        total += getattr(ratios, kind)
+        thresholds.append((total, kind))
+
+    corrupt = []
+    files: List[str] = []
+    for i in range(entries):
+        name = rng.choice(NAMES) % i
+        file_path = os.path.join(files_path, name)
+        info_file = os.path.join(info_path, name + ".trashinfo")
+        draw = rng.random()
+        kind = next((kind for (threshold, kind) in thresholds if draw < threshold), "file")
+        if kind == "directories":
+            make_wide_directory(file_path, files_per_directory, rng)
+        elif kind == "deep_directories":
+            make_deep_directory(file_path, depth, rng)
+        elif kind == "symlinks" and files:
+            os.symlink(os.path.relpath(rng.choice(files), files_path), file_path)
+        elif kind == "broken_symlinks":
+            os.symlink("missing-%d" % i, file_path)
+        elif kind == "hardlinks" and files:
+            os.link(rng.choice(files), file_path)
+        else:
+            write_file(file_path, rng.choice(sizes))
+            files.append(file_path)
+
+        deletion_date = NOW - datetime.timedelta(seconds=rng.uniform(0, days * 24 * 3600))
+        with open(info_file, "w") as f:
+            if kind == "corrupt":
+                f.write(rng.choice(["", "[Trash Info]\nPath=/x\n", "\0garbage\n"]))
+                corrupt.append(info_file)
+            else:
+                f.write(trash_info(name, deletion_date, fraction=rng.random() < 0.1))
+    return GeneratedTrash(path, info_path, files_path, entries, corrupt)
+
+
+def dry_run_options(**values) -> optparse.Values:
+    """The options of a quiet autotrash --dry-run with values in place of their defaults"""
+    from autotrash.options import new_parser
+
+    options = new_parser().get_default_values()
+    options.quiet = True
+    options.dryrun = True
+    for name, value in values.items():
+        setattr(options, name, value)
+    return options
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("path")
+    parser.add_argument("--entries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+    trash = make_trash(args.path, args.entries, args.seed, args.days)
+    print("created %d entries in %s, %d corrupt" % (trash.entries, trash.path, len(trash.corrupt)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
-from importlib.metadata import PackageNotFoundError, version
+def __getattr__(name: str) -> str:
+    # importlib.metadata takes longer to import than the rest of autotrash, so the version is only
+    # looked up when it is asked for
+    if name == "__version__":
+        from importlib.metadata import PackageNotFoundError, version
 
-try:
-    __version__ = version(__name__)
-except PackageNotFoundError:
-    __version__ = "unknown"
+        try:
+            return version(__name__)
+        except PackageNotFoundError:
+            return "unknown"
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,148 @@
+import asyncio
+import optparse
+import os
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from autotrash.app import Decision, StatsClass, new_os_access, new_throttle, process_path
+from autotrash.backend import Backend
+from autotrash.options import check_options, new_parser
+
+# Cleaning trash directories from a long running Python process instead of the command line:
+#
+#     result = clean("~/.local/share/Trash", Policy(days=30))
+#     for decision in result.purged:
+#         print(decision.real_file, decision.reason)
+#
+# A Policy holds the options of the command line that decide what is purged. It is checked like
+# the command line, raising autotrash.options.OptionsError, and never changed. The file system is
+# accessed through a Backend, by default that of new_backend. Messages are logged to the root
+# logger like the command line does, with the VERBOSE level of autotrash.app for the details.
+
+
+class Policy(NamedTuple):
+    """What to purge from a trash directory, named after the options of the command line"""
+
+    days: int = 0
+    delete: int = 0
+    min_free: int = 0
+    max_free: int = 0
+    recheck_free: int = 0
+    trash_limit: int = 0
+    evict: str = "oldest"
+    evict_min_age: int = 0
+    delete_first: Tuple[str, ...] = ()
+    dryrun: bool = False
+    # Fill in the totals of the Result stats, as --stat does
+    stat: bool = False
+    check: bool = False
+    orphans: Optional[str] = None
+    mtime_window: int = 0
+    estimate: float = 0.0
+    # --index, which would hide tuple.index
+    use_index: bool = False
+    jobs: int = 1
+    purge_workers: int = 1
+    unlink_rate: int = 0
+    metadata_rate: int = 0
+
+    @classmethod
+    def from_options(cls, options) -> "Policy":
+        """The policy of parsed command line options"""
+        values = {name: getattr(options, name) for name in cls._fields if name != "use_index"}
+        values["delete_first"] = tuple(values["delete_first"])
+        return cls(use_index=options.index, **values)
+
+    def to_options(self) -> optparse.Values:
+        """Command line options with this policy and the defaults for everything else"""
+        options = new_parser().get_default_values()
+        for name, value in self._asdict().items():
+            setattr(options, name, value)
+        options.delete_first = list(self.delete_first)
+        options.index = self.use_index
+        del options.use_index
+        return options
+
+    def validate(self) -> None:
+        """Raise OptionsError when the command line would not accept this policy"""
+        check_options(None, self.to_options())
+
+
+class Result(NamedTuple):
+    trash_path: str
+    # Whether processing the trash directory failed, the exit status of the command line
+    failed: bool
+    stats: StatsClass
+    decisions: List[Decision]
+
+    @property
+    def purged(self) -> List[Decision]:
+        return [decision for decision in self.decisions if decision.action == "purge"]
+
+    @property
+    def kept(self) -> List[Decision]:
+        return [decision for decision in self.decisions if decision.action == "keep"]
+
+
+def new_backend(policy: Policy) -> Backend:
+    """The Backend of the real file system, paced by the rates of policy"""
+    return new_os_access(new_throttle(policy.to_options()))
+
+
+def clean(trash_path: str, policy: Policy, backend: Optional[Backend] = None) -> Result:
+    """Purge from the trash directory trash_path, holding info/ and files/, what policy says
+
+    Errors reading the trash directory are raised, errors purging an entry are logged.
+    """
+    options = policy.to_options()
+    check_options(None, options)
+    if backend is None:
+        backend = new_os_access(new_throttle(options))
+    options.trash_path = trash_path
+    stats = StatsClass()
+    decisions: List[Decision] = []
+    trash_info_path = os.path.join(os.path.expanduser(trash_path), "info")
+    failed = process_path(trash_info_path, options, stats, backend, decisions)
+    return Result(trash_path, bool(failed), stats, decisions)
+
+
+def clean_all(
+    trash_paths: Iterable[str], policy: Policy, backend: Optional[Backend] = None
+) -> List[Result]:
+    """clean every trash directory of trash_paths one by one, sharing backend and its rates"""
+    if backend is None:
+        backend = new_backend(policy)
+    return [clean(trash_path, policy, backend) for trash_path in trash_paths]
+
+
+async def clean_async(trash_path: str, policy: Policy, backend: Optional[Backend] = None) -> Result:
+    """clean on a thread of the default executor, so the event loop keeps running meanwhile"""
+    return await asyncio.to_thread(clean, trash_path, policy, backend)
+
+
+async def clean_all_async(
+    trash_paths: Iterable[str],
+    policy: Policy,
+    backend: Optional[Backend] = None,
+    workers: int = 4,
+) -> List[Result]:
+    """clean the trash directories of trash_paths, at most workers of them at the same time
+
+    The results are in the order of trash_paths. Should cleaning one raise, the others are still
+    cleaned before the first exception is raised.
+    """
+    policy.validate()
+    if backend is None:
+        backend = new_backend(policy)
+    semaphore = asyncio.Semaphore(workers)
+
+    async def clean_one(trash_path: str) -> Result:
+        async with semaphore:
+            return await clean_async(trash_path, policy, backend)
+
+    results = await asyncio.gather(
+        *(clean_one(trash_path) for trash_path in trash_paths), return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return [result for result in results if isinstance(result, Result)]
@@ -15,67 +15,134 @@
 #
 #   You should have received a copy of the GNU General Public License
 #   along with this program. If not, see <http://www.gnu.org/licenses/>.
-import configparser
+import collections
 import datetime
-import errno
+import functools
 import logging
 import math
+import operator
 import os
 import re
-import shutil
 import stat
-import subprocess
 import sys
-from typing import Union
-
-from autotrash import __version__
+import threading
+import time
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from autotrash.mounts import find_mount_trashes, read_mountinfo, writable_mounts
 from autotrash.options import check_options, new_parser
+from autotrash.throttle import Throttle, dirent_size, lower_priority, paced_unlink
+from autotrash.trashinfo import TRASHINFO_EXTENSION, TrashInfo, parse_trash_info
+from autotrash.users import User, drop_privileges, find_users
+
+# Modules only some runs need, like the thread pools, the index and the metrics, are imported by
+# the functions using them. Most runs of a frequent --max-free timer find enough free space and
+# exit right away, so their start up time is most of the time they take.
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    from autotrash.directorysizes import DirectorySizes
+    from autotrash.estimate import Estimate
+    from autotrash.index import TrashIndex
 
 # custom logging level between DEBUG and INFO
 VERBOSE = 15
 
 
+# Phases of a run, in the order they happen, timed in StatsClass.phases
+PHASES = [
+    "discovery",
+    "resuming",
+    "listing",
+    "orphans",
+    "parsing",
+    "sizing",
+    "sorting",
+    "purging",
+]
+
+# Directories being purged are moved here, in the trash directory, so a purge that is interrupted
+# is finished by the next run without the entry having to be read and sized again
+STAGING_DIRECTORY = ".autotrash-purge"
+
+# Orphans changed less than this many seconds ago are left alone, as they may belong to an entry
+# that a file manager is trashing or restoring right now
+ORPHAN_GRACE_SECONDS = 3600
+
+# No .trashinfo file was written before the trash specification (2004), a modification time
+# before that has been reset and says nothing about when the entry was trashed
+MIN_PLAUSIBLE_MTIME = 1072915200
+
+
 class StatsClass:
     total_size = 0
     total_files = 0
     deleted_size = 0
     deleted_files = 0
     failures = 0
+    entries_scanned = 0
+    trash_infos_read = 0
+    # Variances of the sizes, when they are estimated with --estimate
+    total_size_variance = 0.0
+    deleted_size_variance = 0.0
+    remaining_size_variance = 0.0
+    bytes_sized = 0
+    bytes_freed = 0
+    # Real files without a .trashinfo file, with --orphans
+    orphan_files = 0
+    orphan_bytes = 0
+    # File system calls, only counted when running with a Throttle
+    syscalls = 0
+    # Interrupted purges finished, these already counted as deleted in the run that started them
+    purges_resumed = 0
+
+    COUNTERS = [
+        "total_size",
+        "total_files",
+        "deleted_size",
+        "deleted_files",
+        "failures",
+        "entries_scanned",
+        "trash_infos_read",
+        "bytes_sized",
+        "bytes_freed",
+        "orphan_files",
+        "orphan_bytes",
+        "total_size_variance",
+        "deleted_size_variance",
+        "remaining_size_variance",
+        "syscalls",
+        "purges_resumed",
+    ]
 
+    def __init__(self) -> None:
+        # Seconds spent per phase
+        self.phases: Dict[str, float] = {}
+        # The StatsClass of every trash information directory that was processed
+        self.directories: Dict[str, "StatsClass"] = {}
 
-def on_remove_error(function, path, excinfo):
-    if excinfo[0] == errno.EPERM:
-        # Permission errors, try a chmod to recover
-        if function == os.remove:
-            # Tried to remove a file, but failed.
-            # Try to change the write permissions of the tree to delete it
-            logging.log(
-                VERBOSE,
-                "Failed to remove file at: %s\n"
-                "\tgot exception: %s\n"
-                "\tchanging permissions and trying again.",
-                path,
-                str(excinfo),
-            )
-            os.chmod(path, stat.S_IWUSR)
-            os.unlink(path)
-            return
-        if function == os.rmdir:
-            # Tried to remove a directory, but failed.
-            # Try to change the write permissions of the tree to delete it
-            logging.log(
-                VERBOSE,
-                "Failed to remove directory at: %s\n"
-                "\tgot exception: %s\n"
-                "\tchanging permissions and trying again.",
-                path,
-                str(excinfo),
-            )
-            os.chmod(path, stat.S_IWUSR)
-            os.unlink(path)
-            return
-    # Other error, what will it be?
-    logging.error('Failed to remove "%s", got exception: %s', path, str(excinfo))
+    def add_time(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def merge(self, other: "StatsClass") -> None:
+        for counter in self.COUNTERS:
+            setattr(self, counter, getattr(self, counter) + getattr(other, counter))
+        for phase, seconds in other.phases.items():
+            self.add_time(phase, seconds)
+        self.directories.update(other.directories)
 
 
 def real_file_name(trash_name: str) -> str:
@@ -86,79 +153,282 @@ def real_file_name(trash_name: str) -> str:
     return os.path.join(trash_directory, "files", file_name)
 
 
-def purge(trash_directory, trash_name, dryrun):
-    """Purge the file behind the trash file fname"""
-    assert os.path.exists(trash_name)
+class TrashEntry:
+    """A trash entry: the directory entries of its .trashinfo and real file, its deletion time as a
+    timestamp and its consumed size once known
+
+    The paths are derived from the directory entries when needed, so even millions of these take
+    little memory.
+    """
+
+    __slots__ = ("trash_info_entry", "real_file_entry", "deletion_time", "size")
+
+    def __init__(self, trash_info_entry, real_file_entry, deletion_time: float = 0.0) -> None:
+        self.trash_info_entry = trash_info_entry
+        self.real_file_entry = real_file_entry
+        self.deletion_time = deletion_time
+        self.size: Optional[int] = None
+
+    @property
+    def name(self) -> str:
+        """Name of the real file"""
+        return self.trash_info_entry.name[: -len(TRASHINFO_EXTENSION)]
+
+    @property
+    def trash_info(self) -> str:
+        return self.trash_info_entry.path
+
+    @property
+    def real_file(self) -> str:
+        return real_file_name(self.trash_info_entry.path)
+
+
+class StatEntry:
+    """Stands in for the os.DirEntry of a file that was lstat'ed instead of listed"""
+
+    __slots__ = ("name", "path", "st")
+
+    def __init__(self, path: str, st: os.stat_result) -> None:
+        self.name = os.path.basename(path)
+        self.path = path
+        self.st = st
+
+    def stat(self, follow_symlinks=True):
+        # Only ever used without following links
+        return self.st
+
+    def is_dir(self, follow_symlinks=True):
+        return stat.S_ISDIR(self.st.st_mode)
+
+    def is_symlink(self):
+        return stat.S_ISLNK(self.st.st_mode)
+
+
+class Decision(NamedTuple):
+    """What was done with an entry of a trash directory, or would be in a dry run"""
+
+    # Name of the real file, or of the .trashinfo file of an orphan without one
+    name: str
+    trash_info: Optional[str]
+    real_file: Optional[str]
+    # Timestamp of the DeletionDate, None for orphans
+    deletion_time: Optional[float]
+    # Consumed bytes, None when the entry was not sized
+    size: Optional[int]
+    # "purge" or "keep"
+    action: str
+    # Why it is purged: "age", "size" for --delete, --min-free and --trash_limit, "free space" for
+    # --recheck-free, or "orphan"
+    reason: Optional[str] = None
+
+    @classmethod
+    def of(cls, entry: TrashEntry, action: str, reason: Optional[str] = None) -> "Decision":
+        real_file = entry.real_file if entry.real_file_entry is not None else None
+        return cls(
+            entry.name, entry.trash_info, real_file, entry.deletion_time, entry.size, action, reason
+        )
+
+
+def purge(trash_directory, trash_name, dryrun, target_entry, throttle=None):
+    """Purge the file behind the trash file fname
+
+    target_entry is the os.DirEntry of the real file found while scanning the trash, or None if
+    there was no real file. The .trashinfo file is only removed once the real file is gone.
+    Unlinking is paced by throttle, if given. Returns whether the entry was removed.
+    """
     target = real_file_name(trash_name)
     if dryrun:
-        # Broken links will not os.path.exist
-        if os.path.exists(target) or os.path.islink(target):
+        if target_entry is not None:
             logging.info("Remove %s", target)
         else:
             logging.info("Ignore %s", target)
-        if os.path.exists(trash_name):
-            logging.info("Remove %s", trash_name)
-        else:
-            logging.info("Ignore %s", trash_name)
+        logging.info("Remove %s", trash_name)
         return False
 
     # The real deleting...
-    if os.path.islink(target):
-        logging.log(VERBOSE, "Removing link %s", target)
-        os.unlink(target)
-    elif os.path.isdir(target):
+    from autotrash.remove import remove_tree
+
+    if target_entry is None:
+        logging.log(VERBOSE, "Ignore non-existing file %s", target)
+    elif target_entry.is_dir(follow_symlinks=False):
         logging.log(VERBOSE, "Removing directory %s", target)
-        shutil.rmtree(target, False, on_remove_error)
+        st = target_entry.stat(follow_symlinks=False)
+        staged = stage_purge(target, st, throttle)
+        if staged is not None:
+            # From here on the directory is purged, what is left of it is removed by resume_purges
+            paced_unlink(throttle, os.unlink, trash_name)
+            errors = remove_tree(staged, st, throttle)
+            for path, error in errors:
+                logging.error('Failed to remove "%s", got exception: %s', path, error)
+            return True
+        errors = remove_tree(target, st, throttle)
+        for path, error in errors:
+            logging.error('Failed to remove "%s", got exception: %s', path, error)
+        if errors:
+            # Keep the .trashinfo file, so the rest is removed by a later run
+            return False
     else:
-        # Make sure we do not try to unlink a file that does not exist.
-        if os.path.exists(target):
-            logging.log(VERBOSE, "Removing file %s", target)
-            os.unlink(target)
+        if target_entry.is_symlink():
+            logging.log(VERBOSE, "Removing link %s", target)
         else:
+            logging.log(VERBOSE, "Removing file %s", target)
+        try:
+            paced_unlink(throttle, os.unlink, target)
+        except FileNotFoundError:
             logging.log(VERBOSE, "Ignore non-existing file %s", target)
 
-    os.unlink(trash_name)
+    paced_unlink(throttle, os.unlink, trash_name)
     return True
 
 
-def read_datetime(value: str) -> datetime.datetime:
-    for format in ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%S.%fZ"]:
-        try:
-            return datetime.datetime.strptime(value, format)
-        except ValueError as ve:
-            failure = ve
-    raise failure
+def stage_purge(
+    target: str, st: os.stat_result, throttle: Optional[Throttle] = None
+) -> Optional[str]:
+    """Move the directory target into the STAGING_DIRECTORY of its trash directory to purge it
 
+    Returns the path it was moved to, or None when it could not be moved and has to be purged in
+    place. A directory with the same name that was left behind there is removed first.
+    """
+    from autotrash.remove import remove_tree
 
-def get_trash_info_date(fname: str) -> Union[datetime.datetime, None]:
+    staging = os.path.join(os.path.dirname(os.path.dirname(target)), STAGING_DIRECTORY)
+    staged = os.path.join(staging, os.path.basename(target))
+    try:
+        if throttle is not None:
+            throttle.count(2)
+        os.mkdir(staging, 0o700)
+    except FileExistsError:
+        if os.path.lexists(staged) and remove_tree(staged, None, throttle):
+            return None
+    except OSError as error:
+        logging.log(VERBOSE, "Can not create %s: %s", staging, error)
+        return None
+    try:
+        os.rename(target, staged)
+    except OSError as error:
+        logging.log(VERBOSE, "Can not move %s to %s: %s", target, staging, error)
+        return None
+    return staged
+
+
+def resume_purges(trash_directory: str, dryrun: bool, throttle: Optional[Throttle] = None) -> int:
+    """Finish the purges of a trash directory that were interrupted, returning how many there were
+
+    These are the directories left in its STAGING_DIRECTORY. A .trashinfo file that was not removed
+    yet is removed as well, unless a new entry with the same name was trashed since.
+    """
+    staging = os.path.join(trash_directory, STAGING_DIRECTORY)
+    if throttle is not None:
+        throttle.count(1)
     try:
-        parser = configparser.ConfigParser()
-        read_correctly = parser.read(fname)
-        section = "Trash Info"
-        key = "DeletionDate"
-        if read_correctly.count(fname) and parser.has_option(section, key):
-            # Read the file successfully, parse the DeletionDate
-            return read_datetime(parser.get(section, key))
+        with os.scandir(staging) as entries:
+            staged = list(entries)
+    except FileNotFoundError:
+        return 0
+    if dryrun:
+        for entry in staged:
+            logging.info("Remove %s", entry.path)
+        return 0
+
+    from autotrash.remove import remove_tree
+
+    resumed = 0
+    for entry in staged:
+        logging.info("Resuming the interrupted purge of %s", entry.path)
+        errors = remove_tree(entry.path, entry.stat(follow_symlinks=False), throttle)
+        for path, error in errors:
+            logging.error('Failed to remove "%s", got exception: %s', path, error)
+        if errors:
+            continue
+        resumed += 1
+        trash_info = os.path.join(trash_directory, "info", entry.name + TRASHINFO_EXTENSION)
+        if not os.path.lexists(os.path.join(trash_directory, "files", entry.name)):
+            try:
+                paced_unlink(throttle, os.unlink, trash_info)
+            except FileNotFoundError:
+                pass
+    try:
+        os.rmdir(staging)
+    except OSError:
+        # Something was left behind, which the next run tries again
+        pass
+    return resumed
+
+
+def purge_orphan(path, dryrun, target_entry, throttle=None):
+    """Purge a real file without a .trashinfo file, or a .trashinfo file without a real file
+
+    target_entry is the os.DirEntry of path. Returns whether it was removed.
+    """
+    if dryrun:
+        logging.info("Remove %s", path)
+        return False
+    if target_entry.is_dir(follow_symlinks=False):
+        from autotrash.remove import remove_tree
+
+        logging.log(VERBOSE, "Removing orphaned directory %s", path)
+        errors = remove_tree(path, target_entry.stat(follow_symlinks=False), throttle)
+        for error_path, error in errors:
+            logging.error('Failed to remove "%s", got exception: %s', error_path, error)
+        return not errors
+    logging.log(VERBOSE, "Removing orphaned file %s", path)
+    try:
+        paced_unlink(throttle, os.unlink, path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def get_trash_info(fname: str, throttle: Optional[Throttle] = None) -> Optional[TrashInfo]:
+    try:
+        with open(fname, "rb") as f:
+            data = f.read()
+        if throttle is not None:
+            throttle.metadata(len(data))
+        return parse_trash_info(data)
+    except FileNotFoundError:
+        pass
     except Exception as e:
         # Error because exit status will be >0 because of this
         logging.error("Failed to read %s: %s", fname, e)
     return None
 
 
-def get_consumed_size(path: str) -> int:
-    """Get the amount of filesystem space actually consumed by a file or directory"""
-    size = 0
-    try:
-        if os.path.islink(path):
-            size = os.lstat(path).st_size
-        else:
-            size = os.stat(path).st_blocks * 512
-            if os.path.isdir(path):
-                for entry_name in os.listdir(path):
-                    size += get_consumed_size(os.path.join(path, entry_name))
-    except OSError:
-        logging.error("Error getting size for %s", path)
-    return size
+def get_trash_info_date(fname: str) -> Union[datetime.datetime, None]:
+    trash_info = get_trash_info(fname)
+    return None if trash_info is None else trash_info.deletion_date
+
+
+def get_consumed_size(path: str, st: Optional[os.stat_result] = None) -> int:
+    """Get the amount of filesystem space actually consumed by a file or directory
+
+    st is the lstat result of path, if the caller already has it.
+    """
+    from autotrash.usage import get_tree_usage
+
+    return get_tree_usage(path, st).size
+
+
+def get_consumed_sizes(
+    trees: Sequence[Tuple[str, Optional[os.stat_result]]],
+    jobs: int = 1,
+    throttle: Optional[Throttle] = None,
+) -> List[int]:
+    """Get the consumed size of every (path, lstat result or None) in trees, using jobs threads"""
+    from autotrash.usage import get_tree_usage, get_tree_usages
+
+    if jobs > 1:
+        return [usage.size for usage in get_tree_usages(trees, jobs, throttle)]
+    return [get_tree_usage(path, st, throttle).size for (path, st) in trees]
+
+
+def estimate_sizes(entries, directory_sizes, seconds, throttle=None):
+    """Size a random sample of entries within seconds, see autotrash.estimate.estimate_sizes"""
+    import random
+
+    from autotrash import estimate
+
+    return estimate.estimate_sizes(entries, directory_sizes, seconds, random.Random(), throttle)
 
 
 def fmt_bytes(num_bytes: int, fmt: str = "%.1f") -> str:
@@ -175,7 +445,7 @@ def fmt_bytes(num_bytes: int, fmt: str = "%.1f") -> str:
     return "%d bytes" % num_bytes
 
 
-def find_trash_directories(override_dir=None, find_mounts=False):
+def find_trash_directories(override_dir=None, find_mounts=False, mount_timeout=5.0):
     if override_dir:
         return [override_dir]
 
@@ -188,22 +458,13 @@ def find_trash_directories(override_dir=None, find_mounts=False):
     trash_paths.append(trash_path)
     logging.log(VERBOSE, "Found trash directory: %s" % (trash_path))
 
-    # Add trash "top directories" in all mount points (if they exist)
+    # Add trash "top directories" in all writable mount points (if they exist)
     if find_mounts:
-        with open("/proc/mounts", "r") as mounts:
-            for line in mounts.readlines():
-                mount_path = line.split()[1]
-
-                # Find a usable trash path on this device
-                trash_path_options = [
-                    os.path.join(mount_path, ".Trash", str(os.getuid())),
-                    os.path.join(mount_path, ".Trash-%d" % (os.getuid())),
-                ]
-                for trash_path in trash_path_options:
-                    if os.path.exists(trash_path):
-                        logging.log(VERBOSE, "Found trash directory: %s" % (trash_path))
-                        trash_paths.append(trash_path)
-                        break
+        mounts = writable_mounts(read_mountinfo())
+        logging.log(VERBOSE, "Looking for trash directories on %d mounts", len(mounts))
+        for trash_path in find_mount_trashes(mounts, os.getuid(), mount_timeout):
+            logging.log(VERBOSE, "Found trash directory: %s" % (trash_path))
+            trash_paths.append(trash_path)
 
     return trash_paths
 
@@ -221,28 +482,421 @@ def get_fs_stat(trash_info_path):
     return os.statvfs(trash_info_path)
 
 
-def get_file_names(trash_info_path):
-    return [
-        os.path.join(trash_info_path, fn)
-        for fn in os.listdir(trash_info_path)
-        if fn.endswith(".trashinfo")
-    ]
+def get_free_megabytes(fs_stat) -> int:
+    return int((fs_stat.f_bavail * fs_stat.f_bsize) / (1024 * 1024))
+
+
+def scan_info_directory(
+    trash_info_path: str, throttle: Optional[Throttle] = None
+) -> List[os.DirEntry]:
+    with os.scandir(trash_info_path) as entries:
+        listed = list(entries)
+    if throttle is not None:
+        throttle.metadata(sum(dirent_size(entry.name) for entry in listed))
+    return [entry for entry in listed if entry.name.endswith(TRASHINFO_EXTENSION)]
+
+
+def iter_info_directory(
+    trash_info_path: str, throttle: Optional[Throttle] = None
+) -> Iterator[os.DirEntry]:
+    """The entries of scan_info_directory, one by one while the directory is read"""
+    with os.scandir(trash_info_path) as entries:
+        if throttle is not None:
+            throttle.count(1)
+        for entry in entries:
+            if throttle is not None:
+                throttle.metadata(dirent_size(entry.name), calls=0)
+            if entry.name.endswith(TRASHINFO_EXTENSION):
+                yield entry
+
+
+def get_file_entry(path: str, throttle: Optional[Throttle] = None) -> Optional[StatEntry]:
+    """The entry of a single file in the files directory, None if it does not exist"""
+    if throttle is not None:
+        throttle.count(1)
+    try:
+        return StatEntry(path, os.lstat(path))
+    except FileNotFoundError:
+        return None
+
+
+def scan_files_directory(
+    trash_files_path: str, throttle: Optional[Throttle] = None
+) -> Dict[str, os.DirEntry]:
+    try:
+        with os.scandir(trash_files_path) as entries:
+            listed = {entry.name: entry for entry in entries}
+    except FileNotFoundError:
+        return {}
+    if throttle is not None:
+        throttle.metadata(sum(dirent_size(name) for name in listed))
+    return listed
 
 
 def get_cur_time():
-    return datetime.datetime.now().timestamp()
+    return time.time()
 
 
 class OsAccess:
-    get_file_names = None
+    """A Backend assembled from callables assigned to these attributes
+
+    Kept for code that fills one in by hand, new code implements autotrash.backend.Backend or
+    overrides methods of OsBackend.
+    """
+
+    scan_info_directory = None
+    scan_files_directory = None
+    iter_info_directory = None
+    get_file_entry = None
     get_cur_time = None
     get_fs_stat = None
-    get_consumed_size = None
-    get_trash_info_date = None
+    get_consumed_sizes = None
+    get_trash_info = None
+    get_directory_sizes = None
+    get_index = None
     purge = None
+    purge_orphan = None
+    resume_purges = None
+    estimate_sizes = None
+
+
+class OsBackend:
+    """The Backend of the real file system, pacing its I/O with throttle if given"""
+
+    def __init__(self, throttle: Optional[Throttle] = None) -> None:
+        self.throttle = throttle
+
+    def scan_info_directory(self, trash_info_path: str) -> List[os.DirEntry]:
+        return scan_info_directory(trash_info_path, self.throttle)
+
+    def scan_files_directory(self, trash_files_path: str) -> Dict[str, os.DirEntry]:
+        return scan_files_directory(trash_files_path, self.throttle)
+
+    def iter_info_directory(self, trash_info_path: str) -> Iterator[os.DirEntry]:
+        return iter_info_directory(trash_info_path, self.throttle)
+
+    def get_file_entry(self, path: str) -> Optional[StatEntry]:
+        return get_file_entry(path, self.throttle)
+
+    def get_cur_time(self) -> float:
+        return get_cur_time()
+
+    def get_fs_stat(self, trash_info_path: str) -> os.statvfs_result:
+        return get_fs_stat(trash_info_path)
+
+    def get_consumed_sizes(
+        self, trees: Sequence[Tuple[str, Optional[os.stat_result]]], jobs: int = 1
+    ) -> List[int]:
+        return get_consumed_sizes(trees, jobs, self.throttle)
+
+    def get_trash_info(self, fname: str) -> Optional[TrashInfo]:
+        return get_trash_info(fname, self.throttle)
 
+    def get_directory_sizes(self, trash_directory: str) -> "DirectorySizes":
+        from autotrash.directorysizes import DirectorySizes
 
-def process_path(trash_info_path, options, stats, os_access) -> int:
+        return DirectorySizes.load(trash_directory)
+
+    def get_index(self, trash_directory: str) -> Optional["TrashIndex"]:
+        from autotrash.index import TrashIndex
+
+        return TrashIndex.open(trash_directory)
+
+    def purge(self, trash_directory, trash_name: str, dryrun: bool, target_entry) -> bool:
+        return purge(trash_directory, trash_name, dryrun, target_entry, self.throttle)
+
+    def purge_orphan(self, path: str, dryrun: bool, target_entry) -> bool:
+        return purge_orphan(path, dryrun, target_entry, self.throttle)
+
+    def resume_purges(self, trash_directory: str, dryrun: bool) -> int:
+        return resume_purges(trash_directory, dryrun, self.throttle)
+
+    def estimate_sizes(
+        self, entries: List[TrashEntry], directory_sizes: "DirectorySizes", seconds: float
+    ) -> Dict[TrashEntry, "Estimate"]:
+        return estimate_sizes(entries, directory_sizes, seconds, self.throttle)
+
+
+def new_os_access(throttle: Optional[Throttle] = None) -> OsBackend:
+    """The Backend of the real file system, which paces its I/O with throttle if given"""
+    return OsBackend(throttle)
+
+
+def size_entries(entries, directory_sizes, os_access, jobs) -> int:
+    """Set the consumed size of the .trashinfo and real file of every TrashEntry
+
+    Directories are looked up in the directorysizes cache first, everything else is sized by
+    os_access.get_consumed_sizes in one batch so it can be spread over jobs threads.
+    Returns the total size.
+    """
+    trees = []
+    # Per tree: the TrashEntry it belongs to and the directorysizes entry it fills in, if any
+    owners: List[Tuple[TrashEntry, Optional[Tuple[str, int]]]] = []
+    cached = 0
+    for entry in entries:
+        entry.size = 0
+        trash_info_stat = entry.trash_info_entry.stat(follow_symlinks=False)
+        trees.append((entry.trash_info, trash_info_stat))
+        owners.append((entry, None))
+        real_file_entry = entry.real_file_entry
+        if real_file_entry is None:
+            continue
+        cache_entry = None
+        if real_file_entry.is_dir(follow_symlinks=False):
+            cache_entry = (real_file_entry.name, int(trash_info_stat.st_mtime))
+            directory_size = directory_sizes.lookup(*cache_entry)
+            if directory_size is not None:
+                entry.size += directory_size
+                cached += 1
+                continue
+            logging.log(
+                VERBOSE,
+                "Calculating size of directory %s (may take a long time)",
+                entry.real_file,
+            )
+        trees.append((entry.real_file, real_file_entry.stat(follow_symlinks=False)))
+        owners.append((entry, cache_entry))
+
+    logging.log(
+        VERBOSE,
+        "Sizing %d entries, %d directories were found in the directorysizes cache",
+        len(entries),
+        cached,
+    )
+    for (entry, cache_entry), size in zip(owners, os_access.get_consumed_sizes(trees, jobs)):
+        entry.size += size
+        if cache_entry is not None:
+            directory_sizes.update(cache_entry[0], size, cache_entry[1])
+    return sum(entry.size for entry in entries)
+
+
+def first_match(patterns: Sequence[str]) -> Callable[[str], Optional[int]]:
+    """Return a function giving the index of the first of patterns that matches a name, or None
+
+    The patterns are combined into a single alternation where that gives the same result: the
+    alternatives are tried in order, so the first one that matches is the first matching pattern.
+    Patterns with groups or flags of their own are matched one by one.
+    """
+    compiled = [re.compile(pattern) for pattern in patterns]
+    default_flags = re.compile("").flags
+    if all(r.groups == 0 and r.flags == default_flags for r in compiled):
+        combined = re.compile("|".join("(%s)" % pattern for pattern in patterns))
+
+        def match_combined(name: str) -> Optional[int]:
+            match = combined.match(name)
+            return None if match is None or match.lastindex is None else match.lastindex - 1
+
+        return match_combined
+
+    def match_each(name: str) -> Optional[int]:
+        for index, r in enumerate(compiled):
+            if r.match(name) is not None:
+                return index
+        return None
+
+    return match_each
+
+
+def prioritize(entries: List[TrashEntry], patterns: Sequence[str]) -> List[TrashEntry]:
+    """Stable partition of entries: those matching the first pattern first, then the second etc."""
+    match = first_match(patterns)
+    groups: List[List[TrashEntry]] = [[] for _ in range(len(patterns) + 1)]
+    for entry in entries:
+        name = entry.name
+        index = match(name)
+        if index is None:
+            groups[-1].append(entry)
+            continue
+        logging.log(
+            VERBOSE,
+            "Pushing %s to top of queue because it matches %s",
+            name,
+            patterns[index],
+        )
+        groups[index].append(entry)
+    return [entry for group in groups for entry in group]
+
+
+def order_for_eviction(
+    files: List[TrashEntry], target: int, now: float, options
+) -> List[TrashEntry]:
+    """The sized files in the order to purge them to free target bytes by the --evict policy
+
+    Those matching --delete-first still go first, the policy picks from the others. Only the
+    entries picked are in order, the rest is only purged for its age.
+    """
+    from autotrash.evict import select_for_target
+
+    first: List[TrashEntry] = []
+    if options.delete_first:
+        match = first_match(options.delete_first)
+        first = prioritize([e for e in files if match(e.name) is not None], options.delete_first)
+        files = [e for e in files if match(e.name) is None]
+        target -= sum(entry.size or 0 for entry in first)
+    (selected, rest) = select_for_target(
+        files, target, options.evict, now, options.evict_min_age * 3600.0 * 24.0
+    )
+    logging.log(
+        VERBOSE,
+        "Evicting %s first, %d entries free %s",
+        options.evict,
+        len(selected),
+        fmt_bytes(sum(entry.size or 0 for entry in selected)),
+    )
+    return first + selected + rest
+
+
+def log_eviction_policies(files: List[TrashEntry], target: int, now: float, options) -> None:
+    """Log the entries and bytes every eviction policy would purge, for a dry run
+
+    --delete-first is left out, it puts the same entries first for every policy.
+    """
+    from autotrash.evict import EVICTION_POLICIES, select_for_target
+
+    for policy in EVICTION_POLICIES:
+        min_age = 0.0 if policy == "oldest" else options.evict_min_age * 3600.0 * 24.0
+        (selected, rest) = select_for_target(files, target, policy, now, min_age)
+        if options.days:
+            selected += [e for e in rest if age_in_days(now - e.deletion_time) > options.days]
+        logging.info(
+            "Evicting %s first would purge %d entries (%s)",
+            policy,
+            len(selected),
+            fmt_bytes(sum(entry.size or 0 for entry in selected)),
+        )
+
+
+def find_orphans(
+    trash_info_entries: List[os.DirEntry], real_file_entries: Dict[str, os.DirEntry]
+) -> Tuple[List[os.DirEntry], List[os.DirEntry]]:
+    """The real files without a .trashinfo file and the .trashinfo files without a real file
+
+    A .trashinfo file belongs to the real file named like it without the extension, byte for byte.
+    The Path in it is percent-encoded and may differ from that name, when the file manager had to
+    rename the file to fit in files/, so it is never used for matching. Both are sorted by name.
+    """
+    trash_info_by_name = {
+        entry.name[: -len(TRASHINFO_EXTENSION)]: entry for entry in trash_info_entries
+    }
+    return (
+        [real_file_entries[name] for name in sorted(real_file_entries.keys() - trash_info_by_name)],
+        [
+            trash_info_by_name[name]
+            for name in sorted(trash_info_by_name.keys() - real_file_entries)
+        ],
+    )
+
+
+def reconcile_orphans(
+    trash_info_entries,
+    real_file_entries,
+    options,
+    stats,
+    os_access,
+    directory_sizes,
+    now,
+    decisions=None,
+) -> Tuple[int, int]:
+    """Report the orphans of a trash directory, or purge them with --orphans purge
+
+    Purged .trashinfo files are taken out of trash_info_entries, purged real files out of
+    real_file_entries. Orphans changed in the last ORPHAN_GRACE_SECONDS are left alone. Returns
+    the bytes of the orphaned real files that are left and of those that were purged.
+    """
+    action = "keep" if options.orphans == "report" else "purge"
+    (orphan_files, orphan_infos) = find_orphans(trash_info_entries, real_file_entries)
+
+    def settled(entry) -> bool:
+        if now - entry.stat(follow_symlinks=False).st_ctime >= ORPHAN_GRACE_SECONDS:
+            return True
+        logging.log(VERBOSE, "Skipping %s, it changed too recently to be an orphan", entry.path)
+        return False
+
+    orphan_files = [entry for entry in orphan_files if settled(entry)]
+    orphan_infos = [entry for entry in orphan_infos if settled(entry)]
+    sizes = os_access.get_consumed_sizes(
+        [(entry.path, entry.stat(follow_symlinks=False)) for entry in orphan_files], options.jobs
+    )
+    stats.orphan_files += len(orphan_files)
+    stats.orphan_bytes += sum(sizes)
+    stats.bytes_sized += sum(sizes)
+
+    left = 0
+    purged = 0
+    for entry, size in zip(orphan_files, sizes):
+        if decisions is not None:
+            decisions.append(Decision(entry.name, None, entry.path, None, size, action, "orphan"))
+        if options.orphans == "report":
+            logging.warning("%s has no .trashinfo file, it uses %s", entry.path, fmt_bytes(size))
+            left += size
+            continue
+        removed = os_access.purge_orphan(entry.path, options.dryrun, entry)
+        if not removed and not options.dryrun:
+            # It could not be removed, so it is still in the trash
+            left += size
+            continue
+        purged += size
+        stats.deleted_size += size
+        stats.deleted_files += 1
+        if removed:
+            stats.bytes_freed += size
+            directory_sizes.remove(entry.name)
+            del real_file_entries[entry.name]
+    purged_infos = set()
+    for entry in orphan_infos:
+        if decisions is not None:
+            decisions.append(Decision(entry.name, entry.path, None, None, None, action, "orphan"))
+        if options.orphans == "report":
+            logging.warning("%s has no real file associated with it", entry.path)
+        elif os_access.purge_orphan(entry.path, options.dryrun, entry):
+            purged_infos.add(entry.name)
+    if purged_infos:
+        trash_info_entries[:] = [e for e in trash_info_entries if e.name not in purged_infos]
+    logging.log(
+        VERBOSE,
+        "Found %d real files without a .trashinfo file (%s) and %d .trashinfo files without a "
+        "real file",
+        len(orphan_files),
+        fmt_bytes(sum(sizes)),
+        len(orphan_infos),
+    )
+    return (left, purged)
+
+
+def age_in_days(age_seconds: float) -> int:
+    return int(math.floor(age_seconds / (3600.0 * 24.0)))
+
+
+def process_path(trash_info_path, options, stats, os_access, decisions=None) -> int:
+    """Process one trash information directory, adding its statistics to stats
+
+    The statistics of the directory itself are kept in stats.directories as well. Given a list as
+    decisions, a Decision is appended to it for every entry that is purged or kept.
+    """
+    directory_stats = StatsClass()
+    try:
+        return process_trash_directory(
+            trash_info_path, options, directory_stats, os_access, decisions
+        )
+    finally:
+        stats.merge(directory_stats)
+        stats.directories[trash_info_path] = directory_stats
+
+
+def process_trash_directory(trash_info_path, options, stats, os_access, decisions=None) -> int:
+    # With --recheck-free, the free space in megabytes to purge for, checking it while purging
+    free_target = 0
+    # The megabytes to purge: --delete, or what --min-free needs, leaving options as they are
+    delete_megabytes = options.delete
+    trash_directory = os.path.abspath(os.path.join(trash_info_path, ".."))
+
+    # Interrupted purges go first: they were decided on and counted already, and the space they
+    # free counts for --max-free and --min-free
+    start = time.perf_counter()
+    resumed = os_access.resume_purges(trash_directory, options.dryrun)
+    if resumed:
+        stats.purges_resumed += resumed
+        stats.add_time("resuming", time.perf_counter() - start)
     if options.max_free or options.min_free:  # Free space calculation is needed
         fs_stat = os_access.get_fs_stat(trash_info_path)
         if fs_stat.f_bsize <= 0:
@@ -251,7 +905,7 @@ def process_path(trash_info_path, options, stats, os_access) -> int:
                 "The --max-free option may not be supported for this filesystem." % fs_stat.f_bsize
             )
             return 1
-        free_megabytes = int((fs_stat.f_bavail * fs_stat.f_bsize) / (1024 * 1024))
+        free_megabytes = get_free_megabytes(fs_stat)
 
         if options.max_free:
             # Check if there is less then max_free megabytes of free space
@@ -265,125 +919,702 @@ def process_path(trash_info_path, options, stats, os_access) -> int:
                     trash_info_path,
                 )
                 return 0
-        if options.min_free and free_megabytes < options.min_free:
-            options.delete = options.min_free - free_megabytes
+        if options.min_free and free_megabytes < options.min_free and options.recheck_free:
+            if options.dryrun:
+                # Free space does not change in a dry run, so the sizes have to be used after all
+                logging.log(VERBOSE, "Not checking the free space while purging in a dry run")
+            else:
+                free_target = options.min_free
+                logging.log(
+                    VERBOSE,
+                    "Purging until at least %i MB is free, checking after every %i entries.\n"
+                    "\t Currently we have %i megabytes of free space.",
+                    options.min_free,
+                    options.recheck_free,
+                    free_megabytes,
+                )
+        if options.min_free and free_megabytes < options.min_free and not free_target:
+            delete_megabytes = options.min_free - free_megabytes
             logging.log(
                 VERBOSE,
                 "Setting --delete to %i to make sure at least %i MB becomes free.\n"
                 "\t Currently we have %i megabytes of free space.",
-                options.delete,
+                delete_megabytes,
                 options.min_free,
                 free_megabytes,
             )
 
     deleted_target = 0
-    if options.delete:
-        deleted_target = options.delete * 1024 * 1024
+    deleted_size = 0
+    if delete_megabytes:
+        deleted_target = delete_megabytes * 1024 * 1024
 
     trash_total_size = 0
+    directory_sizes = os_access.get_directory_sizes(trash_directory)
+    index = os_access.get_index(trash_directory) if options.index else None
+    try:
+        now = os_access.get_cur_time()
+        # Eviction policies other than oldest first pick from the sizes of all entries
+        size_all = (
+            options.stat or options.trash_limit or (options.evict != "oldest" and deleted_target)
+        )
+        # With --estimate, --stat sizes a sample of the entries and extrapolates from it
+        estimating = bool(options.stat and options.estimate)
+
+        # Without --stat, --trash_limit, --delete or --min-free only the age of an entry matters, so
+        # entries are purged while info/ is read instead of being collected and sorted first. The real
+        # file is only looked up for entries that are purged.
+        streaming = not (
+            size_all or deleted_target or free_target or options.delete_first or options.orphans
+        )
 
-    # Collect file info's
-    files = []
-    if True:  # Scope protection
-        trash_info_file_names = os_access.get_file_names(trash_info_path)
-        for file_name in trash_info_file_names:
-            real_file = real_file_name(file_name)
-            file_info = {"trash_info": file_name, "real_file": real_file}
-            if options.check and not os.path.exists(real_file):
-                logging.warning("%s has no real file associated with it", file_name)
-
-            file_time = os_access.get_trash_info_date(file_name)
-            if not file_time:
-                # This happens when a trashinfo file is corrupted (issue #9)
-                logging.warning(
-                    "Failed to read trash info for real file: %s",
-                    file_info["real_file"],
+        # With --mtime-window, such a run goes by the modification time of a .trashinfo file, which is
+        # when it was written, unless that is within the window of the --days cutoff
+        mtime_window = options.mtime_window * 3600 if streaming and options.days else 0
+        cutoff = now - (options.days + 1) * 3600.0 * 24.0
+
+        def save_caches(complete: bool) -> None:
+            """Save what was sized and read, dropping what was not seen only if everything was"""
+            if (size_all or deleted_target) and not options.dryrun:
+                # Entries that were not seen are only known to be stale if every directory was
+                # looked up
+                directory_sizes.save(prune=complete and size_all and not estimating)
+            if index is not None:
+                # Once every .trashinfo file has been looked up, entries that were not seen are gone
+                index.save(prune=complete)
+
+        def mtime_deletion_time(trash_info_entry) -> Optional[float]:
+            """The mtime of a .trashinfo file, if it decides the age as well as its DeletionDate"""
+            mtime = trash_info_entry.stat(follow_symlinks=False).st_mtime
+            if mtime < MIN_PLAUSIBLE_MTIME or mtime > now + mtime_window:
+                # Reset or set by a wrong clock, it says nothing about the DeletionDate
+                return None
+            if abs(mtime - cutoff) <= mtime_window:
+                return None
+            return mtime
+
+        def read_entry(trash_info_entry, real_file_entry) -> Optional[TrashEntry]:
+            """The TrashEntry of a .trashinfo file, None if it is corrupt"""
+            if options.check and real_file_entry is None:
+                logging.warning("%s has no real file associated with it", trash_info_entry.path)
+
+            indexed = None
+            if index is not None:
+                trash_info_mtime = trash_info_entry.stat(follow_symlinks=False).st_mtime_ns
+                indexed = index.lookup(trash_info_entry.name, trash_info_mtime)
+            entry = TrashEntry(trash_info_entry, real_file_entry)
+            estimated = None
+            if mtime_window and indexed is None:
+                estimated = mtime_deletion_time(trash_info_entry)
+            if estimated is not None:
+                entry.deletion_time = estimated
+            elif indexed is not None:
+                # Unchanged since the last run, no need to read it again
+                entry.deletion_time = indexed.time
+                if indexed.size is not None:
+                    entry.size = indexed.size
+                    if real_file_entry is not None and real_file_entry.is_dir(
+                        follow_symlinks=False
+                    ):
+                        directory_sizes.keep(real_file_entry.name)
+            else:
+                trash_info = os_access.get_trash_info(trash_info_entry.path)
+                stats.trash_infos_read += 1
+                if trash_info is None or not trash_info.deletion_date:
+                    # This happens when a trashinfo file is corrupted (issue #9)
+                    logging.warning("Failed to read trash info for real file: %s", entry.real_file)
+                    stats.failures += 1
+                    return None
+                entry.deletion_time = trash_info.deletion_date.timestamp()
+                if index is not None:
+                    index.update(
+                        trash_info_entry.name,
+                        trash_info_mtime,
+                        entry.deletion_time,
+                        trash_info.path,
+                    )
+
+            if logging.getLogger().isEnabledFor(VERBOSE):
+                age_seconds = now - entry.deletion_time
+                logging.log(VERBOSE, "File %s", entry.real_file)
+                logging.log(
+                    VERBOSE,
+                    "    is %d days old, %d seconds, so it should %sbe removed",
+                    age_in_days(age_seconds),
+                    age_seconds,
+                    ["not ", ""][int(age_in_days(age_seconds) > options.days)],
                 )
-                stats.failures += 1
-                return 0
-            file_info["time"] = file_time.timestamp()
-            file_info["age_seconds"] = os_access.get_cur_time() - file_info["time"]
-            file_info["age_days"] = int(math.floor(file_info["age_seconds"] / (3600.0 * 24.0)))
-
-            if options.stat or options.delete or options.trash_limit:
-                # calculating file size is relatively expensive; only do it if needed
-                file_size = os_access.get_consumed_size(file_name)
-                if os.path.exists(real_file):
-                    if os.path.isdir(real_file):
+                logging.log(
+                    VERBOSE,
+                    "    deletion date was %s%s",
+                    "about " if estimated is not None else "",
+                    datetime.datetime.fromtimestamp(entry.deletion_time).isoformat(),
+                )
+            return entry
+
+        corrupt = False
+        reading_seconds = 0.0
+
+        def stream_entries() -> Iterator[TrashEntry]:
+            nonlocal corrupt, reading_seconds
+            start = time.perf_counter()
+            for trash_info_entry in os_access.iter_info_directory(trash_info_path):
+                stats.entries_scanned += 1
+                real_file_entry = None
+                if options.check:
+                    real_file_entry = os_access.get_file_entry(
+                        real_file_name(trash_info_entry.path)
+                    )
+                entry = read_entry(trash_info_entry, real_file_entry)
+                if entry is None:
+                    corrupt = True
+                    break
+                if not options.check and age_in_days(now - entry.deletion_time) > options.days:
+                    entry.real_file_entry = os_access.get_file_entry(entry.real_file)
+                reading_seconds += time.perf_counter() - start
+                yield entry
+                start = time.perf_counter()
+            reading_seconds += time.perf_counter() - start
+
+        entries: Iterable[TrashEntry]
+        if streaming:
+            entries = stream_entries()
+        else:
+            # Collect the entries, every entry of info/ and files/ is stat'ed at most once
+            start = time.perf_counter()
+            real_file_entries = os_access.scan_files_directory(
+                os.path.join(trash_directory, "files")
+            )
+            trash_info_entries = os_access.scan_info_directory(trash_info_path)
+            stats.add_time("listing", time.perf_counter() - start)
+
+            # Orphaned real files use space like any other entry, so they count towards the size of
+            # the trash, and purging them counts towards --delete and --min-free
+            orphan_size = 0
+            if options.orphans:
+                start = time.perf_counter()
+                (orphan_size, deleted_size) = reconcile_orphans(
+                    trash_info_entries,
+                    real_file_entries,
+                    options,
+                    stats,
+                    os_access,
+                    directory_sizes,
+                    now,
+                    decisions,
+                )
+                stats.add_time("orphans", time.perf_counter() - start)
+            stats.entries_scanned += len(trash_info_entries)
+
+            start = time.perf_counter()
+            files = []
+            for trash_info_entry in trash_info_entries:
+                entry = read_entry(
+                    trash_info_entry,
+                    real_file_entries.get(trash_info_entry.name[: -len(TRASHINFO_EXTENSION)]),
+                )
+                if entry is None:
+                    stats.add_time("parsing", time.perf_counter() - start)
+                    save_caches(complete=False)
+                    return 0
+                files.append(entry)
+            # Only the entries are needed from here on, not the listings
+            del real_file_entries, trash_info_entries
+            stats.add_time("parsing", time.perf_counter() - start)
+
+            # Calculating file size is relatively expensive; only do it if needed. --stat and
+            # --trash_limit need the total size of the trash, which for directories that are not in the
+            # directorysizes cache yet can only be found by walking them. --delete and --min-free only
+            # need the sizes of the entries that get purged, these are sized in the purge loop below.
+            if estimating:
+                from autotrash.estimate import estimate_total
+
+                start = time.perf_counter()
+                sample = os_access.estimate_sizes(files, directory_sizes, options.estimate)
+                stats.add_time("sizing", time.perf_counter() - start)
+                logging.log(
+                    VERBOSE,
+                    "Estimating the size of the trash from %d of %d entries",
+                    len(sample),
+                    len(files),
+                )
+                # The sizes are estimated once it is known which entries are purged, see below
+                deleted_entries = set()
+            elif size_all:
+                start = time.perf_counter()
+                unsized = [entry for entry in files if entry.size is None]
+                stats.bytes_sized += size_entries(unsized, directory_sizes, os_access, options.jobs)
+                stats.add_time("sizing", time.perf_counter() - start)
+                # The orphans purged above are in deleted_size already, so they count in the total too
+                trash_total_size = (
+                    sum(entry.size or 0 for entry in files) + orphan_size + deleted_size
+                )
+            if size_all:
+                if options.stat:
+                    stats.total_size += stats.orphan_bytes
+                    stats.total_files += stats.orphan_files
+                if options.stat and not estimating:
+                    for entry in files:
                         logging.log(
                             VERBOSE,
-                            "Calculating size of directory %s (may take a long time)",
-                            real_file,
+                            "File %s consumes %s",
+                            entry.real_file,
+                            fmt_bytes(entry.size or 0),
                         )
-                    file_size += os_access.get_consumed_size(real_file)
-                file_info["size"] = file_size
-                trash_total_size += file_size
 
-            logging.log(VERBOSE, "File %s", real_file)
-            logging.log(
-                VERBOSE,
-                "    is %d days old, %d seconds, so it should %sbe removed",
-                file_info["age_days"],
-                file_info["age_seconds"],
-                ["not ", ""][int(file_info["age_days"] > options.days)],
+            if options.trash_limit:
+                trash_limit_bytes = options.trash_limit * 1024 * 1024
+                if deleted_target:
+                    logging.error("Cannot mix '--trash_limit' with '--delete'")
+                    return 1
+
+                logging.log(VERBOSE, "Total trash size is %s", fmt_bytes(trash_total_size))
+                logging.log(VERBOSE, "Trash size limit is %s", fmt_bytes(trash_limit_bytes))
+
+                if trash_limit_bytes < trash_total_size:
+                    deleted_target = trash_total_size - trash_limit_bytes
+                    logging.log(VERBOSE, "Trash exceeds limit by %s", fmt_bytes(deleted_target))
+
+            # Kill sorting: first will get purged first if --delete is enabled
+            start = time.perf_counter()
+            if options.dryrun and size_all and deleted_target > deleted_size:
+                log_eviction_policies(files, deleted_target - deleted_size, now, options)
+            if options.evict != "oldest" and deleted_target > deleted_size:
+                files = order_for_eviction(files, deleted_target - deleted_size, now, options)
+            else:
+                files.sort(key=operator.attrgetter("deletion_time"))
+
+                # Push priority files (delete_first) to the top of the queue
+                if options.delete_first:
+                    files = prioritize(files, options.delete_first)
+            stats.add_time("sorting", time.perf_counter() - start)
+            entries = files
+
+        # Exported metrics include the bytes freed, so then the purged entries are sized as well
+        size_purged = bool(options.metrics_json or options.metrics_textfile)
+
+        def forget(entry, removed):
+            if removed:
+                stats.bytes_freed += entry.size or 0
+                directory_sizes.remove(entry.name)
+                if index is not None:
+                    index.remove(entry.trash_info_entry.name)
+
+        # With --purge-workers the entries are removed on a pool of threads. Choosing what to purge and
+        # the accounting stay on this thread, so the same entries are purged as one by one.
+        executor = None
+        if options.purge_workers > 1 and not options.dryrun:
+            from concurrent.futures import ThreadPoolExecutor
+
+            executor = ThreadPoolExecutor(max_workers=options.purge_workers)
+            purge_entry = LOG_BUFFER.wrap(os_access.purge)
+        pending: Deque[Tuple[TrashEntry, "Future"]] = collections.deque()
+
+        def wait_for_purges(limit: int) -> None:
+            """Wait until no more than limit entries are queued for the purge workers"""
+            while len(pending) > limit:
+                (purged_entry, future) = pending.popleft()
+                forget(purged_entry, future.result())
+
+        short_of_space = bool(free_target)
+        purged_since_check = 0
+        start = time.perf_counter()
+        sizing_seconds = 0.0
+        try:
+            for position, entry in enumerate(entries):
+                if options.stat:
+                    if not estimating:
+                        stats.total_size += entry.size or 0
+                    stats.total_files += 1
+
+                if options.days and age_in_days(now - entry.deletion_time) > options.days:
+                    reason = "age"
+                elif deleted_size < deleted_target:
+                    reason = "size"
+                elif short_of_space:
+                    reason = "free space"
+                else:
+                    reason = None
+                if reason is not None:
+                    if (deleted_size < deleted_target or size_purged) and entry.size is None:
+                        # Size lazily in deletion order, a batch at a time so --jobs is still used
+                        sizing_start = time.perf_counter()
+                        batch = [entry] if streaming else files[position : position + options.jobs]
+                        unsized = [f for f in batch if f.size is None]
+                        stats.bytes_sized += size_entries(
+                            unsized, directory_sizes, os_access, options.jobs
+                        )
+                        sizing_seconds += time.perf_counter() - sizing_start
+                    purge_args = (
+                        options.trash_path,
+                        entry.trash_info,
+                        options.dryrun,
+                        entry.real_file_entry,
+                    )
+                    if executor is None:
+                        forget(entry, os_access.purge(*purge_args))
+                    else:
+                        pending.append((entry, executor.submit(purge_entry, *purge_args)))
+                        # Keep a few entries per thread queued, not all of them
+                        wait_for_purges(options.purge_workers * 4)
+                    if short_of_space:
+                        purged_since_check += 1
+                        if purged_since_check >= options.recheck_free:
+                            purged_since_check = 0
+                            # The file system only shows what was purged once it has been purged
+                            wait_for_purges(0)
+                            free_megabytes = get_free_megabytes(
+                                os_access.get_fs_stat(trash_info_path)
+                            )
+                            short_of_space = free_megabytes < free_target
+                            logging.log(VERBOSE, "%i MB of free space now", free_megabytes)
+                    if estimating:
+                        deleted_entries.add(entry)
+                        stats.deleted_files += 1
+                    elif deleted_target or options.stat or size_purged or free_target:
+                        # Entries purged for their age once the target is met are not sized
+                        file_size = entry.size or 0
+                        deleted_size += file_size
+                        stats.deleted_size += file_size
+                        stats.deleted_files += 1
+                    if decisions is not None:
+                        decisions.append(Decision.of(entry, "purge", reason))
+                else:
+                    if decisions is not None:
+                        decisions.append(Decision.of(entry, "keep"))
+                    if options.verbose:
+                        logging.log(VERBOSE, "Keeping %s", entry.real_file)
+
+            wait_for_purges(0)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            stats.add_time("sizing", sizing_seconds)
+            if streaming:
+                stats.add_time("parsing", reading_seconds)
+            stats.add_time(
+                "purging", time.perf_counter() - start - sizing_seconds - reading_seconds
             )
-            logging.log(VERBOSE, "    deletion date was %s", file_time.isoformat())
-            if options.stat:
-                logging.log(VERBOSE, "    consumes %s", fmt_bytes(file_info["size"]))
 
-            files.append(file_info)
+        if corrupt:
+            save_caches(complete=False)
+            return 0
 
-    if options.trash_limit:
-        trash_limit_bytes = options.trash_limit * 1024 * 1024
-        if deleted_target:
-            logging.error("Cannot mix '--trash_limit' with '--delete'")
-            return 1
+        if estimating:
+            # The purged and the remaining entries are estimated apart, as their numbers are known
+            deleted = estimate_total(len(deleted_entries), sample, deleted_entries)
+            remaining = estimate_total(
+                len(files) - len(deleted_entries), sample, sample.keys() - deleted_entries
+            )
+            stats.total_size += int(deleted.size) + int(remaining.size)
+            stats.total_size_variance += deleted.variance + remaining.variance
+            stats.deleted_size += int(deleted.size)
+            stats.deleted_size_variance += deleted.variance
+            stats.remaining_size_variance += remaining.variance
 
-        logging.log(VERBOSE, "Total trash size is %s", fmt_bytes(trash_total_size))
-        logging.log(VERBOSE, "Trash size limit is %s", fmt_bytes(trash_limit_bytes))
+        if index is not None and not streaming:
+            for entry in files:
+                if entry.size is not None:
+                    index.set_size(entry.trash_info_entry.name, entry.size)
+        save_caches(complete=True)
+        return 0
+    finally:
+        if index is not None:
+            index.close()
 
-        if trash_limit_bytes < trash_total_size:
-            deleted_target = trash_total_size - trash_limit_bytes
-            logging.log(VERBOSE, "Trash exceeds limit by %s", fmt_bytes(deleted_target))
 
-    # Kill sorting: first will get purged first if --delete is enabled
-    files.sort(key=lambda x: x["age_seconds"], reverse=True)
+class DirectoryLogBuffer(logging.Handler):
+    """Hold back the log records of worker threads, so the log of every directory stays together
 
-    # Push priority files (delete_first) to the top of the queue
-    for pattern in reversed(options.delete_first):
-        r = re.compile(pattern)
-        moved_count = 0
-        for i in range(len(files)):
-            if r.match(os.path.basename(files[i]["real_file"])) is not None:
-                file_info = files.pop(i)
-                logging.log(
-                    VERBOSE,
-                    "Pushing %s to top of queue because it matches %s",
-                    os.path.basename(file_info["real_file"]),
-                    pattern,
+    While a thread is buffering, its records are kept here and filtered out of all other handlers
+    of the root logger. They are replayed on the main thread once the directory is done.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.local = threading.local()
+
+    def buffering(self) -> bool:
+        return getattr(self.local, "records", None) is not None
+
+    def start(self) -> None:
+        self.local.records = []
+
+    def stop(self) -> List[logging.LogRecord]:
+        records = self.local.records
+        self.local.records = None
+        return records
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.buffering():
+            self.local.records.append(record)
+
+    def install(self) -> None:
+        root_logger = logging.getLogger()
+        for handler in root_logger.handlers:
+            handler.addFilter(self.not_buffering)
+        root_logger.addHandler(self)
+
+    def uninstall(self) -> None:
+        root_logger = logging.getLogger()
+        root_logger.removeHandler(self)
+        for handler in root_logger.handlers:
+            handler.removeFilter(self.not_buffering)
+
+    def not_buffering(self, record: logging.LogRecord) -> bool:
+        return not self.buffering()
+
+    def wrap(self, function: Callable) -> Callable:
+        """Make function, when called on another thread, log to the buffer of the calling thread"""
+        records = getattr(self.local, "records", None)
+
+        def run(*args):
+            self.local.records = records
+            try:
+                return function(*args)
+            finally:
+                self.local.records = None
+
+        return run
+
+
+LOG_BUFFER = DirectoryLogBuffer()
+
+
+def group_by_device(trash_info_paths: List[str]) -> List[List[str]]:
+    """Group trash information directories by the device (st_dev) they are on"""
+    groups: Dict[int, List[str]] = {}
+    for trash_info_path in trash_info_paths:
+        try:
+            device = os.stat(trash_info_path).st_dev
+        except OSError:
+            # Unknown device, give it a group of its own
+            device = -1 - len(groups)
+        groups.setdefault(device, []).append(trash_info_path)
+    return list(groups.values())
+
+
+def process_paths_concurrently(device_groups, options, stats, os_access, workers) -> int:
+    """Process groups of trash directories in parallel, the directories in a group one by one
+
+    Every directory gets its own StatsClass, which are merged into stats on the main thread. A
+    failing directory does not stop the other ones.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    log_buffer = LOG_BUFFER
+
+    def process_group(trash_info_paths):
+        results = []
+        for trash_info_path in trash_info_paths:
+            directory_stats = StatsClass()
+            log_buffer.start()
+            try:
+                result = process_path(trash_info_path, options, directory_stats, os_access)
+            except Exception:
+                logging.exception("Failed to process %s", trash_info_path)
+                directory_stats.failures += 1
+                result = 1
+            finally:
+                records = log_buffer.stop()
+            results.append((result, directory_stats, records))
+        return results
+
+    failed = 0
+    log_buffer.install()
+    try:
+        with ThreadPoolExecutor(max_workers=min(workers, len(device_groups))) as executor:
+            futures = [executor.submit(process_group, group) for group in device_groups]
+            for future in as_completed(futures):
+                for result, directory_stats, records in future.result():
+                    for record in records:
+                        logging.getLogger().handle(record)
+                    stats.merge(directory_stats)
+                    failed |= result
+    finally:
+        log_buffer.uninstall()
+    return failed
+
+
+def new_throttle(options, share: int = 1) -> Optional[Throttle]:
+    """The throttle of the rates of options, for one of share processes that together keep to them"""
+    if (
+        options.unlink_rate
+        or options.metadata_rate
+        or options.metrics_json
+        or options.metrics_textfile
+    ):
+        # Without any rate the throttle only counts the file system calls, for the metrics
+        return Throttle(options.unlink_rate / share, options.metadata_rate * 1024 / share)
+    return None
+
+
+def portable_record(record: logging.LogRecord) -> logging.LogRecord:
+    """Format the message and exception of record, so it can be sent to another process"""
+    record.msg = record.getMessage()
+    record.args = None
+    if record.exc_info:
+        record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+    return record
+
+
+def process_user(
+    user: User, options, share: int = 1
+) -> Tuple[int, StatsClass, List[logging.LogRecord]]:
+    """Process the trash directories of user, as that user, in a process of its own
+
+    Runs in a pool process that is used for this user only, as it can not get its privileges back.
+    The log records are returned, to be logged by the parent process with those of the other users.
+    The rates of options are shared with the other share - 1 users processed at the same time.
+    """
+    configure_logging(options)
+    LOG_BUFFER.install()
+    LOG_BUFFER.start()
+    stats = StatsClass()
+    failed = 0
+    try:
+        drop_privileges(user)
+        throttle = new_throttle(options, share)
+        os_access = new_os_access(throttle)
+        for trash_path in user.trash_paths:
+            trash_info_path = os.path.join(trash_path, "info")
+            if not os.path.isdir(trash_info_path):
+                logging.log(VERBOSE, "Skipping %s, it has no trash information", trash_path)
+                continue
+            try:
+                failed |= process_path(trash_info_path, options, stats, os_access)
+            except Exception:
+                logging.exception("Failed to process %s", trash_info_path)
+                stats.failures += 1
+                failed = 1
+        if throttle is not None:
+            stats.syscalls = throttle.calls
+    except OSError as e:
+        logging.error("Can not switch to user %s: %s", user.name, e)
+        failed = 1
+    finally:
+        records = [portable_record(record) for record in LOG_BUFFER.stop()]
+        LOG_BUFFER.uninstall()
+    return (failed, stats, records)
+
+
+def process_users(users: List[User], options, stats: StatsClass, workers: int) -> int:
+    """Process the trash directories of users, up to workers users at the same time
+
+    Every user gets a process of its own that drops to the privileges of that user. Their logs are
+    replayed one user after the other and their statistics are merged into stats. A failing user
+    does not stop the other ones. The --unlink-rate and --metadata-rate are for all of them
+    together, every process gets an equal part.
+    """
+    import multiprocessing
+
+    failed = 0
+    if not users:
+        return failed
+    processes = min(workers, len(users))
+    with multiprocessing.Pool(processes=processes, maxtasksperchild=1) as pool:
+        results = pool.imap(
+            functools.partial(process_user, options=options, share=processes), users
+        )
+        for user, (result, user_stats, records) in zip(users, results):
+            for record in records:
+                logging.getLogger().handle(record)
+            if options.stat:
+                logging.info(
+                    "User %s: %d of %d entries deleted (%s)",
+                    user.name,
+                    user_stats.deleted_files,
+                    user_stats.total_files,
+                    fmt_bytes(user_stats.deleted_size),
                 )
-                files.insert(moved_count, file_info)
-                moved_count += 1
+            stats.merge(user_stats)
+            failed |= result
+    return failed
 
-    for file_info in files:
-        if options.stat:
-            stats.total_size += file_info["size"]
-            stats.total_files += 1
-
-        if (
-            options.days and file_info["age_days"] > options.days
-        ) or stats.deleted_size < deleted_target:
-            os_access.purge(options.trash_path, file_info["trash_info"], options.dryrun)
-            if deleted_target or options.stat:
-                stats.deleted_size += file_info["size"]
-                stats.deleted_files += 1
-        elif options.verbose:
-            logging.log(VERBOSE, "Keeping %s", real_file_name(file_info["trash_info"]))
 
+def watch_paths(trash_info_paths, options, os_access, throttle=None) -> int:
+    """Keep running, processing a trash directory whenever the Watcher finds it needs purging
+
+    The metrics files are rewritten after every run, with the statistics of that run.
+    """
+    from autotrash.metrics import write_metrics
+    from autotrash.watch import Watcher, open_inotify
+
+    def process(trash_info_path):
+        stats = StatsClass()
+        started = time.time()
+        start = time.perf_counter()
+        calls = 0 if throttle is None else throttle.calls
+        try:
+            process_path(trash_info_path, options, stats, os_access)
+        except Exception:
+            logging.exception("Failed to process %s", trash_info_path)
+        if throttle is not None:
+            stats.syscalls = throttle.calls - calls
+        if options.stat:
+            log_stats(stats)
+        try:
+            write_metrics(options, stats, started, time.perf_counter() - start)
+        except OSError as e:
+            logging.error("Failed to write metrics: %s", e)
+
+    watcher = Watcher(
+        trash_info_paths,
+        options,
+        process,
+        open_inotify(),
+        os_access.get_fs_stat,
+        os_access.get_cur_time,
+    )
+    watcher.run()
     return 0
 
 
+def fmt_estimate(num_bytes: int, variance: float) -> str:
+    """fmt_bytes, followed by the margin of its 95% confidence interval if it is an estimate"""
+    if not variance:
+        return fmt_bytes(num_bytes)
+    from autotrash.estimate import Estimate
+
+    margin = Estimate(num_bytes, variance).margin
+    return "%s ± %s" % (fmt_bytes(num_bytes), fmt_bytes(int(margin)))
+
+
+def log_stats(stats: StatsClass) -> None:
+    logging.info("Trash statistics:")
+    logging.info(
+        "  %6d entries at start (%s)",
+        stats.total_files,
+        fmt_estimate(stats.total_size, stats.total_size_variance),
+    )
+    if stats.purges_resumed:
+        logging.info("  %6d interrupted purges finished", stats.purges_resumed)
+    if stats.orphan_files:
+        logging.info(
+            "  %6d of them without a .trashinfo file (%s)",
+            stats.orphan_files,
+            fmt_bytes(stats.orphan_bytes),
+        )
+    logging.info(
+        " -%6d deleted (%s)",
+        stats.deleted_files,
+        fmt_estimate(stats.deleted_size, stats.deleted_size_variance),
+    )
+    logging.info(
+        " =%6d remaining (%s)",
+        (stats.total_files - stats.deleted_files),
+        fmt_estimate(stats.total_size - stats.deleted_size, stats.remaining_size_variance),
+    )
+    for phase in PHASES:
+        if phase in stats.phases:
+            logging.log(VERBOSE, "  %-9s %8.3f s", phase, stats.phases[phase])
+
+
 def install_service(options, args):
+    import shutil
+    import subprocess
+
     if shutil.which("systemctl") is None:
         logging.error("system must support systemd to use --install")
         return 1
@@ -418,27 +1649,84 @@ Documentation=https://github.com/bneijt/autotrash
 [Service]
 Type=oneshot
 ExecStart="{}" {}
+""".format(executable_path, args)
+
+    # With --watch autotrash keeps running itself, so it is started at login instead of daily
+    watch_service_file = """\
+[Unit]
+Description=Empty trash
+Documentation=https://github.com/bneijt/autotrash
+
+[Service]
+Type=simple
+ExecStart="{}" {}
+Restart=on-failure
+RestartSec=60
+
+[Install]
+WantedBy=default.target
 """.format(executable_path, args)
 
     config_dir = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
     systemd_dir = f"{config_dir}/systemd/user"
     os.makedirs(systemd_dir, exist_ok=True)
+    timer_path = os.path.join(systemd_dir, "autotrash.timer")
 
-    with open(os.path.join(systemd_dir, "autotrash.timer"), "w") as f:
-        f.write(timer_file)
+    # Switching between the daily run and --watch, so stop whatever was installed before
+    if os.path.exists(os.path.join(systemd_dir, "autotrash.service")):
+        subprocess.call(["systemctl", "--user", "disable", "--now", "autotrash.service"])
+    if os.path.exists(timer_path):
+        subprocess.call(["systemctl", "--user", "disable", "--now", "autotrash.timer"])
+
+    if options.watch:
+        if os.path.exists(timer_path):
+            os.unlink(timer_path)
+    else:
+        with open(timer_path, "w") as f:
+            f.write(timer_file)
 
     with open(os.path.join(systemd_dir, "autotrash.service"), "w") as f:
-        f.write(service_file)
+        f.write(watch_service_file if options.watch else service_file)
 
     logging.info('service installed to "{}"'.format(systemd_dir))
-    subprocess.check_output(["systemctl", "--user", "enable", "autotrash.timer"])
-    logging.info("checking that the service is working...")
-    subprocess.check_output(["systemctl", "--user", "start", "autotrash"])
+    subprocess.check_output(["systemctl", "--user", "daemon-reload"])
+    if options.watch:
+        subprocess.check_output(["systemctl", "--user", "enable", "--now", "autotrash.service"])
+        logging.info("checking that the service is working...")
+        subprocess.check_output(["systemctl", "--user", "is-active", "autotrash.service"])
+    else:
+        subprocess.check_output(["systemctl", "--user", "enable", "autotrash.timer"])
+        logging.info("checking that the service is working...")
+        subprocess.check_output(["systemctl", "--user", "start", "autotrash"])
     logging.info("service is working")
 
     return 0
 
 
+def enough_free_space(trash_paths: List[str], max_free: int) -> bool:
+    """Whether every trash directory has more than max_free megabytes of free space
+
+    This is the --max-free check of process_trash_directory, done before anything is set up for
+    scanning the trash directories, so a run that has nothing to do is over as soon as possible.
+    """
+    for trash_path in trash_paths:
+        trash_info_path = os.path.expanduser(os.path.join(trash_path, "info"))
+        try:
+            fs_stat = get_fs_stat(trash_info_path)
+        except OSError:
+            # Missing directories are reported while processing them
+            return False
+        if fs_stat.f_bsize <= 0 or get_free_megabytes(fs_stat) <= max_free:
+            return False
+    for trash_path in trash_paths:
+        logging.log(
+            VERBOSE,
+            'Enough free space at "%s", more then --max-free, doing nothing.',
+            trash_path,
+        )
+    return True
+
+
 def cli():
     # Load and set configuration options
     parser = new_parser()
@@ -447,6 +1735,8 @@ def cli():
     configure_logging(options)
 
     if options.version:
+        from autotrash import __version__
+
         logging.info(
             "Version %s\n" "Copyright (C) 2019 Bram Neijt <bram@neijt.nl>\n" "License GPLv3+",
             __version__,
@@ -458,42 +1748,93 @@ def cli():
     if options.install:
         return install_service(options, args)
 
-    # Compile list of possible trash directories
-    trash_paths = find_trash_directories(options.trash_path, options.trash_mounts)
-
     # Set variables for stats collecting
     stats = StatsClass()
+    started = time.time()
+    start = time.perf_counter()
 
-    os_access = OsAccess()
-    os_access.get_file_names = get_file_names
-    os_access.get_cur_time = get_cur_time
-    os_access.get_fs_stat = get_fs_stat
-    os_access.get_consumed_size = get_consumed_size
-    os_access.get_trash_info_date = get_trash_info_date
-    os_access.purge = purge
-
-    for trash_path in trash_paths:
-        trash_info_path = os.path.expanduser(os.path.join(trash_path, "info"))
-        if not os.path.exists(trash_info_path):
-            logging.error("Can not find trash information directory: %s", trash_info_path)
+    if options.all_users:
+        if os.geteuid() != 0:
+            logging.error("Only root can process the trash of all users")
             return 1
+        users = find_users(writable_mounts(read_mountinfo()), options.mount_timeout)
+        for user in users:
+            for trash_path in user.trash_paths:
+                logging.log(VERBOSE, "Found trash directory of %s: %s", user.name, trash_path)
+        stats.add_time("discovery", time.perf_counter() - start)
+        lower_priority(options.nice, options.ionice)
+        failed = process_users(users, options, stats, options.user_workers)
+        return report(options, stats, started, start, failed)
+
+    # Compile list of possible trash directories
+    trash_paths = find_trash_directories(
+        options.trash_path, options.trash_mounts, options.mount_timeout
+    )
+    stats.add_time("discovery", time.perf_counter() - start)
+
+    if options.max_free and not options.watch and enough_free_space(trash_paths, options.max_free):
+        return report(options, stats, started, start, 0)
+
+    lower_priority(options.nice, options.ionice)
+    throttle = new_throttle(options)
+    os_access = new_os_access(throttle)
+
+    if options.watch:
+        trash_info_paths = []
+        for trash_path in trash_paths:
+            trash_info_path = os.path.expanduser(os.path.join(trash_path, "info"))
+            if not os.path.exists(trash_info_path):
+                logging.error("Can not find trash information directory: %s", trash_info_path)
+                return 1
+            trash_info_paths.append(trash_info_path)
+        return watch_paths(trash_info_paths, options, os_access, throttle)
+
+    if options.mount_workers > 1 and len(trash_paths) > 1:
+        trash_info_paths = []
+        failed = 0
+        for trash_path in trash_paths:
+            trash_info_path = os.path.expanduser(os.path.join(trash_path, "info"))
+            if os.path.exists(trash_info_path):
+                trash_info_paths.append(trash_info_path)
+            else:
+                logging.error("Can not find trash information directory: %s", trash_info_path)
+                failed = 1
+        failed |= process_paths_concurrently(
+            group_by_device(trash_info_paths), options, stats, os_access, options.mount_workers
+        )
+    else:
+        failed = 0
+        for trash_path in trash_paths:
+            trash_info_path = os.path.expanduser(os.path.join(trash_path, "info"))
+            if not os.path.exists(trash_info_path):
+                logging.error("Can not find trash information directory: %s", trash_info_path)
+                failed = 1
+                break
+
+            if process_path(trash_info_path, options, stats, os_access):
+                failed = 1
+                break
+
+    if throttle is not None:
+        stats.syscalls += throttle.calls
+    return report(options, stats, started, start, failed)
 
-        if process_path(trash_info_path, options, stats, os_access):
-            return 1
+
+def report(options, stats: StatsClass, started: float, start: float, failed: int) -> int:
+    """Write the metrics and log the statistics of a run, giving the exit code of autotrash"""
+    if options.metrics_json or options.metrics_textfile:
+        from autotrash.metrics import write_metrics
+
+        try:
+            write_metrics(options, stats, started, time.perf_counter() - start)
+        except OSError as e:
+            logging.error("Failed to write metrics: %s", e)
+            failed = 1
+    if failed:
+        return 1
 
     if options.stat:
-        logging.info("Trash statistics:")
-        logging.info(
-            "  %6d entries at start (%s)",
-            stats.total_files,
-            fmt_bytes(stats.total_size),
-        )
-        logging.info(" -%6d deleted (%s)", stats.deleted_files, fmt_bytes(stats.deleted_size))
-        logging.info(
-            " =%6d remaining (%s)",
-            (stats.total_files - stats.deleted_files),
-            fmt_bytes(stats.total_size - stats.deleted_size),
-        )
+        log_stats(stats)
     return 0 if stats.failures == 0 else 1
 
 
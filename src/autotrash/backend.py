@@ -0,0 +1,50 @@
+import os
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Protocol, Sequence, Tuple
+
+from autotrash.trashinfo import TrashInfo
+
+if TYPE_CHECKING:
+    from autotrash.app import StatEntry, TrashEntry
+    from autotrash.directorysizes import DirectorySizes
+    from autotrash.estimate import Estimate
+    from autotrash.index import TrashIndex
+
+
+class Backend(Protocol):
+    """Everything processing a trash directory does to the file system, so it can be replaced
+
+    autotrash.app.new_os_access gives the backend of the real file system. The methods are those
+    of the module level functions in autotrash.app without their throttle argument.
+    """
+
+    def scan_info_directory(self, trash_info_path: str) -> List[os.DirEntry]: ...
+
+    def scan_files_directory(self, trash_files_path: str) -> Dict[str, os.DirEntry]: ...
+
+    def iter_info_directory(self, trash_info_path: str) -> Iterator[os.DirEntry]: ...
+
+    def get_file_entry(self, path: str) -> Optional["StatEntry"]: ...
+
+    def get_cur_time(self) -> float: ...
+
+    def get_fs_stat(self, trash_info_path: str) -> os.statvfs_result: ...
+
+    def get_consumed_sizes(
+        self, trees: Sequence[Tuple[str, Optional[os.stat_result]]], jobs: int = 1
+    ) -> List[int]: ...
+
+    def get_trash_info(self, fname: str) -> Optional[TrashInfo]: ...
+
+    def get_directory_sizes(self, trash_directory: str) -> "DirectorySizes": ...
+
+    def get_index(self, trash_directory: str) -> Optional["TrashIndex"]: ...
+
+    def purge(self, trash_directory, trash_name: str, dryrun: bool, target_entry) -> bool: ...
+
+    def purge_orphan(self, path: str, dryrun: bool, target_entry) -> bool: ...
+
+    def resume_purges(self, trash_directory: str, dryrun: bool) -> int: ...
+
+    def estimate_sizes(
+        self, entries: List["TrashEntry"], directory_sizes: "DirectorySizes", seconds: float
+    ) -> Dict["TrashEntry", "Estimate"]: ...
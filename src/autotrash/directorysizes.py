@@ -0,0 +1,99 @@
+import contextlib
+import logging
+import os
+import tempfile
+from typing import Dict, Optional, Set, Tuple
+from urllib.parse import quote_from_bytes, unquote_to_bytes
+
+FILE_NAME = "directorysizes"
+
+
+def encode_name(name: str) -> str:
+    """Percent-encode a directory name the same way the Path key of a .trashinfo file is encoded"""
+    return quote_from_bytes(os.fsencode(name), safe="")
+
+
+def decode_name(encoded: str) -> str:
+    return os.fsdecode(unquote_to_bytes(encoded))
+
+
+class DirectorySizes:
+    """The $trash/directorysizes cache described in version 1.0 of the FreeDesktop.org Trash spec.
+
+    Every line holds the consumed size in bytes of a directory in $trash/files, the mtime of its
+    .trashinfo file in seconds since the epoch and the percent-encoded name of the directory.
+    An entry is only valid as long as the mtime matches the current .trashinfo file.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.entries: Dict[str, Tuple[int, int]] = {}
+        self.seen: Set[str] = set()
+        self.changed = False
+
+    @classmethod
+    def load(cls, trash_directory: str) -> "DirectorySizes":
+        path = os.path.join(trash_directory, FILE_NAME)
+        directory_sizes = cls(path)
+        try:
+            with open(path, "r", encoding="ascii", errors="replace") as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) != 3:
+                        continue
+                    try:
+                        size, mtime = int(fields[0]), int(fields[1])
+                    except ValueError:
+                        continue
+                    directory_sizes.entries[decode_name(fields[2])] = (size, mtime)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning("Failed to read %s: %s", path, e)
+        return directory_sizes
+
+    def lookup(self, name: str, mtime: int) -> Optional[int]:
+        """Return the cached size of directory name, or None when it is unknown or outdated"""
+        self.seen.add(name)
+        cached = self.entries.get(name)
+        if cached is not None and cached[1] == mtime:
+            return cached[0]
+        return None
+
+    def keep(self, name: str) -> None:
+        """Mark the entry of directory name as still in use without looking it up"""
+        self.seen.add(name)
+
+    def update(self, name: str, size: int, mtime: int) -> None:
+        self.seen.add(name)
+        if self.entries.get(name) != (size, mtime):
+            self.entries[name] = (size, mtime)
+            self.changed = True
+
+    def remove(self, name: str) -> None:
+        if self.entries.pop(name, None) is not None:
+            self.changed = True
+
+    def save(self, prune: bool = True) -> None:
+        """Atomically rewrite the cache file, optionally dropping entries that were not seen"""
+        if prune:
+            for name in set(self.entries) - self.seen:
+                self.remove(name)
+        if self.path is None or not self.changed:
+            return
+        trash_directory = os.path.dirname(self.path)
+        try:
+            (handle, temp_path) = tempfile.mkstemp(prefix=FILE_NAME + ".", dir=trash_directory)
+        except OSError as e:
+            logging.warning("Failed to update %s: %s", self.path, e)
+            return
+        try:
+            with os.fdopen(handle, "w", encoding="ascii") as f:
+                for name, (size, mtime) in self.entries.items():
+                    f.write("%d %d %s\n" % (size, mtime, encode_name(name)))
+            os.replace(temp_path, self.path)
+            self.changed = False
+        except OSError as e:
+            logging.warning("Failed to update %s: %s", self.path, e)
+            with contextlib.suppress(OSError):
+                os.unlink(temp_path)
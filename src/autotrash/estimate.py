@@ -0,0 +1,195 @@
+import logging
+import math
+import os
+import random
+import stat
+import time
+from typing import (
+    TYPE_CHECKING,
+    AbstractSet,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from autotrash.throttle import Throttle
+from autotrash.usage import entry_usage, get_tree_usage
+
+if TYPE_CHECKING:
+    from autotrash.app import TrashEntry
+
+# Directories with more children than this only have this many of them sized, picked at random
+SUBTREE_SAMPLE = 32
+# ... and only two once the budget is spent, so an entry that is being sized still finishes soon
+MIN_SUBTREE_SAMPLE = 2
+# Entries sized for an estimate even when the budget is spent before
+MIN_SAMPLE = 30
+# Below this depth subtrees are sized exactly, instead of recursing further
+MAX_DEPTH = 100
+# Normal quantile of the 95% confidence intervals
+CONFIDENCE_Z = 1.96
+
+K = TypeVar("K")
+
+
+class Estimate(NamedTuple):
+    size: float
+    variance: float
+    # Whether everything was sized, otherwise a variance of zero only means the sample was uniform
+    exact: bool = True
+
+    @property
+    def margin(self) -> float:
+        """Half the width of the 95% confidence interval of size"""
+        return CONFIDENCE_Z * math.sqrt(self.variance)
+
+
+class Budget:
+    """Time and file system calls that may be spent on sizing for an estimate"""
+
+    def __init__(
+        self,
+        seconds: float,
+        calls: Optional[int] = None,
+        throttle: Optional[Throttle] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.clock = clock
+        self.deadline = clock() + seconds
+        self.max_calls = calls
+        self.calls = 0
+        self.throttle = throttle
+
+    def spend(self, calls: int) -> None:
+        self.calls += calls
+        if self.throttle is not None:
+            self.throttle.count(calls)
+
+    def exhausted(self) -> bool:
+        if self.max_calls is not None and self.calls >= self.max_calls:
+            return True
+        return self.clock() >= self.deadline
+
+
+def estimate_tree(
+    path: str, st: os.stat_result, rng: random.Random, budget: Budget, depth: int = 0
+) -> Estimate:
+    """Estimate the consumed size of a file or directory tree, without following links
+
+    Every directory is listed, but of those with more than SUBTREE_SAMPLE children only a random
+    sample is sized, which is scaled up to all children. The variance follows that of two-stage
+    sampling: the spread between the sampled children plus their own variances.
+    """
+    size = entry_usage(st)
+    if not stat.S_ISDIR(st.st_mode):
+        return Estimate(size, 0.0)
+    if depth >= MAX_DEPTH:
+        return Estimate(get_tree_usage(path, st).size, 0.0)
+    try:
+        with os.scandir(path) as listing:
+            children = list(listing)
+    except OSError:
+        logging.error("Error getting size for %s", path)
+        return Estimate(size, 0.0)
+    budget.spend(1)
+    sample_size = MIN_SUBTREE_SAMPLE if budget.exhausted() else SUBTREE_SAMPLE
+    sampled = children if len(children) <= sample_size else rng.sample(children, sample_size)
+
+    estimates = []
+    for child in sampled:
+        try:
+            child_st = child.stat(follow_symlinks=False)
+        except OSError:
+            logging.error("Error getting size for %s", child.path)
+            continue
+        budget.spend(1)
+        estimates.append(estimate_tree(child.path, child_st, rng, budget, depth + 1))
+    if len(sampled) == len(children):
+        return Estimate(
+            size + sum(e.size for e in estimates),
+            sum(e.variance for e in estimates),
+            all(e.exact for e in estimates),
+        )
+    (total, variance) = scale_sample(len(children), [(e.size, e.variance) for e in estimates], size)
+    return Estimate(total, variance, False)
+
+
+def scale_sample(
+    population: int, sample: List[Tuple[float, float]], base: float = 0.0
+) -> Tuple[float, float]:
+    """The total of population values plus base, from a simple random sample of them
+
+    sample holds (estimate, variance) pairs. Returns the estimated total and its variance.
+    """
+    n = len(sample)
+    if n == 0 or population == 0:
+        return (base, 0.0)
+    mean = sum(size for (size, _) in sample) / n
+    spread = sum((size - mean) ** 2 for (size, _) in sample) / (n - 1) if n > 1 else 0.0
+    # A sample standing in for a smaller population than itself has no correction left to give
+    variance = population * population * max(1 - n / population, 0.0) * spread / n
+    variance += population / n * sum(v for (_, v) in sample)
+    return (base + population * mean, variance)
+
+
+def estimate_total(
+    population: int, sample: Mapping[K, Estimate], domain: Optional[AbstractSet[K]] = None
+) -> Estimate:
+    """The total size of population entries from the estimates of a random sample of them
+
+    With a domain, population is the number of entries in the domain and only the sampled entries
+    in it are used, which are a random sample of the domain as well. Should none of them be in the
+    domain, the whole sample stands in for it. An empty population has an exact total of zero.
+    """
+    if population == 0:
+        return Estimate(0.0, 0.0, True)
+    estimates = [e for (key, e) in sample.items() if domain is None or key in domain]
+    if not estimates:
+        estimates = list(sample.values())
+    (total, variance) = scale_sample(population, [(e.size, e.variance) for e in estimates])
+    exact = len(estimates) == population and all(e.exact for e in estimates)
+    return Estimate(total, variance, exact)
+
+
+def estimate_sizes(
+    entries, directory_sizes, seconds: float, rng: random.Random, throttle=None
+) -> Dict["TrashEntry", Estimate]:
+    """Size a random sample of the TrashEntry entries within seconds, giving their estimates
+
+    Entries are sized in random order until the time is up, at least MIN_SAMPLE of them, so the
+    sized ones are a simple random sample. Directories found in the directorysizes cache are exact,
+    others are estimated by estimate_tree. Exactly sized entries get their size set.
+    """
+    budget = Budget(seconds, throttle=throttle)
+    order = list(range(len(entries)))
+    rng.shuffle(order)
+    sample: Dict["TrashEntry", Estimate] = {}
+    for position in order:
+        if len(sample) >= MIN_SAMPLE and budget.exhausted():
+            break
+        entry = entries[position]
+        trash_info_stat = entry.trash_info_entry.stat(follow_symlinks=False)
+        budget.spend(1)
+        estimate = Estimate(entry_usage(trash_info_stat), 0.0)
+        real_file_entry = entry.real_file_entry
+        if real_file_entry is not None:
+            cached = None
+            if real_file_entry.is_dir(follow_symlinks=False):
+                cached = directory_sizes.lookup(real_file_entry.name, int(trash_info_stat.st_mtime))
+            if cached is not None:
+                estimate = Estimate(estimate.size + cached, 0.0)
+            else:
+                budget.spend(1)
+                tree = estimate_tree(
+                    entry.real_file, real_file_entry.stat(follow_symlinks=False), rng, budget
+                )
+                estimate = Estimate(estimate.size + tree.size, tree.variance, tree.exact)
+        if estimate.exact:
+            entry.size = int(estimate.size)
+        sample[entry] = estimate
+    return sample
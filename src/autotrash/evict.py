@@ -0,0 +1,55 @@
+import heapq
+from typing import TYPE_CHECKING, Callable, Dict, List, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from autotrash.app import TrashEntry
+
+EVICTION_POLICIES = ["oldest", "largest", "weighted"]
+
+
+def eviction_keys(now: float) -> Dict[str, Callable[["TrashEntry"], float]]:
+    """Per eviction policy, the key of an entry: the higher, the sooner it is purged"""
+    return {
+        "oldest": lambda entry: -entry.deletion_time,
+        "largest": lambda entry: entry.size or 0,
+        # Bytes times seconds in the trash, so a large entry goes before a somewhat older small one
+        "weighted": lambda entry: max(now - entry.deletion_time, 0.0) * (entry.size or 0),
+    }
+
+
+def select_for_target(
+    entries: Sequence["TrashEntry"],
+    target: int,
+    policy: str,
+    now: float,
+    min_age: float = 0.0,
+) -> Tuple[List["TrashEntry"], List["TrashEntry"]]:
+    """The sized entries to purge to free target bytes by policy, in that order, and the others
+
+    Only entries in the trash for at least min_age seconds are picked by policy, should they not
+    reach the target the younger ones follow oldest first. Instead of sorting all entries they are
+    heapified, which is linear, and only the selected ones are popped. The others are in the order
+    of entries.
+    """
+    key = eviction_keys(now)[policy]
+    floor = now - min_age
+    heap = []
+    younger = []
+    for position, entry in enumerate(entries):
+        if entry.deletion_time <= floor:
+            heap.append((-key(entry), position))
+        else:
+            younger.append((entry.deletion_time, position))
+    selected: List[int] = []
+    total = 0
+    for candidates in (heap, younger):
+        heapq.heapify(candidates)
+        while candidates and total < target:
+            (_, position) = heapq.heappop(candidates)
+            selected.append(position)
+            total += entries[position].size or 0
+    chosen = set(selected)
+    return (
+        [entries[position] for position in selected],
+        [entry for position, entry in enumerate(entries) if position not in chosen],
+    )
@@ -0,0 +1,182 @@
+import contextlib
+import hashlib
+import logging
+import os
+import sqlite3
+from typing import Dict, NamedTuple, Optional, Set
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE entries (
+    name BLOB PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    time REAL NOT NULL,
+    original_path BLOB,
+    size INTEGER
+);
+"""
+
+
+class IndexEntry(NamedTuple):
+    mtime_ns: int
+    time: float
+    original_path: Optional[str]
+    size: Optional[int]
+
+
+def cache_directory() -> str:
+    return os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "autotrash"
+    )
+
+
+def index_path(trash_directory: str, directory: Optional[str] = None) -> str:
+    digest = hashlib.sha1(os.fsencode(os.path.abspath(trash_directory))).hexdigest()
+    return os.path.join(directory or cache_directory(), "index-%s.sqlite3" % digest[:16])
+
+
+def encode(value: Optional[str]) -> Optional[bytes]:
+    return None if value is None else os.fsencode(value)
+
+
+def decode(value: Optional[bytes]) -> Optional[str]:
+    return None if value is None else os.fsdecode(value)
+
+
+class TrashIndex:
+    """Deletion time, original path and consumed size of every entry of one trash directory
+
+    Entries are keyed by .trashinfo file name and only valid while the mtime of that file is
+    unchanged. The index lives in an SQLite database in the XDG cache directory; it is thrown
+    away and rebuilt when it is corrupt or belongs to another trash directory.
+    """
+
+    def __init__(self, path: str, connection: sqlite3.Connection, entries: Dict[str, IndexEntry]):
+        self.path = path
+        self.connection = connection
+        self.entries = entries
+        self.seen: Set[str] = set()
+        self.changed: Set[str] = set()
+        self.removed: Set[str] = set()
+
+    @classmethod
+    def open(cls, trash_directory: str, directory: Optional[str] = None) -> Optional["TrashIndex"]:
+        path = index_path(trash_directory, directory)
+        try:
+            info_stat = os.stat(os.path.join(trash_directory, "info"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        except OSError as e:
+            logging.warning("Not using an index for %s: %s", trash_directory, e)
+            return None
+        identity = {
+            "schema_version": str(SCHEMA_VERSION),
+            "trash_directory": os.fsencode(os.path.abspath(trash_directory)).hex(),
+            "info_directory": "%d:%d" % (info_stat.st_dev, info_stat.st_ino),
+        }
+
+        for attempt in range(2):
+            connection = None
+            try:
+                connection = sqlite3.connect(path)
+                return cls(path, connection, cls.load(path, connection, identity))
+            except sqlite3.DatabaseError as e:
+                if connection is not None:
+                    connection.close()
+                if attempt:
+                    logging.warning("Not using an index for %s: %s", trash_directory, e)
+                    break
+                logging.warning("Rebuilding corrupt index %s: %s", path, e)
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+        return None
+
+    @staticmethod
+    def load(
+        path: str, connection: sqlite3.Connection, identity: Dict[str, str]
+    ) -> Dict[str, IndexEntry]:
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master")}
+        if tables and dict(connection.execute("SELECT key, value FROM metadata")) == identity:
+            return {
+                os.fsdecode(name): IndexEntry(mtime_ns, time, decode(original_path), size)
+                for (name, mtime_ns, time, original_path, size) in connection.execute(
+                    "SELECT name, mtime_ns, time, original_path, size FROM entries"
+                )
+            }
+
+        if tables:
+            logging.info("Rebuilding outdated index %s", path)
+        with connection:
+            connection.execute("DROP TABLE IF EXISTS metadata")
+            connection.execute("DROP TABLE IF EXISTS entries")
+            for statement in SCHEMA.split(";"):
+                if statement.strip():
+                    connection.execute(statement)
+            connection.executemany("INSERT INTO metadata VALUES (?, ?)", identity.items())
+        return {}
+
+    def lookup(self, name: str, mtime_ns: int) -> Optional[IndexEntry]:
+        """Return the indexed entry for .trashinfo file name, or None if it is unknown or changed"""
+        self.seen.add(name)
+        entry = self.entries.get(name)
+        if entry is not None and entry.mtime_ns == mtime_ns:
+            return entry
+        return None
+
+    def update(
+        self,
+        name: str,
+        mtime_ns: int,
+        time: float,
+        original_path: Optional[str],
+        size: Optional[int] = None,
+    ) -> None:
+        self.seen.add(name)
+        entry = IndexEntry(mtime_ns, time, original_path, size)
+        if self.entries.get(name) != entry:
+            self.entries[name] = entry
+            self.changed.add(name)
+            self.removed.discard(name)
+
+    def set_size(self, name: str, size: int) -> None:
+        entry = self.entries.get(name)
+        if entry is not None and entry.size != size:
+            self.update(name, entry.mtime_ns, entry.time, entry.original_path, size)
+
+    def remove(self, name: str) -> None:
+        if self.entries.pop(name, None) is not None:
+            self.removed.add(name)
+            self.changed.discard(name)
+
+    def save(self, prune: bool = True) -> None:
+        """Write the changes to disk, optionally dropping entries that were not seen"""
+        if prune:
+            for name in set(self.entries) - self.seen:
+                self.remove(name)
+        rows = []
+        for name in self.changed:
+            entry = self.entries[name]
+            rows.append(
+                (
+                    os.fsencode(name),
+                    entry.mtime_ns,
+                    entry.time,
+                    encode(entry.original_path),
+                    entry.size,
+                )
+            )
+        removed = [(os.fsencode(name),) for name in self.removed]
+        try:
+            with self.connection:
+                self.connection.executemany("DELETE FROM entries WHERE name = ?", removed)
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", rows
+                )
+            self.changed.clear()
+            self.removed.clear()
+        except sqlite3.DatabaseError as e:
+            logging.warning("Failed to update index %s: %s", self.path, e)
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+from typing import TYPE_CHECKING, Dict, List
+
+if TYPE_CHECKING:
+    from autotrash.app import StatsClass
+
+# Prometheus metric name, help text and StatsClass counter of the per directory metrics
+DIRECTORY_METRICS = [
+    ("autotrash_entries_scanned", "Trash entries found in the last run", "entries_scanned"),
+    ("autotrash_entries_deleted", "Trash entries purged in the last run", "deleted_files"),
+    ("autotrash_sized_bytes", "Bytes of the trash entries sized in the last run", "bytes_sized"),
+    ("autotrash_freed_bytes", "Bytes freed by the last run", "bytes_freed"),
+    ("autotrash_failures", "Failures during the last run", "failures"),
+    (
+        "autotrash_orphaned_bytes",
+        "Bytes of the real files without a .trashinfo file found in the last run",
+        "orphan_bytes",
+    ),
+    (
+        "autotrash_purges_resumed",
+        "Interrupted purges of an earlier run finished in the last run",
+        "purges_resumed",
+    ),
+]
+
+
+# StatsClass counters only known for the whole run: the file system calls are counted by a throttle
+# that is shared by the trash directories processed at the same time
+RUN_COUNTERS = ["syscalls"]
+
+
+def counters(stats: "StatsClass", directory: bool = False) -> Dict[str, int]:
+    return {
+        counter: getattr(stats, counter)
+        for counter in stats.COUNTERS
+        if not (directory and counter in RUN_COUNTERS)
+    }
+
+
+def metrics_document(stats: "StatsClass", started: float, duration: float) -> dict:
+    """The statistics of a run as a JSON serializable dictionary"""
+    return {
+        "started": started,
+        "duration_seconds": duration,
+        "phases": stats.phases,
+        "counters": counters(stats),
+        "directories": {
+            path: {"phases": directory.phases, "counters": counters(directory, directory=True)}
+            for path, directory in stats.directories.items()
+        },
+    }
+
+
+def label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(stats: "StatsClass", started: float, duration: float) -> str:
+    """The statistics of a run in the Prometheus text exposition format"""
+    lines: List[str] = []
+
+    def metric(name: str, help_text: str, samples: List[tuple]) -> None:
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s gauge" % name)
+        for labels, value in samples:
+            if labels:
+                label_text = ",".join('%s="%s"' % (k, label_value(v)) for (k, v) in labels)
+                lines.append("%s{%s} %s" % (name, label_text, repr(value)))
+            else:
+                lines.append("%s %s" % (name, repr(value)))
+
+    metric("autotrash_last_run_timestamp_seconds", "Start of the last run", [((), started)])
+    metric("autotrash_duration_seconds", "Duration of the last run", [((), duration)])
+    metric(
+        "autotrash_phase_seconds",
+        "Seconds spent per phase in the last run",
+        [((("phase", phase),), seconds) for (phase, seconds) in stats.phases.items()],
+    )
+    metric(
+        "autotrash_directory_phase_seconds",
+        "Seconds spent per trash directory and phase in the last run",
+        [
+            ((("directory", path), ("phase", phase)), seconds)
+            for (path, directory) in stats.directories.items()
+            for (phase, seconds) in directory.phases.items()
+        ],
+    )
+    for name, help_text, counter in DIRECTORY_METRICS:
+        metric(
+            name,
+            help_text,
+            [
+                ((("directory", path),), getattr(directory, counter))
+                for (path, directory) in stats.directories.items()
+            ],
+        )
+    metric("autotrash_syscalls", "File system calls made by the last run", [((), stats.syscalls)])
+    return "\n".join(lines) + "\n"
+
+
+def write_atomically(path: str, text: str) -> None:
+    """Replace the file at path by one with text, so readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    (fd, temporary_path) = tempfile.mkstemp(
+        prefix="." + os.path.basename(path) + ".", dir=directory
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def write_metrics(options, stats: "StatsClass", started: float, duration: float) -> None:
+    """Write the statistics of a run to the --metrics-json and --metrics-textfile files"""
+    if options.metrics_json:
+        document = metrics_document(stats, started, duration)
+        write_atomically(options.metrics_json, json.dumps(document, indent=2) + "\n")
+    if options.metrics_textfile:
+        write_atomically(options.metrics_textfile, prometheus_text(stats, started, duration))
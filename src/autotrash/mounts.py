@@ -0,0 +1,239 @@
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, TypeVar
+
+MOUNTINFO_PATH = "/proc/self/mountinfo"
+
+# Kernel filesystems that never hold a trash directory
+PSEUDO_FILESYSTEMS = frozenset(
+    [
+        "autofs",
+        "binfmt_misc",
+        "bpf",
+        "cgroup",
+        "cgroup2",
+        "configfs",
+        "debugfs",
+        "devpts",
+        "devtmpfs",
+        "efivarfs",
+        "fusectl",
+        "hugetlbfs",
+        "mqueue",
+        "nsfs",
+        "proc",
+        "pstore",
+        "rpc_pipefs",
+        "securityfs",
+        "selinuxfs",
+        "sysfs",
+        "tracefs",
+    ]
+)
+
+# Filesystems where looking for a trash directory can hang when the server does not respond,
+# as can all FUSE filesystems (fuse.sshfs, fuse.rclone, ...)
+NETWORK_FILESYSTEMS = frozenset(
+    ["9p", "afs", "ceph", "cifs", "davfs", "glusterfs", "ncpfs", "nfs", "nfs4", "smb3", "smbfs"]
+)
+
+ESCAPED_CHARACTER = re.compile(rb"\\([0-7]{3})")
+USER_TRASH_NAME = re.compile(r"\.Trash-([0-9]+)")
+
+T = TypeVar("T")
+
+
+class Mount(NamedTuple):
+    device: str
+    root: str
+    mount_point: str
+    fs_type: str
+    read_only: bool
+
+    @property
+    def network(self) -> bool:
+        return self.fs_type in NETWORK_FILESYSTEMS or self.fs_type.startswith("fuse")
+
+
+def unescape(field: bytes) -> str:
+    """Undo the octal escaping of spaces, tabs, newlines and backslashes in mountinfo fields"""
+    return os.fsdecode(ESCAPED_CHARACTER.sub(lambda m: bytes([int(m.group(1), 8)]), field))
+
+
+def parse_mountinfo(lines: Iterable[bytes]) -> List[Mount]:
+    """Parse the lines of /proc/self/mountinfo, see proc(5)"""
+    mounts = []
+    for line in lines:
+        fields = line.split()
+        try:
+            separator = fields.index(b"-", 6)
+            mount_options = fields[5].split(b",")
+            super_options = fields[separator + 3].split(b",")
+            mounts.append(
+                Mount(
+                    device=fields[2].decode(),
+                    root=unescape(fields[3]),
+                    mount_point=unescape(fields[4]),
+                    fs_type=fields[separator + 1].decode(),
+                    read_only=b"ro" in mount_options or b"ro" in super_options,
+                )
+            )
+        except (ValueError, IndexError):
+            logging.warning("Can not parse mount %r", line)
+    return mounts
+
+
+def read_mountinfo(path: str = MOUNTINFO_PATH) -> List[Mount]:
+    with open(path, "rb") as f:
+        return parse_mountinfo(f)
+
+
+def writable_mounts(mounts: List[Mount]) -> List[Mount]:
+    """The mounts that can hold a trash directory, every mounted filesystem tree only once
+
+    Pseudo and read-only filesystems are left out, as are mounts hidden by a later mount on the
+    same mount point. A filesystem tree that is mounted several times, the same root directory of
+    the same device, is only kept at its first mount point.
+    """
+    visible = {mount.mount_point: mount for mount in mounts}
+    seen = set()
+    result = []
+    for mount in mounts:
+        if mount.fs_type in PSEUDO_FILESYSTEMS or mount.read_only:
+            continue
+        if visible[mount.mount_point] is not mount:
+            continue
+        if (mount.device, mount.root) in seen:
+            continue
+        seen.add((mount.device, mount.root))
+        result.append(mount)
+    return result
+
+
+def find_mount_trash(mount_point: str, uid: int) -> Optional[str]:
+    """The trash directory of user uid in the top directory of a mount, if there is one"""
+    for trash_path in [
+        os.path.join(mount_point, ".Trash", str(uid)),
+        os.path.join(mount_point, ".Trash-%d" % uid),
+    ]:
+        if os.path.exists(trash_path):
+            return trash_path
+    return None
+
+
+def list_mount_trashes(mount_point: str) -> Dict[int, str]:
+    """The trash directories of all users in the top directory of a mount, by user id
+
+    Like find_mount_trash, a .Trash/$uid directory is used rather than a .Trash-$uid one.
+    """
+    trash_paths: Dict[int, str] = {}
+    try:
+        names = os.listdir(mount_point)
+    except OSError:
+        return trash_paths
+    if ".Trash" in names:
+        try:
+            for name in os.listdir(os.path.join(mount_point, ".Trash")):
+                if name.isdigit():
+                    trash_paths[int(name)] = os.path.join(mount_point, ".Trash", name)
+        except OSError:
+            pass
+    for name in names:
+        match = USER_TRASH_NAME.fullmatch(name)
+        if match is not None:
+            trash_paths.setdefault(int(match.group(1)), os.path.join(mount_point, name))
+    return trash_paths
+
+
+def mount_of(path: str, mounts: List[Mount]) -> Optional[Mount]:
+    """The mount among mounts that path is on, if any"""
+    found = None
+    for mount in mounts:
+        prefix = mount.mount_point.rstrip("/") + "/"
+        if path == mount.mount_point or path.startswith(prefix):
+            if found is None or len(mount.mount_point) > len(found.mount_point):
+                found = mount
+    return found
+
+
+def run_probes(
+    probes: List[Tuple[str, bool, Callable[[], T]]], timeout: float
+) -> List[Optional[T]]:
+    """Call every (path, may hang, probe) function, returning their results in order
+
+    Probes that may hang, those of network mounts, run on threads of their own at the same time.
+    Those that do not answer within timeout seconds give None. Their threads are left behind, as a
+    hanging file system call can not be interrupted, but they do not keep autotrash from exiting.
+    """
+    results: List[Optional[T]] = [None] * len(probes)
+    threads = []
+    for position, (path, may_hang, probe) in enumerate(probes):
+        if not may_hang:
+            results[position] = probe()
+            continue
+
+        def run(position: int = position, probe: Callable[[], T] = probe) -> None:
+            results[position] = probe()
+
+        thread = threading.Thread(target=run, name="probe %s" % path, daemon=True)
+        thread.start()
+        threads.append((position, thread))
+
+    timed_out = set()
+    deadline = time.monotonic() + timeout
+    for position, thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+        if thread.is_alive():
+            logging.warning(
+                "Skipping %s, it did not respond within %g seconds", probes[position][0], timeout
+            )
+            timed_out.add(position)
+    return [None if position in timed_out else result for (position, result) in enumerate(results)]
+
+
+def find_mount_trashes(
+    mounts: List[Mount],
+    uid: int,
+    timeout: float,
+    find: Callable[[str, int], Optional[str]] = find_mount_trash,
+) -> List[str]:
+    """The trash directories of user uid on mounts, in the order of the mounts
+
+    Network mounts that do not answer within timeout seconds are skipped, see run_probes.
+    """
+    found = run_probes(
+        [
+            (mount.mount_point, mount.network, functools.partial(find, mount.mount_point, uid))
+            for mount in mounts
+        ],
+        timeout,
+    )
+    return [trash_path for trash_path in found if trash_path is not None]
+
+
+def find_all_mount_trashes(
+    mounts: List[Mount],
+    timeout: float,
+    list_trashes: Callable[[str], Dict[int, str]] = list_mount_trashes,
+) -> Dict[int, List[str]]:
+    """The trash directories of all users on mounts, in the order of the mounts, by user id"""
+    listed = run_probes(
+        [
+            (
+                mount.mount_point,
+                mount.network,
+                functools.partial(list_trashes, mount.mount_point),
+            )
+            for mount in mounts
+        ],
+        timeout,
+    )
+    trash_paths: Dict[int, List[str]] = {}
+    for mount_trashes in listed:
+        for uid, trash_path in (mount_trashes or {}).items():
+            trash_paths.setdefault(uid, []).append(trash_path)
+    return trash_paths
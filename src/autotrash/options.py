@@ -1,4 +1,5 @@
 import optparse
+from typing import NoReturn, Optional
 
 
 def new_parser() -> optparse.OptionParser:
@@ -17,6 +18,27 @@ def new_parser() -> optparse.OptionParser:
         delete_first=[],
         version=False,
         trash_limit=0,
+        mount_workers=1,
+        mount_timeout=5.0,
+        all_users=False,
+        user_workers=4,
+        jobs=1,
+        purge_workers=1,
+        unlink_rate=0,
+        metadata_rate=0,
+        nice=0,
+        ionice=None,
+        index=False,
+        watch=False,
+        watch_interval=60,
+        recheck_free=0,
+        metrics_json=None,
+        metrics_textfile=None,
+        orphans=None,
+        mtime_window=0,
+        estimate=0,
+        evict="oldest",
+        evict_min_age=0,
     )
     parser.add_option(
         "-d",
@@ -41,6 +63,34 @@ def new_parser() -> optparse.OptionParser:
         default=False,
         help="Process all user trash directories instead of just the one in the home directory",
     )
+    parser.add_option(
+        "--mount-workers",
+        dest="mount_workers",
+        type="int",
+        help="with --trash-mounts, process trash directories on up to N devices at the same time",
+        metavar="N",
+    )
+    parser.add_option(
+        "--mount-timeout",
+        dest="mount_timeout",
+        type="float",
+        help="with --trash-mounts, skip network mounts that do not respond within SECONDS seconds",
+        metavar="SECONDS",
+    )
+    parser.add_option(
+        "--all-users",
+        dest="all_users",
+        action="store_true",
+        help="as root, process the trash directories of every user, in the home directory and on "
+        "all mounts, each user with the privileges of that user",
+    )
+    parser.add_option(
+        "--user-workers",
+        dest="user_workers",
+        type="int",
+        help="with --all-users, process the trash directories of up to N users at the same time",
+        metavar="N",
+    )
     parser.add_option(
         "--max-free",
         dest="max_free",
@@ -63,6 +113,14 @@ def new_parser() -> optparse.OptionParser:
         help="set --delete to make sure M megabytes of space is available.",
         metavar="M",
     )
+    parser.add_option(
+        "--recheck-free",
+        dest="recheck_free",
+        type="int",
+        help="with --min-free, check the free space again after every N purged entries and stop "
+        "once there is enough, instead of using the size of the purged entries",
+        metavar="N",
+    )
     parser.add_option(
         "--trash_limit",
         dest="trash_limit",
@@ -70,6 +128,111 @@ def new_parser() -> optparse.OptionParser:
         help="make sure no more than M megabytes of space are used by the trash.",
         metavar="M",
     )
+    parser.add_option(
+        "--evict",
+        dest="evict",
+        type="choice",
+        choices=["oldest", "largest", "weighted"],
+        help="what to purge first to free the space of --delete, --min-free or --trash_limit: the "
+        "oldest entries (default), the largest or those with the most bytes times days in the "
+        "trash",
+        metavar="POLICY",
+    )
+    parser.add_option(
+        "--evict-min-age",
+        dest="evict_min_age",
+        type="int",
+        help="with --evict largest or weighted, only pick entries in the trash for at least DAYS "
+        "days, younger ones follow oldest first if those are not enough",
+        metavar="DAYS",
+    )
+    parser.add_option(
+        "--mtime-window",
+        dest="mtime_window",
+        type="int",
+        help="with only --days, decide the age of an entry by the modification time of its "
+        ".trashinfo file, reading only those within HOURS hours of the cutoff",
+        metavar="HOURS",
+    )
+    parser.add_option(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type="int",
+        help="calculate the size of trashed files using N threads",
+        metavar="N",
+    )
+    parser.add_option(
+        "--purge-workers",
+        dest="purge_workers",
+        type="int",
+        help="remove up to N trash entries at the same time",
+        metavar="N",
+    )
+    parser.add_option(
+        "--unlink-rate",
+        dest="unlink_rate",
+        type="int",
+        help="remove at most N files or directories per second, fewer when the disk is slow; with "
+        "--all-users for all users together",
+        metavar="N",
+    )
+    parser.add_option(
+        "--metadata-rate",
+        dest="metadata_rate",
+        type="int",
+        help="list directories and read .trashinfo files at no more than KB kilobytes per second; "
+        "with --all-users for all users together",
+        metavar="KB",
+    )
+    parser.add_option(
+        "--nice",
+        dest="nice",
+        type="int",
+        help="lower the CPU priority by N, see nice(1)",
+        metavar="N",
+    )
+    parser.add_option(
+        "--ionice",
+        dest="ionice",
+        type="choice",
+        choices=["idle", "best-effort"],
+        help="use the idle or the lowest best-effort I/O scheduling class, see ionice(1)",
+        metavar="CLASS",
+    )
+    parser.add_option(
+        "--index",
+        action="store_true",
+        dest="index",
+        help="keep an index of the trash in the XDG cache directory, "
+        "so later runs only read new entries",
+    )
+    parser.add_option(
+        "--watch",
+        action="store_true",
+        dest="watch",
+        help="keep running and purge as soon as an entry expires or a limit is exceeded",
+    )
+    parser.add_option(
+        "--watch-interval",
+        dest="watch_interval",
+        type="int",
+        help="with --watch, check the free space every SECONDS seconds",
+        metavar="SECONDS",
+    )
+    parser.add_option(
+        "--metrics-json",
+        dest="metrics_json",
+        help="write the timings and counters of the run to FILE as JSON",
+        metavar="FILE",
+    )
+    parser.add_option(
+        "--metrics-textfile",
+        dest="metrics_textfile",
+        help="write the timings and counters of the run to FILE for the textfile collector "
+        "of the Prometheus node exporter",
+        metavar="FILE",
+    )
     parser.add_option(
         "-D",
         "--delete-first",
@@ -94,6 +257,15 @@ def new_parser() -> optparse.OptionParser:
         dest="check",
         help="report .trashinfo files without a real file",
     )
+    parser.add_option(
+        "--orphans",
+        dest="orphans",
+        type="choice",
+        choices=["report", "purge"],
+        help="report or purge real files without a .trashinfo file and .trashinfo files without "
+        "a real file",
+        metavar="MODE",
+    )
     parser.add_option(
         "--dry-run",
         action="store_true",
@@ -106,6 +278,14 @@ def new_parser() -> optparse.OptionParser:
         dest="stat",
         help="show the number, and total size of files involved",
     )
+    parser.add_option(
+        "--estimate",
+        dest="estimate",
+        type="float",
+        help="with --stat, estimate the sizes from a random sample of the entries, sized within "
+        "SECONDS seconds per trash directory, and show their 95%% confidence intervals",
+        metavar="SECONDS",
+    )
     parser.add_option(
         "-V",
         "--version",
@@ -122,9 +302,19 @@ def new_parser() -> optparse.OptionParser:
     return parser
 
 
-def check_options(parser, options) -> None:
+class OptionsError(ValueError):
+    """Invalid options, for check_options without a parser"""
+
+
+def raise_options_error(msg: str) -> NoReturn:
+    raise OptionsError(msg)
+
+
+def check_options(parser: Optional[optparse.OptionParser], options) -> None:
+    """Exit with a usage error from parser on invalid options, or raise OptionsError without one"""
+    error = parser.error if parser is not None else raise_options_error
     if options.delete + options.min_free + options.days == 0:
-        parser.error(
+        error(
             "You need to specify at least one of:\n"
             "\t -d <days of age to purge>,\n"
             "\t --delete <number of megabytes to purge>, or\n"
@@ -133,43 +323,125 @@ def check_options(parser, options) -> None:
         )
 
     if options.days < 0:
-        parser.error("Can not work with a negative or zero days")
+        error("Can not work with a negative or zero days")
 
     if options.max_free < 0:
-        parser.error("Can not work with a negative value for --max-free")
+        error("Can not work with a negative value for --max-free")
 
     if options.delete < 0:
-        parser.error("Can not work with a negative value for --delete")
+        error("Can not work with a negative value for --delete")
 
     if options.min_free < 0:
-        parser.error("Can not work with a negative value for --min-free")
+        error("Can not work with a negative value for --min-free")
+
+    if options.recheck_free < 0:
+        error("Can not work with a negative value for --recheck-free")
+
+    if options.recheck_free and not options.min_free:
+        error("Using --recheck-free without --min-free does not have any effect.")
+
+    if options.mtime_window < 0:
+        error("Can not work with a negative value for --mtime-window")
+
+    if options.mtime_window and not options.days:
+        error("Using --mtime-window without --days (-d) does not have any effect.")
+
+    if options.estimate < 0:
+        error("Can not work with a negative value for --estimate")
+
+    if options.estimate and not options.stat:
+        error("Using --estimate without --stat does not have any effect.")
+
+    if options.estimate and (options.trash_limit or options.delete or options.min_free):
+        error(
+            "Combining --estimate with --trash_limit, --delete or --min-free is unsupported\n"
+            "as these need the exact sizes of the entries."
+        )
 
     if options.trash_limit < 0:
-        parser.error("Can not work with a negative value for --trash_limit")
+        error("Can not work with a negative value for --trash_limit")
+
+    if options.evict_min_age < 0:
+        error("Can not work with a negative value for --evict-min-age")
+
+    if options.evict_min_age and options.evict == "oldest":
+        error("Using --evict-min-age without --evict largest or weighted does not have any effect.")
+
+    if options.evict != "oldest" and not (
+        options.delete or options.min_free or options.trash_limit
+    ):
+        error(
+            "Using --evict without --delete, --min-free or --trash_limit does not have any effect."
+        )
+
+    if options.evict != "oldest" and options.recheck_free:
+        error(
+            "Combining --evict largest or weighted with --recheck-free is unsupported\n"
+            "as these need the sizes of all entries."
+        )
+
+    if options.jobs < 1:
+        error("Can not work with less than one --jobs")
+
+    if options.purge_workers < 1:
+        error("Can not work with less than one --purge-workers")
+
+    if options.unlink_rate < 0:
+        error("Can not work with a negative value for --unlink-rate")
+
+    if options.metadata_rate < 0:
+        error("Can not work with a negative value for --metadata-rate")
+
+    if options.nice < 0:
+        error("Can not work with a negative value for --nice")
+
+    if options.mount_workers < 1:
+        error("Can not work with less than one --mount-workers")
+
+    if options.watch_interval < 1:
+        error("Can not work with a --watch-interval of less than one second")
+
+    if options.metrics_textfile and not options.metrics_textfile.endswith(".prom"):
+        error("The node exporter only reads --metrics-textfile files ending in .prom")
+
+    if options.mount_timeout <= 0:
+        error("Can not work with a --mount-timeout of zero seconds or less")
+
+    if options.mount_workers > 1 and not options.trash_mounts:
+        error("Using --mount-workers without --trash-mounts (-t) does not have any effect.")
+
+    if options.user_workers < 1:
+        error("Can not work with less than one --user-workers")
+
+    if options.all_users and (options.trash_path or options.trash_mounts):
+        error("--all-users already finds the trash directories of every user")
+
+    if options.all_users and (options.watch or options.install):
+        error("--all-users can not be combined with --watch or --install")
 
     if options.trash_path and options.trash_mounts:
-        parser.error("Cannot auto-detect trash directories when setting a specific one")
+        error("Cannot auto-detect trash directories when setting a specific one")
 
     if options.stat and options.quiet:
-        parser.error("Specifying both --quiet and --stat does not make sense")
+        error("Specifying both --quiet and --stat does not make sense")
 
     if options.verbose and options.quiet:
-        parser.error("Specifying both --quiet and --verbose does not make sense")
+        error("Specifying both --quiet and --verbose does not make sense")
 
     if options.delete and options.min_free:
-        parser.error(
+        error(
             "Combining --delete and --min-free results in unpredictable behaviour\n"
             " as --delete may or may not be ignored depending on the free space."
         )
 
     if options.trash_limit and (options.delete or options.min_free):
-        parser.error(
+        error(
             "Combining --trash_limit with --min-free or --delete is unsupported\n"
             "as these rules may contradict each other."
         )
 
     if (not options.min_free) and options.delete_first:
-        parser.error(
+        error(
             "Using --delete-first (-D) without --min-free does not have any effect.\n"
             "Age based purging will still work as predicted."
         )
@@ -0,0 +1,140 @@
+import errno
+import functools
+import os
+import stat
+from typing import List, Optional, Tuple
+
+from autotrash.throttle import Throttle, dirent_size, paced_unlink
+from autotrash.usage import DIRECTORY_FLAGS, MAX_OPEN_DIRECTORIES, open_directory_path
+
+
+class Frame:
+    """A directory being emptied: its descriptor (None while closed), path and remaining entries"""
+
+    def __init__(self, fd: int, path: str, name: str, throttle: Optional[Throttle]) -> None:
+        self.fd: Optional[int] = fd
+        self.path = path
+        self.name = name
+        self.writable = False
+        with os.scandir(fd) as entries:
+            self.entries = [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in entries]
+        if throttle is not None:
+            throttle.metadata(sum(dirent_size(name) for (name, _) in self.entries))
+
+    def open(self) -> int:
+        if self.fd is None:
+            self.fd = open_directory_path(self.path)
+        return self.fd
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def make_writable(self) -> bool:
+        """Give the owner full access to this directory, return whether anything changed"""
+        if self.writable:
+            return False
+        self.writable = True
+        fd = self.open()
+        mode = os.fstat(fd).st_mode
+        if stat.S_IMODE(mode) & stat.S_IRWXU == stat.S_IRWXU:
+            return False
+        os.fchmod(fd, stat.S_IMODE(mode) | stat.S_IRWXU)
+        return True
+
+
+def open_frame(
+    name: str, parent_fd: Optional[int], path: str, throttle: Optional[Throttle]
+) -> Frame:
+    try:
+        fd = os.open(name, DIRECTORY_FLAGS, dir_fd=parent_fd)
+    except PermissionError:
+        # Without read and search permission the directory can not be emptied
+        os.chmod(name, stat.S_IRWXU, dir_fd=parent_fd)
+        fd = os.open(name, DIRECTORY_FLAGS, dir_fd=parent_fd)
+    try:
+        return Frame(fd, path, name, throttle)
+    except OSError:
+        os.close(fd)
+        raise
+
+
+def remove_tree(
+    path: str, st: Optional[os.stat_result] = None, throttle: Optional[Throttle] = None
+) -> List[Tuple[str, OSError]]:
+    """Remove a file or a directory tree without following links, returning the errors
+
+    Directories are emptied with an explicit stack instead of recursion. Entries are removed
+    relative to an open descriptor of their directory, which is listed once. Directories without
+    owner write or search permission are made accessible, as trashed directories are often
+    read-only copies. The tree is gone if no errors are returned. st is the lstat result of path,
+    if the caller already has it. Listing and unlinking are paced by throttle, if given.
+    """
+    unlink = functools.partial(paced_unlink, throttle)
+    errors: List[Tuple[str, OSError]] = []
+    try:
+        if st is None:
+            st = os.lstat(path)
+        if not stat.S_ISDIR(st.st_mode):
+            unlink(os.unlink, path)
+            return errors
+        stack = [open_frame(path, None, path, throttle)]
+    except FileNotFoundError:
+        return errors
+    except OSError as e:
+        return [(path, e)]
+
+    def retry(frame: Frame, error: OSError, function, *args, **kwargs) -> None:
+        """Call function again after making frame accessible, if the error was a permission error"""
+        if isinstance(error, PermissionError) and frame.make_writable():
+            unlink(function, *args, **kwargs)
+        else:
+            raise error
+
+    try:
+        while stack:
+            frame = stack[-1]
+            fd = frame.open()
+            if not frame.entries:
+                stack.pop()
+                frame.close()
+                try:
+                    if stack:
+                        parent = stack[-1]
+                        try:
+                            unlink(os.rmdir, frame.name, dir_fd=parent.open())
+                        except OSError as e:
+                            retry(parent, e, os.rmdir, frame.name, dir_fd=parent.open())
+                    else:
+                        unlink(os.rmdir, path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # A directory that could not be emptied was reported already
+                    if not (errors and e.errno == errno.ENOTEMPTY):
+                        errors.append((frame.path, e))
+                continue
+
+            (name, is_directory) = frame.entries.pop()
+            entry_path = os.path.join(frame.path, name)
+            try:
+                if is_directory:
+                    child = open_frame(name, fd, entry_path, throttle)
+                    if len(stack) >= MAX_OPEN_DIRECTORIES:
+                        # Keep the number of open descriptors bounded, these are reopened by path
+                        stack[-MAX_OPEN_DIRECTORIES].close()
+                    stack.append(child)
+                    continue
+                try:
+                    unlink(os.unlink, name, dir_fd=fd)
+                except OSError as e:
+                    retry(frame, e, os.unlink, name, dir_fd=fd)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                errors.append((entry_path, e))
+    finally:
+        for frame in stack:
+            frame.close()
+    return errors
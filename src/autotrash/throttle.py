@@ -0,0 +1,179 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+# ioprio_set(2) is not wrapped by the C library, these are its system call numbers
+IOPRIO_SET_SYSCALLS = {
+    "x86_64": 251,
+    "i386": 289,
+    "i686": 289,
+    "aarch64": 30,
+    "arm64": 30,
+    "riscv64": 30,
+    "armv7l": 314,
+    "ppc64": 273,
+    "ppc64le": 273,
+    "s390x": 282,
+}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_CLASSES = {"best-effort": (2, 7), "idle": (3, 0)}
+
+# Unlink latency is averaged with this weight for the newest measurement
+LATENCY_WEIGHT = 0.1
+# The unlink rate is halved once the average latency exceeds this many times the lowest average
+LATENCY_BACKOFF = 2.0
+# ... but not for latencies below this, which are just noise
+MIN_LATENCY = 0.001
+# Seconds between two changes of the unlink rate
+ADJUST_INTERVAL = 1.0
+
+
+def dirent_size(name: str) -> int:
+    """Bytes taken by a directory entry in the buffer returned by getdents64"""
+    return (19 + len(os.fsencode(name)) + 1 + 7) & ~7
+
+
+class RateLimiter:
+    """Token bucket allowing rate units per second, with bursts of up to one second's worth"""
+
+    def __init__(
+        self,
+        rate: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.tokens = rate
+        self.last = clock()
+
+    def take(self, amount: float) -> None:
+        """Wait until amount units may be used"""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # Going into debt makes the following callers wait as well, so they queue up fairly
+            self.tokens -= amount
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            self.sleep(wait)
+
+
+class Throttle:
+    """Limit the unlink operations per second and the bytes of metadata read per second
+
+    Metadata bytes are the directory entries listed and the .trashinfo files read. The unlink rate
+    is a ceiling: it is halved whenever unlinks get markedly slower than they were at their
+    fastest, and raised again step by step once they are fast again. Safe to use from several
+    threads. Without any rate it only counts the file system calls it sees in calls: directory
+    listings, .trashinfo reads, entries stat'ed while sizing, unlinks and rmdirs.
+    """
+
+    def __init__(
+        self,
+        unlink_rate: float = 0,
+        metadata_rate: float = 0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.unlink_rate = unlink_rate
+        self.unlinks = RateLimiter(unlink_rate, clock, sleep) if unlink_rate else None
+        self.metadata_bytes = RateLimiter(metadata_rate, clock, sleep) if metadata_rate else None
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.latency: Optional[float] = None
+        self.lowest_latency: Optional[float] = None
+        self.adjusted = clock()
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def count(self, calls: int) -> None:
+        with self.calls_lock:
+            self.calls += calls
+
+    def metadata(self, size: int, calls: int = 1) -> None:
+        self.count(calls)
+        if self.metadata_bytes is not None:
+            self.metadata_bytes.take(size)
+
+    def unlink(self, function: Callable, *args, **kwargs) -> None:
+        """Call an unlink like function, at the current unlink rate"""
+        self.count(1)
+        if self.unlinks is None:
+            function(*args, **kwargs)
+            return
+        self.unlinks.take(1)
+        start = self.clock()
+        try:
+            function(*args, **kwargs)
+        finally:
+            self.measured(self.clock() - start)
+
+    def measured(self, latency: float) -> None:
+        assert self.unlinks is not None
+        with self.lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += LATENCY_WEIGHT * (latency - self.latency)
+            if self.lowest_latency is None or self.latency < self.lowest_latency:
+                self.lowest_latency = self.latency
+            now = self.clock()
+            if now - self.adjusted < ADJUST_INTERVAL:
+                return
+            self.adjusted = now
+            rate = self.unlinks.rate
+            if self.latency > max(MIN_LATENCY, LATENCY_BACKOFF * self.lowest_latency):
+                rate = max(min(1.0, self.unlink_rate), rate / 2)
+            else:
+                rate = min(self.unlink_rate, rate + self.unlink_rate / 10)
+            if rate != self.unlinks.rate:
+                logging.debug("Unlink rate %.1f/s at %.1f ms per unlink", rate, self.latency * 1000)
+                self.unlinks.rate = rate
+
+
+def paced_unlink(throttle: Optional[Throttle], function: Callable, *args, **kwargs) -> None:
+    """Call an unlink like function, at the unlink rate of throttle if there is one"""
+    if throttle is None:
+        function(*args, **kwargs)
+    else:
+        throttle.unlink(function, *args, **kwargs)
+
+
+def set_io_priority(io_class: str) -> None:
+    """Move this process into the given I/O scheduling class, see ionice(1)"""
+    # Only needed with --ionice, so they do not slow down the start of every other run
+    import ctypes
+    import ctypes.util
+    import platform
+
+    syscall = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if syscall is None:
+        logging.warning("Can not set the I/O priority on %s", platform.machine())
+        return
+    (class_number, level) = IOPRIO_CLASSES[io_class]
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        result = libc.syscall(
+            syscall, IOPRIO_WHO_PROCESS, 0, (class_number << IOPRIO_CLASS_SHIFT) | level
+        )
+    except (AttributeError, OSError) as e:
+        logging.warning("Can not set the I/O priority: %s", e)
+        return
+    if result < 0:
+        error = ctypes.get_errno()
+        logging.warning("Can not set the I/O priority: %s", os.strerror(error))
+
+
+def lower_priority(nice: int, io_class: Optional[str]) -> None:
+    """Lower the CPU and I/O priority of this process and of the threads it starts later"""
+    if nice:
+        os.nice(nice)
+    if io_class:
+        set_io_priority(io_class)
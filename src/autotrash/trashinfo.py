@@ -0,0 +1,87 @@
+import datetime
+import os
+from typing import NamedTuple, Optional
+from urllib.parse import unquote_to_bytes
+
+SECTION = "[Trash Info]"
+
+TRASHINFO_EXTENSION = ".trashinfo"
+
+
+class TrashInfo(NamedTuple):
+    path: Optional[str]
+    deletion_date: Optional[datetime.datetime]
+
+
+def read_datetime(value: str) -> datetime.datetime:
+    """Parse a DeletionDate: YYYY-MM-DDThh:mm:ss, optionally followed by .fractionZ"""
+    digits = value[0:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] + value[17:19]
+    if (
+        len(digits) != 14
+        or not (digits.isascii() and digits.isdigit())
+        or value[4] != "-"
+        or value[7] != "-"
+        or value[10] != "T"
+        or value[13] != ":"
+        or value[16] != ":"
+    ):
+        raise ValueError("time data %r does not match format YYYY-MM-DDThh:mm:ss" % value)
+    microsecond = 0
+    if len(value) > 19:
+        fraction = value[20:-1]
+        if (
+            value[19] != "."
+            or value[-1] != "Z"
+            or not 1 <= len(fraction) <= 6
+            or not (fraction.isascii() and fraction.isdigit())
+        ):
+            raise ValueError("unconverted data remains: %s" % value[19:])
+        microsecond = int(fraction.ljust(6, "0"))
+    return datetime.datetime(
+        int(value[0:4]),
+        int(value[5:7]),
+        int(value[8:10]),
+        int(value[11:13]),
+        int(value[14:16]),
+        int(value[17:19]),
+        microsecond,
+    )
+
+
+def parse_trash_info(data: bytes) -> TrashInfo:
+    """Extract Path and DeletionDate from the [Trash Info] section of a .trashinfo file"""
+    path = None
+    deletion_date = None
+    in_section = False
+    seen_section = False
+    for line in data.decode("utf-8").splitlines():
+        line = line.strip()
+        if not line or line[0] in "#;":
+            continue
+        if line[0] == "[":
+            if line[-1] != "]":
+                raise ValueError("Invalid section header: %r" % line)
+            in_section = line == SECTION
+            seen_section = True
+            continue
+        if not seen_section:
+            raise ValueError("File contains no section headers")
+        if not in_section:
+            continue
+        (key, separator, value) = line.partition("=")
+        if not separator:
+            raise ValueError("Invalid line: %r" % line)
+        key = key.strip().lower()
+        if key == "path" and path is None:
+            value = value.strip()
+            path = os.fsdecode(unquote_to_bytes(value)) if "%" in value else value
+        elif key == "deletiondate" and deletion_date is None:
+            deletion_date = read_datetime(value.strip())
+        if path is not None and deletion_date is not None:
+            break
+    return TrashInfo(path, deletion_date)
+
+
+def read_trash_info(fname: str) -> TrashInfo:
+    with open(fname, "rb") as f:
+        return parse_trash_info(f.read())
@@ -0,0 +1,283 @@
+import errno
+import logging
+import os
+import stat
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from autotrash.throttle import Throttle, dirent_size
+
+FOLLOWING_FLAGS = os.O_RDONLY | os.O_DIRECTORY | getattr(os, "O_CLOEXEC", 0)
+DIRECTORY_FLAGS = FOLLOWING_FLAGS | os.O_NOFOLLOW
+
+# At most this many directories of a walk are kept open, so their children can be opened relative
+# to them. Shallower ones are closed, and reopened by path once the walk gets back to them.
+MAX_OPEN_DIRECTORIES = 128
+
+# Paths longer than the system allows are opened in pieces of about this many bytes
+PATH_PIECE = 1024
+
+# A parallel walk task hands back its unvisited directories after counting this many entries
+SPLIT_ENTRIES = 2000
+
+
+class TreeUsage(NamedTuple):
+    size: int
+    files: int
+
+
+def entry_usage(st: os.stat_result) -> int:
+    """Consumed size of a single entry: the link itself for symlinks, allocated blocks otherwise"""
+    if stat.S_ISLNK(st.st_mode):
+        return st.st_size
+    return st.st_blocks * 512
+
+
+def open_directory_path(path: str) -> int:
+    """Open the directory at path, a piece of it at a time when it is longer than the system allows
+
+    Only the last piece is opened without following a link, the others may hold links in the
+    path leading to the trash directory.
+    """
+    try:
+        return os.open(path, DIRECTORY_FLAGS)
+    except OSError as error:
+        if error.errno != errno.ENAMETOOLONG:
+            raise
+    pieces: List[List[str]] = [[]]
+    length = 0
+    for part in path.split(os.sep):
+        if pieces[-1] not in ([], [""]) and length + len(part) + 1 > PATH_PIECE:
+            pieces.append([])
+            length = 0
+        pieces[-1].append(part)
+        length += len(part) + 1
+    fd: Optional[int] = None
+    try:
+        for position, piece in enumerate(pieces):
+            flags = DIRECTORY_FLAGS if position == len(pieces) - 1 else FOLLOWING_FLAGS
+            piece_fd = os.open(os.sep.join(piece), flags, dir_fd=fd)
+            if fd is not None:
+                os.close(fd)
+            fd = piece_fd
+    except OSError:
+        if fd is not None:
+            os.close(fd)
+        raise
+    assert fd is not None
+    return fd
+
+
+class OpenDirectory:
+    """A directory being walked: its descriptor (None while closed), path and subdirectories left"""
+
+    __slots__ = ("fd", "path", "subdirectories")
+
+    def __init__(self, fd: int, path: str, subdirectories: List[str]) -> None:
+        self.fd: Optional[int] = fd
+        self.path = path
+        self.subdirectories = iter(subdirectories)
+
+    def open(self) -> int:
+        if self.fd is None:
+            self.fd = open_directory_path(self.path)
+        return self.fd
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def scan_directory(
+    fd: int, path: str, throttle: Optional[Throttle] = None
+) -> Tuple[int, int, List[str]]:
+    """Size and count the entries of one open directory, returning the names of subdirectories"""
+    size = 0
+    files = 0
+    subdirectories = []
+    try:
+        with os.scandir(fd) as entries:
+            for entry in entries:
+                if throttle is not None:
+                    throttle.metadata(dirent_size(entry.name))
+                try:
+                    # Relative to fd, so this is an fstatat and path is never resolved again
+                    entry_stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    logging.error("Error getting size for %s", os.path.join(path, entry.name))
+                    continue
+                size += entry_usage(entry_stat)
+                files += 1
+                if stat.S_ISDIR(entry_stat.st_mode):
+                    subdirectories.append(entry.name)
+    except OSError:
+        logging.error("Error getting size for %s", path)
+    return (size, files, subdirectories)
+
+
+def get_tree_usage(
+    path: str, st: Optional[os.stat_result] = None, throttle: Optional[Throttle] = None
+) -> TreeUsage:
+    """Get the consumed size and the number of entries of a file or directory tree
+
+    Links are not followed. Directories are walked with an explicit stack instead of recursion,
+    every directory is listed once with os.scandir on an open descriptor and its entries are
+    stat'ed relative to it. st is the lstat result of path, if the caller already has it.
+    Listing directories is paced by throttle, if given.
+    """
+    try:
+        if st is None:
+            st = os.lstat(path)
+    except OSError:
+        logging.error("Error getting size for %s", path)
+        return TreeUsage(0, 0)
+    size = entry_usage(st)
+    files = 1
+    if not stat.S_ISDIR(st.st_mode):
+        return TreeUsage(size, files)
+
+    try:
+        fd = open_directory_path(path)
+    except OSError:
+        logging.error("Error getting size for %s", path)
+        return TreeUsage(size, files)
+    (tree_size, tree_files, _) = walk_tree(fd, path, None, throttle)
+    return TreeUsage(size + tree_size, files + tree_files)
+
+
+def walk_tree(
+    fd: int, path: str, budget: Optional[int], throttle: Optional[Throttle] = None
+) -> Tuple[int, int, List[str]]:
+    """Size and count the contents of the open directory fd at path, closing fd
+
+    Every subdirectory is opened relative to the descriptor of its parent, so the length of the
+    paths never matters. Once MAX_OPEN_DIRECTORIES are open the shallowest one is closed, to be
+    reopened by path when the walk gets back to it. With a budget the walk stops once that many
+    entries are seen, returning the paths of the directories it did not get to.
+    """
+    size = 0
+    files = 0
+    stack: List[OpenDirectory] = []
+
+    def push(fd: int, directory_path: str) -> None:
+        nonlocal size, files
+        (directory_size, directory_files, subdirectories) = scan_directory(
+            fd, directory_path, throttle
+        )
+        size += directory_size
+        files += directory_files
+        if not subdirectories:
+            os.close(fd)
+            return
+        if len(stack) >= MAX_OPEN_DIRECTORIES:
+            stack[-MAX_OPEN_DIRECTORIES].close()
+        stack.append(OpenDirectory(fd, directory_path, subdirectories))
+
+    try:
+        push(fd, path)
+        while stack and (budget is None or files < budget):
+            parent = stack[-1]
+            name = next(parent.subdirectories, None)
+            if name is None:
+                stack.pop()
+                parent.close()
+                continue
+            try:
+                parent_fd = parent.open()
+            except OSError:
+                logging.error("Error getting size for %s", parent.path)
+                stack.pop()
+                continue
+            child_path = os.path.join(parent.path, name)
+            try:
+                child_fd = os.open(name, DIRECTORY_FLAGS, dir_fd=parent_fd)
+            except OSError:
+                logging.error("Error getting size for %s", child_path)
+                continue
+            push(child_fd, child_path)
+        unvisited = [
+            os.path.join(directory.path, name)
+            for directory in stack
+            for name in directory.subdirectories
+        ]
+    finally:
+        for directory in stack:
+            directory.close()
+    return (size, files, unvisited)
+
+
+def walk_directories(
+    directories: List[Tuple[int, str]], budget: int, throttle: Optional[Throttle] = None
+) -> Tuple[Dict[int, Tuple[int, int]], List[Tuple[int, str]]]:
+    """Size and count the contents of (tree index, directory) pairs until budget entries are seen
+
+    Every directory is walked with walk_tree, relative to the descriptors of its parents, and the
+    directories it did not get to are handed back by path. Returns the size and number of entries
+    found per tree index, and the pairs of directories that were not walked yet.
+    """
+    usages: Dict[int, Tuple[int, int]] = {}
+    seen = 0
+    stack = list(directories)
+    unvisited: List[Tuple[int, str]] = []
+    while stack and seen < budget:
+        (index, directory) = stack.pop()
+        try:
+            fd = open_directory_path(directory)
+        except OSError:
+            logging.error("Error getting size for %s", directory)
+            continue
+        (size, files, left) = walk_tree(fd, directory, budget - seen, throttle)
+        (tree_size, tree_files) = usages.get(index, (0, 0))
+        usages[index] = (tree_size + size, tree_files + files)
+        seen += files
+        unvisited.extend((index, path) for path in left)
+    return (usages, stack + unvisited)
+
+
+def get_tree_usages(
+    trees: Sequence[Tuple[str, Optional[os.stat_result]]],
+    jobs: int,
+    throttle: Optional[Throttle] = None,
+) -> List[TreeUsage]:
+    """get_tree_usage for every (path, lstat result or None) in trees, on a pool of jobs threads
+
+    The directories are handed out in chunks. A task walks a bounded number of entries and hands
+    back the directories it did not get to, so one huge tree still keeps every thread busy.
+    The results are the same as those of get_tree_usage.
+    """
+    totals = [TreeUsage(0, 0)] * len(trees)
+    directories = []
+    for index, (path, st) in enumerate(trees):
+        try:
+            if st is None:
+                st = os.lstat(path)
+        except OSError:
+            logging.error("Error getting size for %s", path)
+            continue
+        totals[index] = TreeUsage(entry_usage(st), 1)
+        if stat.S_ISDIR(st.st_mode):
+            directories.append((index, path))
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending: Set[Future] = set()
+
+        def submit(directories: List[Tuple[int, str]]) -> None:
+            # A few chunks per thread, so threads that finish early can pick up more work
+            chunk_size = max(1, len(directories) // (jobs * 4))
+            for start in range(0, len(directories), chunk_size):
+                chunk = directories[start : start + chunk_size]
+                pending.add(executor.submit(walk_directories, chunk, SPLIT_ENTRIES, throttle))
+
+        submit(directories)
+        while pending:
+            (done, _) = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                (usages, unvisited) = future.result()
+                for index, (size, files) in usages.items():
+                    totals[index] = TreeUsage(
+                        totals[index].size + size, totals[index].files + files
+                    )
+                submit(unvisited)
+    return totals
@@ -0,0 +1,109 @@
+import functools
+import logging
+import os
+import pwd
+import stat
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from autotrash.mounts import (
+    Mount,
+    find_all_mount_trashes,
+    list_mount_trashes,
+    mount_of,
+    run_probes,
+)
+
+
+class User(NamedTuple):
+    name: str
+    uid: int
+    gid: int
+    home: str
+    trash_paths: List[str]
+
+
+def home_trash(home: str) -> str:
+    """The trash directory in a home directory, as long as the user did not move it"""
+    return os.path.join(home, ".local", "share", "Trash")
+
+
+def owned_trash(trash_path: str, uid: int) -> Optional[str]:
+    """trash_path if it is a directory owned by user uid, None otherwise
+
+    Trash directories that are a link or belong to someone else are reported and skipped, so
+    the purging never touches files of another user.
+    """
+    try:
+        st = os.lstat(trash_path)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != uid:
+        logging.warning("Skipping %s, it is not a directory owned by user %d", trash_path, uid)
+        return None
+    return trash_path
+
+
+def owned_mount_trashes(mount_point: str) -> Dict[int, str]:
+    """list_mount_trashes, leaving out trash directories not owned by their user"""
+    return {
+        uid: trash_path
+        for (uid, trash_path) in list_mount_trashes(mount_point).items()
+        if owned_trash(trash_path, uid) is not None
+    }
+
+
+def find_users(
+    mounts: List[Mount], timeout: float, entries: Optional[Iterable[pwd.struct_passwd]] = None
+) -> List[User]:
+    """Every user in the password database with a trash directory, and those trash directories
+
+    These are the trash directory in the home directory and those in the top directories of
+    mounts. Users sharing a user id are only listed once. Homes and mounts on network filesystems
+    that do not answer within timeout seconds are skipped.
+    """
+    mount_trashes = find_all_mount_trashes(mounts, timeout, owned_mount_trashes)
+    passwd = []
+    seen = set()
+    for entry in pwd.getpwall() if entries is None else entries:
+        if entry.pw_uid not in seen and entry.pw_dir:
+            seen.add(entry.pw_uid)
+            passwd.append(entry)
+
+    def on_network(path: str) -> bool:
+        mount = mount_of(path, mounts)
+        return mount is not None and mount.network
+
+    home_trashes = run_probes(
+        [
+            (
+                entry.pw_dir,
+                on_network(entry.pw_dir),
+                functools.partial(owned_trash, home_trash(entry.pw_dir), entry.pw_uid),
+            )
+            for entry in passwd
+        ],
+        timeout,
+    )
+    users = []
+    for entry, trash_path in zip(passwd, home_trashes):
+        trash_paths = [] if trash_path is None else [trash_path]
+        trash_paths += mount_trashes.get(entry.pw_uid, [])
+        if trash_paths:
+            users.append(User(entry.pw_name, entry.pw_uid, entry.pw_gid, entry.pw_dir, trash_paths))
+    return users
+
+
+def drop_privileges(user: User) -> None:
+    """Continue as user, for good, with the environment of that user
+
+    XDG base directories of root no longer apply, so they are removed to get the defaults of user.
+    Does nothing to the credentials when already running as user.
+    """
+    if os.geteuid() != user.uid:
+        os.setgroups(os.getgrouplist(user.name, user.gid))
+        os.setgid(user.gid)
+        os.setuid(user.uid)
+    os.environ["HOME"] = user.home
+    os.environ["USER"] = user.name
+    for name in ["XDG_DATA_HOME", "XDG_CACHE_HOME", "XDG_CONFIG_HOME"]:
+        os.environ.pop(name, None)
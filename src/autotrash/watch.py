@@ -0,0 +1,372 @@
+import ctypes
+import ctypes.util
+import heapq
+import logging
+import os
+import select
+import struct
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from autotrash.trashinfo import TRASHINFO_EXTENSION, TrashInfo, read_trash_info
+from autotrash.usage import entry_usage, get_tree_usage
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+# .trashinfo files are created empty and then written, so only complete ones are read
+INFO_ADDED = IN_CLOSE_WRITE | IN_MOVED_TO
+ADDED = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+REMOVED = IN_DELETE | IN_MOVED_FROM
+GONE = IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED
+
+# struct inotify_event without the trailing name
+EVENT = struct.Struct("iIII")
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+class Inotify:
+    """The few inotify calls needed to watch trash directories, through ctypes"""
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        # AttributeError on systems without inotify
+        self.inotify_add_watch = libc.inotify_add_watch
+        self.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def read(self) -> List[Tuple[int, int, str]]:
+        """Return the (watch descriptor, mask, name) of every pending event"""
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(buffer):
+            (wd, mask, _, length) = EVENT.unpack_from(buffer, offset)
+            offset += EVENT.size
+            name = buffer[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def open_inotify() -> Optional[Inotify]:
+    try:
+        return Inotify()
+    except (AttributeError, OSError) as e:
+        logging.warning("Can not use inotify, checking trash directories periodically: %s", e)
+        return None
+
+
+class InfoEntry(NamedTuple):
+    mtime_ns: int
+    time: Optional[float]
+    size: int
+
+
+class WatchedTrash:
+    """In-memory model of one trash directory: deletion time of every entry and consumed sizes
+
+    Sizes are only kept when need_sizes is set, as they are only needed for --trash_limit.
+    """
+
+    def __init__(self, trash_info_path: str, need_sizes: bool) -> None:
+        self.info_path = trash_info_path
+        self.files_path = os.path.join(os.path.dirname(os.path.abspath(trash_info_path)), "files")
+        self.need_sizes = need_sizes
+        self.entries: Dict[str, InfoEntry] = {}
+        self.file_sizes: Dict[str, Tuple[int, int]] = {}
+        # Files created in place instead of moved in may still be growing, they are sized again
+        self.unsettled: Set[str] = set()
+        # Deletion times in expiry order, entries are checked against self.entries when popped
+        self.deadlines: List[Tuple[float, str]] = []
+        self.expired: Set[str] = set()
+        self.scanned: Optional[Tuple[int, int]] = None
+        self.due = False
+
+    def directory_times(self) -> Tuple[int, int]:
+        times = []
+        for path in (self.info_path, self.files_path):
+            try:
+                times.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                times.append(0)
+        return (times[0], times[1])
+
+    def rescan(self) -> None:
+        """Bring the model in line with the directories, only reading entries that changed"""
+        self.scanned = self.directory_times()
+        names = set()
+        try:
+            with os.scandir(self.info_path) as entries:
+                for entry in entries:
+                    if entry.name.endswith(TRASHINFO_EXTENSION):
+                        names.add(entry.name)
+                        self.info_added(entry.name)
+        except OSError as e:
+            logging.warning("Can not scan %s: %s", self.info_path, e)
+            self.scanned = None
+            return
+        for name in set(self.entries) - names:
+            self.info_removed(name)
+
+        names = set()
+        try:
+            with os.scandir(self.files_path) as entries:
+                for entry in entries:
+                    names.add(entry.name)
+                    self.file_added(entry.name, settled=True)
+        except FileNotFoundError:
+            pass
+        for name in set(self.file_sizes) - names:
+            self.file_removed(name)
+
+    def rescan_if_changed(self) -> None:
+        if self.directory_times() != self.scanned:
+            self.rescan()
+
+    def info_added(self, name: str, changed: bool = False) -> None:
+        path = os.path.join(self.info_path, name)
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            self.info_removed(name)
+            return
+        known = self.entries.get(name)
+        if not changed and known is not None and known.mtime_ns == st.st_mtime_ns:
+            return
+        trash_info = read_trash_info_quietly(path)
+        file_time = None
+        if trash_info is not None and trash_info.deletion_date:
+            file_time = trash_info.deletion_date.timestamp()
+            heapq.heappush(self.deadlines, (file_time, name))
+        else:
+            # process_path reports corrupt entries
+            self.due = True
+        self.entries[name] = InfoEntry(st.st_mtime_ns, file_time, entry_usage(st))
+        self.expired.discard(name)
+
+    def info_removed(self, name: str) -> None:
+        self.entries.pop(name, None)
+        self.expired.discard(name)
+
+    def file_added(self, name: str, settled: bool) -> None:
+        if not self.need_sizes:
+            return
+        path = os.path.join(self.files_path, name)
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            self.file_removed(name)
+            return
+        known = self.file_sizes.get(name)
+        if settled and known is not None and known[0] == st.st_ino and name not in self.unsettled:
+            return
+        self.file_sizes[name] = (st.st_ino, get_tree_usage(path, st).size)
+        if settled:
+            self.unsettled.discard(name)
+        else:
+            self.unsettled.add(name)
+
+    def file_removed(self, name: str) -> None:
+        self.file_sizes.pop(name, None)
+        self.unsettled.discard(name)
+
+    def settle(self) -> None:
+        for name in list(self.unsettled):
+            self.file_added(name, settled=True)
+
+    def total_size(self) -> int:
+        return sum(entry.size for entry in self.entries.values()) + sum(
+            size for (_, size) in self.file_sizes.values()
+        )
+
+    def expire(self, cutoff: float) -> Optional[float]:
+        """Mark entries deleted before cutoff as expired, return the deletion time of the next one"""
+        while self.deadlines:
+            (file_time, name) = self.deadlines[0]
+            entry = self.entries.get(name)
+            if entry is None or entry.time != file_time:
+                heapq.heappop(self.deadlines)
+            elif file_time <= cutoff:
+                heapq.heappop(self.deadlines)
+                self.expired.add(name)
+                self.due = True
+            else:
+                return file_time
+        return None
+
+
+def read_trash_info_quietly(path: str) -> Optional[TrashInfo]:
+    try:
+        return read_trash_info(path)
+    except Exception:
+        return None
+
+
+class Watcher:
+    """Run process for a trash directory as soon as one of its entries is older than --days, or
+    as soon as --min-free or --trash_limit is violated
+
+    Changes to the info/ and files/ directories are picked up through inotify, or by checking
+    them every interval seconds where inotify is not available. Free space is checked every
+    interval seconds.
+    """
+
+    def __init__(
+        self,
+        trash_info_paths: List[str],
+        options,
+        process: Callable[[str], None],
+        inotify: Optional[Inotify] = None,
+        get_fs_stat: Callable[[str], os.statvfs_result] = os.statvfs,
+        get_cur_time: Callable[[], float] = time.time,
+    ) -> None:
+        self.options = options
+        self.process = process
+        self.inotify = inotify
+        self.get_fs_stat = get_fs_stat
+        self.get_cur_time = get_cur_time
+        self.next_check = 0.0
+        self.trashes = [
+            WatchedTrash(trash_info_path, bool(options.trash_limit))
+            for trash_info_path in trash_info_paths
+        ]
+        # Watch descriptor to trash directory and whether it watches info/
+        self.watches: Dict[int, Tuple[WatchedTrash, bool]] = {}
+        for trash in self.trashes:
+            self.watch(trash)
+
+    def watch(self, trash: WatchedTrash) -> None:
+        if self.inotify is not None:
+            for path, is_info in ((trash.info_path, True), (trash.files_path, False)):
+                try:
+                    self.watches[self.inotify.add_watch(path, WATCH_MASK)] = (trash, is_info)
+                except OSError as e:
+                    logging.warning("Can not watch %s: %s", path, e)
+        trash.rescan()
+        logging.info("Watching %s with %d entries", trash.info_path, len(trash.entries))
+
+    def handle_events(self) -> None:
+        assert self.inotify is not None
+        for wd, mask, name in self.inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                logging.warning("Missed changes to the trash, scanning it again")
+                for trash in self.trashes:
+                    trash.rescan()
+                continue
+            if wd not in self.watches:
+                continue
+            (trash, is_info) = self.watches[wd]
+            if mask & GONE:
+                # The directory was removed or replaced, watch whatever is there on the next check
+                del self.watches[wd]
+                trash.scanned = None
+                continue
+            if is_info:
+                if not name.endswith(TRASHINFO_EXTENSION):
+                    continue
+                if mask & INFO_ADDED:
+                    trash.info_added(name, changed=True)
+                elif mask & REMOVED:
+                    trash.info_removed(name)
+            elif mask & ADDED:
+                trash.file_added(name, settled=bool(mask & IN_MOVED_TO))
+            elif mask & REMOVED:
+                trash.file_removed(name)
+            if self.options.trash_limit and mask & ADDED and self.over_trash_limit(trash):
+                trash.due = True
+
+    def over_trash_limit(self, trash: WatchedTrash) -> bool:
+        return trash.total_size() > self.options.trash_limit * 1024 * 1024
+
+    def check_free_space(self, trash: WatchedTrash) -> None:
+        if not (self.options.min_free or self.options.max_free):
+            return
+        try:
+            fs_stat = self.get_fs_stat(trash.info_path)
+        except OSError as e:
+            logging.warning("Can not determine free space of %s: %s", trash.info_path, e)
+            return
+        if fs_stat.f_bsize <= 0:
+            trash.due = True  # Let process_path report it
+            return
+        free_megabytes = int((fs_stat.f_bavail * fs_stat.f_bsize) / (1024 * 1024))
+        if self.options.min_free and free_megabytes < self.options.min_free:
+            trash.due = True
+        # Expired entries that were kept because of --max-free can go now
+        if self.options.max_free and free_megabytes <= self.options.max_free and trash.expired:
+            trash.due = True
+
+    def step(self, timeout: float) -> None:
+        """Handle changes and run process where needed, waiting at most timeout seconds"""
+        now = self.get_cur_time()
+        if now >= self.next_check:
+            self.next_check = now + self.options.watch_interval
+            for trash in self.trashes:
+                if self.inotify is None or trash.scanned is None:
+                    if trash.scanned is None and self.inotify is not None:
+                        self.watch(trash)
+                    else:
+                        trash.rescan_if_changed()
+                trash.settle()
+                if self.options.trash_limit and self.over_trash_limit(trash):
+                    trash.due = True
+                self.check_free_space(trash)
+
+        wake_up = self.next_check
+        for trash in self.trashes:
+            if self.options.days:
+                next_time = trash.expire(now - (self.options.days + 1) * SECONDS_PER_DAY)
+                if next_time is not None:
+                    wake_up = min(wake_up, next_time + (self.options.days + 1) * SECONDS_PER_DAY)
+            if trash.due:
+                trash.due = False
+                self.process(trash.info_path)
+
+        timeout = max(0.0, min(timeout, wake_up - self.get_cur_time()))
+        if self.inotify is None:
+            time.sleep(timeout)
+        elif select.select([self.inotify], [], [], timeout)[0]:
+            self.handle_events()
+
+    def run(self) -> None:
+        while True:
+            self.step(self.options.watch_interval)
@@ -0,0 +1,47 @@
+import datetime
+import os
+
+import pytest
+
+
+class Trash:
+    """A FreeDesktop.org trash directory on disk, for tests that use the real OsAccess functions"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.info_path = os.path.join(self.path, "info")
+        self.files_path = os.path.join(self.path, "files")
+        os.makedirs(self.info_path)
+        os.makedirs(self.files_path)
+
+    def trash_info(self, name: str) -> str:
+        return os.path.join(self.info_path, name + ".trashinfo")
+
+    def add_info(self, name: str, deletion_date: datetime.datetime) -> str:
+        trash_info = self.trash_info(name)
+        with open(trash_info, "w") as f:
+            f.write(
+                "[Trash Info]\nPath=/home/user/%s\nDeletionDate=%s\n"
+                % (name, deletion_date.strftime("%Y-%m-%dT%H:%M:%S"))
+            )
+        return trash_info
+
+    def add_file(self, name: str, deletion_date: datetime.datetime, size: int = 0) -> str:
+        with open(os.path.join(self.files_path, name), "wb") as f:
+            f.write(b"x" * size)
+        return self.add_info(name, deletion_date)
+
+    def add_directory(
+        self, name: str, deletion_date: datetime.datetime, files: int = 1, size: int = 0
+    ) -> str:
+        directory = os.path.join(self.files_path, name)
+        os.makedirs(os.path.join(directory, "sub"))
+        for i in range(files):
+            with open(os.path.join(directory, "sub", "file%d" % i), "wb") as f:
+                f.write(b"x" * size)
+        return self.add_info(name, deletion_date)
+
+
+@pytest.fixture
+def trash(tmp_path):
+    return Trash(tmp_path / "Trash")
@@ -0,0 +1,71 @@
+import asyncio
+import datetime
+import os
+
+import pytest
+from conftest import Trash
+
+from autotrash import app
+from autotrash.api import Policy, clean, clean_all_async
+from autotrash.options import OptionsError, new_parser
+
+
+class LowOnSpace(app.OsBackend):
+    """The real file system, but with only 1 MB free"""
+
+    def get_fs_stat(self, trash_info_path):
+        class FsStat:
+            f_bsize = 1024 * 1024
+            f_bavail = 1
+
+        return FsStat()
+
+
+def test_clean_gives_a_decision_per_entry_and_leaves_the_policy(trash):
+    now = datetime.datetime.now()
+    trash.add_file("old", now - datetime.timedelta(days=40), size=100)
+    trash.add_file("big", now - datetime.timedelta(days=2), size=3 * 1024 * 1024)
+    trash.add_file("new", now, size=100)
+    policy = Policy(days=30, min_free=3, stat=True)
+
+    result = clean(trash.path, policy, LowOnSpace())
+    assert not result.failed
+    assert [(d.name, d.reason) for d in result.purged] == [("old", "age"), ("big", "size")]
+    assert [d.name for d in result.kept] == ["new"]
+    assert result.purged[1].size is not None and result.purged[1].size > 3 * 1024 * 1024
+    assert result.stats.deleted_files == 2 and result.stats.total_files == 3
+    assert os.listdir(trash.files_path) == ["new"]
+    assert policy.delete == 0
+
+
+def test_min_free_leaves_the_options_alone(trash):
+    options = Policy(days=30, min_free=3).to_options()
+    app.process_path(trash.info_path, options, app.StatsClass(), LowOnSpace())
+    assert options.delete == 0
+
+
+def test_policy_is_checked_like_the_command_line():
+    with pytest.raises(OptionsError, match="at least one of"):
+        Policy().validate()
+    with pytest.raises(OptionsError, match="--stat"):
+        clean("unused", Policy(days=30, estimate=1.0))
+    (options, _) = new_parser().parse_args(["-d", "30", "--delete-first", "*.iso", "--index"])
+    policy = Policy.from_options(options)
+    assert policy == Policy(days=30, delete_first=("*.iso",), use_index=True)
+    assert vars(policy.to_options()) == vars(options)
+
+
+def test_clean_all_async_cleans_every_trash(tmp_path):
+    now = datetime.datetime.now()
+    trashes = [Trash(tmp_path / str(i)) for i in range(3)]
+    for trash in trashes:
+        trash.add_file("old", now - datetime.timedelta(days=40))
+        trash.add_file("new", now)
+
+    results = asyncio.run(
+        clean_all_async([trash.path for trash in trashes], Policy(days=30), workers=2)
+    )
+    assert [result.trash_path for result in results] == [trash.path for trash in trashes]
+    assert [[d.name for d in result.purged] for result in results] == [["old"]] * 3
+    for trash in trashes:
+        assert os.listdir(trash.files_path) == ["new"]
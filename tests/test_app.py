@@ -1,10 +1,19 @@
+import collections
 import datetime
+import optparse
 import os
 import random
+import re
+import sys
 import tempfile
 from typing import Dict
 
-from autotrash import app
+import pytest
+from conftest import Trash
+
+from autotrash import app, trashinfo
+from autotrash.directorysizes import DirectorySizes
+from autotrash.options import OptionsError, check_options, new_parser
 
 # ------------- mock functions & helpers --------------
 
@@ -12,45 +21,65 @@ mock_free_space_mb = 1000
 file_info_map: Dict[str, dict] = {}
 
 
-class OptionsClass:
-    days = 1
-    trash_path = None
-    max_free = 0
-    delete = 0
-    min_free = 0
-    verbose = True
-    quiet = False
-    check = False
-    dryrun = True
-    stat = False
-    delete_first: list = []
-    version = False
-    trash_limit = 0
+class OptionsClass(optparse.Values):
+    """The defaults of the command line, except for a verbose --dry-run of --days 1"""
+
+    def __init__(self):
+        super().__init__(new_parser().defaults)
+        self.days = 1
+        self.verbose = True
+        self.dryrun = True
+
+
+class MockEntry:
+    """Stands in for the os.DirEntry of a .trashinfo file, its path is the file_info_map key"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = path + ".trashinfo"
+
+    def stat(self, follow_symlinks=True):
+        return None
 
 
-def mock_get_file_names(trash_info_path):
+def mock_scan_info_directory(trash_info_path):
     keys = list(file_info_map.keys())
     # shuffling the list of files to make sure the order doesn't matter
     random.seed(4)
     random.shuffle(keys)
-    return keys
+    return [MockEntry(key) for key in keys]
+
+
+def mock_scan_files_directory(trash_files_path):
+    return {}
+
+
+def mock_get_file_entry(path):
+    return None
 
 
 def mock_get_cur_time():
     return datetime.datetime(2000, 12, 25).timestamp()
 
 
-def mock_get_consumed_size(file_name):
-    return file_info_map[file_name]["size"]
+def mock_get_consumed_sizes(trees, jobs=1):
+    for file_name, st in trees:
+        file_info_map[file_name]["sized"] = True
+    return [file_info_map[file_name]["size"] for (file_name, st) in trees]
 
 
-def mock_get_trash_info_date(value: str) -> datetime.datetime:
-    return datetime.datetime(2000, 12, 25) - datetime.timedelta(
+def mock_get_trash_info(value: str) -> trashinfo.TrashInfo:
+    deletion_date = datetime.datetime(2000, 12, 25) - datetime.timedelta(
         days=file_info_map[value]["days_old"]
     )
+    return trashinfo.TrashInfo(None, deletion_date)
+
 
+def mock_get_directory_sizes(trash_directory):
+    return DirectorySizes()
 
-def mock_purge(trash_directory, trash_name, dryrun):
+
+def mock_purge(trash_directory, trash_name, dryrun, target_entry):
     file_info_map[trash_name]["deleted"] = True
     return
 
@@ -70,6 +99,7 @@ def add_mock_file(name, days_old, size_mb):
         "days_old": days_old,
         "size": size_mb * 1024 * 1024,
         "deleted": False,
+        "sized": False,
     }
 
 
@@ -78,12 +108,17 @@ def run_end_to_end(options, expected_deleted):
 
     stats = app.StatsClass()
     os_access = app.OsAccess()
-    os_access.get_file_names = mock_get_file_names
+    os_access.scan_info_directory = mock_scan_info_directory
+    os_access.scan_files_directory = mock_scan_files_directory
+    os_access.iter_info_directory = mock_scan_info_directory
+    os_access.get_file_entry = mock_get_file_entry
     os_access.get_cur_time = mock_get_cur_time
-    os_access.get_consumed_size = mock_get_consumed_size
+    os_access.get_consumed_sizes = mock_get_consumed_sizes
     os_access.get_fs_stat = mock_get_fs_stat
-    os_access.get_trash_info_date = mock_get_trash_info_date
+    os_access.get_trash_info = mock_get_trash_info
+    os_access.get_directory_sizes = mock_get_directory_sizes
     os_access.purge = mock_purge
+    os_access.resume_purges = lambda trash_directory, dryrun: 0
 
     add_mock_file("a", 0, 1)
     add_mock_file("b", 1, 1)
@@ -143,6 +178,38 @@ def test_deleted_with_min_free():
     run_end_to_end(options, expected_deleted)
 
 
+# same test, sizing with multiple threads
+def test_deleted_with_delete_and_jobs():
+    options = OptionsClass()
+    options.days = 5
+    options.delete = 6
+    options.jobs = 4
+    expected_deleted = ["e", "f", "g"]
+    run_end_to_end(options, expected_deleted)
+
+
+# --delete and --min-free only size the entries they purge
+def test_only_purged_entries_are_sized():
+    for option in ["delete", "min_free"]:
+        options = OptionsClass()
+        options.days = 5
+        if option == "delete":
+            options.delete = 6
+        else:
+            options.min_free = mock_free_space_mb + 6
+        run_end_to_end(options, ["e", "f", "g"])
+        assert sorted(f for f in file_info_map if file_info_map[f]["sized"]) == ["e", "f", "g"]
+
+
+# --trash_limit needs the total size, so everything is sized
+def test_trash_limit_sizes_everything():
+    options = OptionsClass()
+    options.days = 5
+    options.trash_limit = 4
+    run_end_to_end(options, ["d", "e", "f", "g"])
+    assert all(file_info["sized"] for file_info in file_info_map.values())
+
+
 # test --min-free doesn't delete when there is enough free space
 def test_nothing_deleted_with_min_free():
     options = OptionsClass()
@@ -170,6 +237,280 @@ def test_nothing_deleted_with_trash_limit():
     run_end_to_end(options, expected_deleted)
 
 
+# same test, removing entries on a pool of threads
+def test_deleted_with_delete_and_purge_workers():
+    options = OptionsClass()
+    options.days = 5
+    options.delete = 6
+    options.dryrun = False
+    options.purge_workers = 4
+    expected_deleted = ["e", "f", "g"]
+    run_end_to_end(options, expected_deleted)
+
+
+# test files matching --delete-first are deleted before older ones
+def test_deleted_with_delete_first():
+    options = OptionsClass()
+    options.days = 5
+    options.min_free = mock_free_space_mb + 3
+    options.delete_first = ["b", "a"]
+    expected_deleted = ["a", "b", "g"]
+    run_end_to_end(options, expected_deleted)
+
+
+# -------- --delete-first ordering ----------
+
+
+def reference_delete_first_order(files, patterns):
+    """The documented order: matches of the first pattern, then the second etc., then the rest"""
+
+    def priority(entry):
+        name = entry.name
+        for index, pattern in enumerate(patterns):
+            if re.match(pattern, name):
+                return index
+        return len(patterns)
+
+    return sorted(files, key=priority)
+
+
+@pytest.mark.parametrize(
+    "patterns",
+    [
+        [r".*\.bak", r".*\.avi", "file1", ".*"],
+        # With groups of their own the patterns can not be combined
+        [r".*\.(bak|tmp)", r"(?i).*\.AVI", r"file(\d)\1"],
+    ],
+)
+def test_prioritize_keeps_documented_order(patterns):
+    random.seed(10)
+    extensions = [".bak", ".avi", ".AVI", ".tmp", ".txt", ""]
+    files = [
+        app.TrashEntry(
+            MockEntry("file%d%s" % (random.randrange(1000), random.choice(extensions))), None
+        )
+        for _ in range(100000)
+    ]
+    expected = reference_delete_first_order(files, patterns)
+    assert [id(f) for f in app.prioritize(files, patterns)] == [id(f) for f in expected]
+
+
+# -------- concurrent trash directories ----------
+
+
+def test_group_by_device(tmp_path):
+    first = tmp_path / "first"
+    second = tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    missing = str(tmp_path / "missing")
+    groups = app.group_by_device([str(first), missing, str(second)])
+    assert groups == [[str(first), str(second)], [missing]]
+
+
+# Also with the entries removed on a pool of threads, whose log lines belong to their directory
+@pytest.mark.parametrize("purge_workers", [1, 3])
+def test_process_paths_concurrently(tmp_path, caplog, purge_workers):
+    old = datetime.datetime.now() - datetime.timedelta(days=10)
+    trashes = [Trash(tmp_path / name) for name in ["one", "two", "three"]]
+    for trash in trashes:
+        for i in range(5):
+            trash.add_file("old%d" % i, old, size=10)
+        trash.add_file("new", datetime.datetime.now(), size=10)
+    os.rename(trashes[1].info_path, trashes[1].info_path + ".gone")
+
+    options = OptionsClass()
+    options.days = 5
+    options.stat = True
+    options.dryrun = False
+    options.purge_workers = purge_workers
+    stats = app.StatsClass()
+    caplog.set_level(app.VERBOSE)
+    groups = [[trash.info_path] for trash in trashes]
+    result = app.process_paths_concurrently(groups, options, stats, app.new_os_access(), 3)
+
+    assert result == 1
+    assert stats.total_files == 12
+    assert stats.deleted_files == 10
+    assert stats.failures == 1
+    for trash in [trashes[0], trashes[2]]:
+        assert os.listdir(trash.files_path) == ["new"]
+    assert "Failed to process %s" % trashes[1].info_path in caplog.text
+
+    # The log lines of every directory stay together
+    directories = [
+        trash.path
+        for record in caplog.records
+        for trash in trashes
+        if trash.path in record.getMessage()
+    ]
+    assert len(set(directories)) == 3
+    assert directories == sorted(directories, key=directories.index)
+
+
+# -------- syscall tests ----------
+
+
+class CountingEntry:
+    """Wraps an os.DirEntry and counts the stat system calls it has to make"""
+
+    def __init__(self, entry, stat_calls):
+        self.entry = entry
+        self.name = entry.name
+        self.path = entry.path
+        self.stat_calls = stat_calls
+        self.stat_results = {}
+
+    def stat(self, follow_symlinks=True):
+        if follow_symlinks not in self.stat_results:
+            self.stat_calls[self.path] += 1
+            self.stat_results[follow_symlinks] = self.entry.stat(follow_symlinks=follow_symlinks)
+        return self.stat_results[follow_symlinks]
+
+    def is_dir(self, follow_symlinks=True):
+        return self.entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def is_symlink(self):
+        return self.entry.is_symlink()
+
+
+def count_stat_calls(monkeypatch, os_access):
+    """Count path based stat calls made by autotrash itself, and stat calls on scanned entries"""
+    stat_calls = collections.Counter()
+
+    def counting(function):
+        def wrapper(path, *args, **kwargs):
+            if sys._getframe(1).f_globals["__name__"].startswith("autotrash"):
+                stat_calls[os.fspath(path)] += 1
+            return function(path, *args, **kwargs)
+
+        return wrapper
+
+    for module in [os, os.path]:
+        for name in ["stat", "lstat", "exists", "lexists", "isdir", "isfile", "islink"]:
+            if hasattr(module, name):
+                monkeypatch.setattr(module, name, counting(getattr(module, name)))
+
+    def scan_info_directory(trash_info_path):
+        return [
+            CountingEntry(entry, stat_calls) for entry in app.scan_info_directory(trash_info_path)
+        ]
+
+    def scan_files_directory(trash_files_path):
+        return {
+            name: CountingEntry(entry, stat_calls)
+            for name, entry in app.scan_files_directory(trash_files_path).items()
+        }
+
+    os_access.scan_info_directory = scan_info_directory
+    os_access.scan_files_directory = scan_files_directory
+    return stat_calls
+
+
+@pytest.mark.parametrize("dryrun", [True, False])
+def test_every_entry_is_stat_at_most_once(trash, monkeypatch, dryrun):
+    old = datetime.datetime.now() - datetime.timedelta(days=10)
+    new = datetime.datetime.now()
+    for deletion_date in [old, new]:
+        prefix = "old" if deletion_date == old else "new"
+        trash.add_file(prefix + "-file", deletion_date, size=10)
+        trash.add_directory(prefix + "-directory", deletion_date, files=3, size=10)
+        os.symlink("../files/%s-file" % prefix, os.path.join(trash.files_path, prefix + "-link"))
+        trash.add_info(prefix + "-link", deletion_date)
+        os.symlink("missing", os.path.join(trash.files_path, prefix + "-broken"))
+        trash.add_info(prefix + "-broken", deletion_date)
+        trash.add_info(prefix + "-orphan", deletion_date)
+
+    options = OptionsClass()
+    options.days = 5
+    options.stat = True
+    options.check = True
+    options.dryrun = dryrun
+    os_access = app.new_os_access()
+    stat_calls = count_stat_calls(monkeypatch, os_access)
+    stats = app.StatsClass()
+    scanned = [os.path.join(trash.info_path, name) for name in os.listdir(trash.info_path)]
+    scanned += [os.path.join(trash.files_path, name) for name in os.listdir(trash.files_path)]
+
+    assert app.process_path(trash.info_path, options, stats, os_access) == 0
+
+    assert stats.total_files == 10
+    assert stats.deleted_files == 5
+    assert sum(stat_calls[path] for path in scanned) == 18
+    for path in scanned:
+        assert stat_calls[path] <= 1, path
+
+
+@pytest.mark.parametrize("purge_workers", [1, 3])
+def test_age_only_purges_while_reading_info(trash, purge_workers):
+    now = datetime.datetime.now()
+    for i in range(20):
+        trash.add_file("file%02d" % i, now - datetime.timedelta(days=i), size=10)
+        trash.add_directory("directory%02d" % i, now - datetime.timedelta(days=i, hours=1))
+
+    options = OptionsClass()
+    options.days = 9
+    options.dryrun = False
+    options.purge_workers = purge_workers
+    os_access = app.new_os_access()
+
+    def scan_files_directory(trash_files_path):
+        raise AssertionError("files/ is listed")
+
+    os_access.scan_files_directory = scan_files_directory
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, os_access) == 0
+    assert stats.entries_scanned == 40
+    remaining = sorted(
+        ["file%02d" % i for i in range(10)] + ["directory%02d" % i for i in range(10)]
+    )
+    assert sorted(os.listdir(trash.files_path)) == remaining
+    assert sorted(os.listdir(trash.info_path)) == [name + ".trashinfo" for name in remaining]
+
+
+def test_recheck_free_needs_min_free():
+    options = OptionsClass()
+    options.days = 30
+    options.recheck_free = 10
+    with pytest.raises(OptionsError, match="--recheck-free without --min-free"):
+        check_options(None, options)
+    options.min_free = 100
+    check_options(None, options)
+
+
+@pytest.mark.parametrize("recheck_free, purged", [(1, 5), (2, 6), (4, 8)])
+def test_min_free_checks_free_space_while_purging(trash, recheck_free, purged):
+    now = datetime.datetime.now()
+    for i in range(20):
+        trash.add_file("file%02d" % i, now - datetime.timedelta(hours=i), size=10)
+
+    class FreeSpace:
+        f_bsize = 1024 * 1024
+
+        @property
+        def f_bavail(self):
+            # A megabyte for every trashed file that is gone
+            return 100 + 20 - len(os.listdir(trash.files_path))
+
+    def get_consumed_sizes(trees, jobs=1):
+        raise AssertionError("entries are sized")
+
+    options = OptionsClass()
+    options.days = 0
+    options.min_free = 105
+    options.recheck_free = recheck_free
+    options.dryrun = False
+    os_access = app.new_os_access()
+    os_access.get_fs_stat = lambda path: FreeSpace()
+    os_access.get_consumed_sizes = get_consumed_sizes
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, os_access) == 0
+    # The oldest entries are purged, up to the first check that finds enough free space
+    assert sorted(os.listdir(trash.files_path)) == ["file%02d" % i for i in range(20 - purged)]
+    assert stats.deleted_files == purged
+    assert options.delete == 0
+
+
 # -------- original tests ----------
 
 
@@ -191,8 +532,10 @@ def should_survive_config_with_zeros():
 
 
 def should_read_datetime_for_all_known_formats():
-    assert app.read_datetime("2019-10-17T15:33:57") == datetime.datetime(2019, 10, 17, 15, 33, 57)
-    assert app.read_datetime("2019-10-17T15:33:57.710Z") == datetime.datetime(
+    assert trashinfo.read_datetime("2019-10-17T15:33:57") == datetime.datetime(
+        2019, 10, 17, 15, 33, 57
+    )
+    assert trashinfo.read_datetime("2019-10-17T15:33:57.710Z") == datetime.datetime(
         2019, 10, 17, 15, 33, 57, 710000
     )
 
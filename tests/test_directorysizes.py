@@ -0,0 +1,80 @@
+import datetime
+import os
+
+from test_app import OptionsClass
+
+from autotrash import app
+from autotrash.directorysizes import DirectorySizes, decode_name, encode_name
+
+
+def test_percent_encode_directory_names():
+    assert encode_name("plain") == "plain"
+    assert encode_name("with space") == "with%20space"
+    assert encode_name("100%") == "100%25"
+    assert decode_name(encode_name("\udcff weird\nname")) == "\udcff weird\nname"
+
+
+def test_round_trip(tmp_path):
+    directory_sizes = DirectorySizes.load(str(tmp_path))
+    directory_sizes.update("a directory", 4096, 1571320437)
+    directory_sizes.save()
+
+    with open(tmp_path / "directorysizes") as f:
+        assert f.read() == "4096 1571320437 a%20directory\n"
+    assert os.listdir(tmp_path) == ["directorysizes"]
+
+    reloaded = DirectorySizes.load(str(tmp_path))
+    assert reloaded.lookup("a directory", 1571320437) == 4096
+    assert reloaded.lookup("a directory", 1571320438) is None
+    assert reloaded.lookup("unknown", 1571320437) is None
+
+
+def test_ignores_malformed_lines(tmp_path):
+    with open(tmp_path / "directorysizes", "w") as f:
+        f.write("garbage\n12 x name\n10 20 good\n\n")
+    assert DirectorySizes.load(str(tmp_path)).entries == {"good": (10, 20)}
+
+
+def test_prunes_entries_that_were_not_seen(tmp_path):
+    with open(tmp_path / "directorysizes", "w") as f:
+        f.write("10 20 kept\n30 40 gone\n")
+    directory_sizes = DirectorySizes.load(str(tmp_path))
+    directory_sizes.lookup("kept", 20)
+    directory_sizes.save(prune=True)
+    assert DirectorySizes.load(str(tmp_path)).entries == {"kept": (10, 20)}
+
+
+def run_stat(trash, os_access):
+    options = OptionsClass()
+    options.days = 0
+    options.stat = True
+    options.dryrun = False
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, os_access) == 0
+    return stats
+
+
+def test_process_path_uses_and_fills_the_cache(trash):
+    trash.add_directory("build", datetime.datetime(2000, 1, 1), files=10, size=100)
+    trash.add_file("single", datetime.datetime(2000, 1, 1), size=10)
+
+    sized_paths = []
+
+    def counting_get_consumed_sizes(trees, jobs=1):
+        sized_paths.extend(path for (path, st) in trees)
+        return app.get_consumed_sizes(trees, jobs)
+
+    os_access = app.new_os_access()
+    os_access.get_consumed_sizes = counting_get_consumed_sizes
+
+    first = run_stat(trash, os_access)
+    directory = os.path.join(trash.files_path, "build")
+    assert directory in sized_paths
+    cached = DirectorySizes.load(trash.path)
+    assert list(cached.entries) == ["build"]
+    assert cached.entries["build"][0] == app.get_consumed_size(directory)
+
+    sized_paths.clear()
+    second = run_stat(trash, os_access)
+    assert directory not in sized_paths
+    assert second.total_size == first.total_size
@@ -0,0 +1,97 @@
+import datetime
+import logging
+import os
+import random
+
+import pytest
+from test_app import OptionsClass
+
+from autotrash import app
+from autotrash.estimate import Budget, Estimate, estimate_total, estimate_tree
+from autotrash.usage import get_tree_usage
+
+
+def make_tree(path, sizes):
+    os.makedirs(path)
+    for i, size in enumerate(sizes):
+        with open(os.path.join(path, "file%d" % i), "wb") as f:
+            f.write(b"x" * size)
+
+
+def test_estimate_total_is_exact_for_a_full_sample():
+    sample = {"a": Estimate(100, 0.0), "b": Estimate(300, 0.0)}
+    assert estimate_total(2, sample) == Estimate(400, 0.0, True)
+    assert estimate_total(1, sample, {"b"}) == Estimate(300, 0.0, True)
+    # Half of the population sampled: scaled up, with the spread of the sample as variance
+    (size, variance, exact) = estimate_total(4, sample)
+    assert (size, exact) == (800, False)
+    assert variance == 4 * 4 * (1 - 2 / 4) * 20000 / 2
+    # Nothing in the domain: nothing to estimate, and no sample standing in for it
+    assert estimate_total(0, sample, set()) == Estimate(0.0, 0.0, True)
+
+
+def test_estimate_tree_samples_the_children_of_huge_directories(tmp_path):
+    rng = random.Random(22)
+    sizes = [rng.randrange(0, 40 * 4096) for _ in range(500)]
+    make_tree(str(tmp_path / "huge"), sizes)
+    path = str(tmp_path / "huge")
+    budget = Budget(60.0)
+    estimate = estimate_tree(path, os.lstat(path), rng, budget)
+    actual = get_tree_usage(path).size
+    assert not estimate.exact
+    assert abs(estimate.size - actual) <= estimate.margin
+    # The listing and the sampled children, instead of all 500 of them
+    assert budget.calls == 33
+
+
+def test_estimate_tree_of_small_directories_is_exact(tmp_path):
+    make_tree(str(tmp_path / "small"), [1, 5000, 10000])
+    path = str(tmp_path / "small")
+    estimate = estimate_tree(path, os.lstat(path), random.Random(), Budget(60.0))
+    assert estimate == Estimate(get_tree_usage(path).size, 0.0, True)
+
+
+def run_stat(trash, estimate, days=30):
+    options = OptionsClass()
+    options.days = days
+    options.dryrun = True
+    options.stat = True
+    options.estimate = estimate
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, app.new_os_access()) == 0
+    return stats
+
+
+def test_estimate_extrapolates_the_stat_totals(trash, caplog):
+    now = datetime.datetime.now()
+    for i in range(100):
+        trash.add_file("file%02d" % i, now - datetime.timedelta(days=i), size=5000)
+    exact = run_stat(trash, 0)
+    # Too little time to size more than the minimal sample, but every entry has the same size
+    estimated = run_stat(trash, 1e-9)
+    assert estimated.total_files == exact.total_files == 100
+    assert estimated.deleted_files == exact.deleted_files == 69
+    assert estimated.total_size == exact.total_size
+    assert estimated.deleted_size == exact.deleted_size
+
+    for i in range(0, 100, 2):
+        with open(os.path.join(trash.files_path, "file%02d" % i), "ab") as f:
+            f.write(b"x" * 100000)
+    caplog.set_level(logging.INFO)
+    stats = run_stat(trash, 1e-9)
+    assert stats.total_size_variance > 0
+    assert stats.deleted_size_variance > 0
+    app.log_stats(stats)
+    assert " ± " in caplog.text
+
+
+@pytest.mark.parametrize("days, deleted_files", [(3000, 0), (1, 100)])
+def test_estimate_when_nothing_or_everything_is_purged(trash, days, deleted_files):
+    now = datetime.datetime.now()
+    for i in range(100):
+        trash.add_file("file%02d" % i, now - datetime.timedelta(days=i + 2), size=5000)
+    exact = run_stat(trash, 0, days)
+    estimated = run_stat(trash, 1e-9, days)
+    assert estimated.deleted_files == exact.deleted_files == deleted_files
+    assert estimated.total_size == exact.total_size
+    assert estimated.deleted_size == exact.deleted_size
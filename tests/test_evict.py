@@ -0,0 +1,87 @@
+import datetime
+import logging
+import os
+
+import pytest
+from test_app import OptionsClass
+
+from autotrash import app
+from autotrash.api import Policy
+from autotrash.evict import select_for_target
+from autotrash.options import OptionsError
+
+DAY = 24 * 3600.0
+
+
+def sized_entry(name, days_old, size, now):
+    entry = app.TrashEntry(None, None, now - days_old * DAY)
+    entry.size = size
+    return (name, entry)
+
+
+def test_select_for_target_by_policy():
+    now = 1e9
+    entries = dict(
+        sized_entry(*args, now=now) for args in [("tiny", 90, 1), ("old", 60, 40), ("big", 10, 100)]
+    )
+    ordered = list(entries.values())
+    (selected, rest) = select_for_target(ordered, 50, "oldest", now)
+    assert selected == [entries["tiny"], entries["old"], entries["big"]]
+    assert rest == []
+    (selected, rest) = select_for_target(ordered, 50, "largest", now)
+    assert selected == [entries["big"]]
+    assert rest == [entries["tiny"], entries["old"]]
+    # 60 days times 40 bytes outweighs 10 days times 100 bytes
+    (selected, _) = select_for_target(ordered, 50, "weighted", now)
+    assert selected == [entries["old"], entries["big"]]
+    # big is too young to be picked for its size, but needed once the older ones are not enough
+    (selected, _) = select_for_target(ordered, 30, "largest", now, min_age=30 * DAY)
+    assert selected == [entries["old"]]
+    (selected, _) = select_for_target(ordered, 50, "largest", now, min_age=30 * DAY)
+    assert selected == [entries["old"], entries["tiny"], entries["big"]]
+
+
+def fill(trash, now):
+    for i in range(50):
+        trash.add_file("tiny%02d" % i, now - datetime.timedelta(days=60 - i), size=1000)
+    for i in range(3):
+        trash.add_file("large%d" % i, now - datetime.timedelta(days=5 + i), size=1024 * 1024)
+
+
+@pytest.mark.parametrize("evict, purged", [("oldest", 52), ("largest", 2), ("weighted", 2)])
+def test_evict_reaches_the_target_with_fewer_deletions(trash, evict, purged):
+    fill(trash, datetime.datetime.now())
+    options = OptionsClass()
+    options.days = 0
+    options.dryrun = False
+    options.delete = 2
+    options.evict = evict
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, app.new_os_access()) == 0
+    assert len(os.listdir(trash.files_path)) == 53 - purged
+    if evict != "oldest":
+        # Two of the large entries were enough, none of the small ones was touched
+        assert len([name for name in os.listdir(trash.files_path) if name.startswith("tiny")]) == 50
+
+
+def test_dry_run_shows_what_every_policy_would_purge(trash, caplog):
+    fill(trash, datetime.datetime.now())
+    options = OptionsClass()
+    options.days = 0
+    options.delete = 2
+    options.stat = True
+    caplog.set_level(logging.INFO)
+    assert app.process_path(trash.info_path, options, app.StatsClass(), app.new_os_access()) == 0
+    assert "Evicting oldest first would purge 52 entries" in caplog.text
+    assert "Evicting largest first would purge 2 entries (2.0 MiB)" in caplog.text
+    assert "Evicting weighted first would purge 2 entries" in caplog.text
+    assert len(os.listdir(trash.files_path)) == 53
+
+
+def test_evict_needs_a_byte_target():
+    with pytest.raises(OptionsError, match="--evict without"):
+        Policy(days=30, evict="largest").validate()
+    with pytest.raises(OptionsError, match="--recheck-free"):
+        Policy(min_free=100, recheck_free=10, evict="weighted").validate()
+    with pytest.raises(OptionsError, match="--evict-min-age"):
+        Policy(delete=100, evict_min_age=7).validate()
@@ -0,0 +1,137 @@
+import datetime
+import functools
+import os
+import sqlite3
+
+import pytest
+from test_app import OptionsClass
+
+from autotrash import app
+from autotrash.index import TrashIndex, index_path
+
+
+def test_round_trip(trash, tmp_path):
+    index = TrashIndex.open(trash.path, str(tmp_path))
+    assert index is not None and index.entries == {}
+    index.update("a.trashinfo", 10, 1571320437.0, "/home/user/\udcff", 4096)
+    index.update("b.trashinfo", 20, 1571320438.0, None)
+    index.save()
+    index.close()
+
+    reopened = TrashIndex.open(trash.path, str(tmp_path))
+    assert reopened is not None
+    assert reopened.lookup("a.trashinfo", 10) == (10, 1571320437.0, "/home/user/\udcff", 4096)
+    assert reopened.lookup("a.trashinfo", 11) is None
+    assert reopened.lookup("b.trashinfo", 20) == (20, 1571320438.0, None, None)
+    reopened.remove("b.trashinfo")
+    reopened.save()
+    reopened.close()
+
+    assert list(TrashIndex.open(trash.path, str(tmp_path)).entries) == ["a.trashinfo"]
+
+
+def test_rebuilds_corrupt_index(trash, tmp_path, caplog):
+    with open(index_path(trash.path, str(tmp_path)), "wb") as f:
+        f.write(b"this is not a database" * 100)
+    index = TrashIndex.open(trash.path, str(tmp_path))
+    assert index is not None and index.entries == {}
+    assert "Rebuilding corrupt index" in caplog.text
+
+
+def test_rebuilds_index_of_recreated_trash(trash, tmp_path):
+    index = TrashIndex.open(trash.path, str(tmp_path))
+    index.update("a.trashinfo", 10, 1571320437.0, None, 4096)
+    index.save()
+    index.close()
+
+    # Keep the old directory around so its inode number is not reused
+    os.rename(trash.info_path, str(tmp_path / "old-info"))
+    os.mkdir(trash.info_path)
+    assert TrashIndex.open(trash.path, str(tmp_path)).entries == {}
+
+
+def test_process_path_only_reads_changed_entries(trash, tmp_path):
+    old = datetime.datetime.now() - datetime.timedelta(days=10)
+    for i in range(5):
+        trash.add_directory("directory%d" % i, old, files=3, size=100)
+        trash.add_file("file%d" % i, datetime.datetime.now(), size=100)
+
+    read = []
+    sized = []
+
+    def get_trash_info(fname):
+        read.append(os.path.basename(fname))
+        return app.get_trash_info(fname)
+
+    def get_consumed_sizes(trees, jobs=1):
+        sized.extend(os.path.basename(path) for (path, st) in trees)
+        return app.get_consumed_sizes(trees, jobs)
+
+    os_access = app.new_os_access()
+    os_access.get_trash_info = get_trash_info
+    os_access.get_consumed_sizes = get_consumed_sizes
+    os_access.get_index = functools.partial(TrashIndex.open, directory=str(tmp_path / "cache"))
+
+    def run():
+        read.clear()
+        sized.clear()
+        options = OptionsClass()
+        options.days = 0
+        options.stat = True
+        options.index = True
+        stats = app.StatsClass()
+        assert app.process_path(trash.info_path, options, stats, os_access) == 0
+        return stats
+
+    first = run()
+    assert len(read) == 10
+    assert len(sized) == 20
+
+    second = run()
+    assert read == []
+    assert sized == []
+    assert second.total_size == first.total_size
+
+    os.unlink(trash.trash_info("file0"))
+    os.unlink(os.path.join(trash.files_path, "file0"))
+    trash.add_file("new", datetime.datetime.now(), size=100)
+    run()
+    assert read == ["new.trashinfo"]
+    assert sorted(sized) == ["new", "new.trashinfo"]
+    index = TrashIndex.open(trash.path, str(tmp_path / "cache"))
+    assert "file0.trashinfo" not in index.entries
+    assert len(index.entries) == 10
+
+
+@pytest.mark.parametrize("stat", [False, True])
+def test_corrupt_trash_info_still_closes_and_saves_the_index(trash, tmp_path, stat):
+    now = datetime.datetime.now()
+    for i in range(5):
+        trash.add_file("file%d" % i, now, size=100)
+    with open(trash.trash_info("zz-corrupt"), "w") as f:
+        f.write("[Trash Info]\n")
+    opened = []
+
+    def get_index(trash_directory):
+        index = TrashIndex.open(trash_directory, str(tmp_path / "cache"))
+        opened.append(index)
+        return index
+
+    def scan_info_directory(trash_info_path):
+        # In order of name, so the corrupt .trashinfo file is read last
+        return sorted(app.scan_info_directory(trash_info_path), key=lambda entry: entry.name)
+
+    os_access = app.new_os_access()
+    os_access.get_index = get_index
+    os_access.scan_info_directory = scan_info_directory
+    os_access.iter_info_directory = scan_info_directory
+    options = OptionsClass()
+    options.days = 30
+    options.stat = stat
+    options.index = True
+    assert app.process_path(trash.info_path, options, app.StatsClass(), os_access) == 0
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].connection.execute("SELECT 1")
+    # What was read before the corrupt .trashinfo file is kept
+    index = TrashIndex.open(trash.path, str(tmp_path / "cache"))
+    assert sorted(index.entries) == ["file%d.trashinfo" % i for i in range(5)]
@@ -0,0 +1,92 @@
+import datetime
+import json
+import os
+import sys
+
+from test_app import OptionsClass
+
+from autotrash import app
+from autotrash.metrics import prometheus_text, write_atomically
+from autotrash.throttle import Throttle
+
+
+def test_process_path_records_phases_and_counters(trash, tmp_path):
+    now = datetime.datetime.now()
+    for i in range(5):
+        trash.add_directory("directory%d" % i, now - datetime.timedelta(days=10 + i), size=5000)
+        trash.add_file("file%d" % i, now - datetime.timedelta(days=i), size=5000)
+
+    options = OptionsClass()
+    options.days = 7
+    options.dryrun = False
+    options.metrics_textfile = str(tmp_path / "autotrash.prom")
+    throttle = Throttle()
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, app.new_os_access(throttle)) == 0
+
+    directory = stats.directories[trash.info_path]
+    assert directory.entries_scanned == stats.entries_scanned == 10
+    # With only --days, info/ is read while purging
+    assert set(directory.phases) == {"parsing", "sizing", "purging"}
+    assert stats.phases == directory.phases
+    # The purged directories were sized, so the freed bytes are known
+    assert stats.bytes_freed == stats.bytes_sized > 5 * 5000
+    assert len(os.listdir(trash.files_path)) == 5
+    # Two listings, ten .trashinfo reads, sizing and removing five directories
+    assert throttle.calls > 12
+
+
+def test_stats_merge_keeps_directories():
+    first = app.StatsClass()
+    first.entries_scanned = 3
+    first.add_time("listing", 1.0)
+    first.directories["a"] = app.StatsClass()
+    second = app.StatsClass()
+    second.entries_scanned = 4
+    second.add_time("listing", 0.5)
+    second.directories["b"] = app.StatsClass()
+    first.merge(second)
+    assert first.entries_scanned == 7
+    assert first.phases == {"listing": 1.5}
+    assert sorted(first.directories) == ["a", "b"]
+
+
+def test_prometheus_text_escapes_directory_labels():
+    stats = app.StatsClass()
+    directory = app.StatsClass()
+    directory.bytes_freed = 4096
+    directory.add_time("purging", 0.25)
+    stats.merge(directory)
+    stats.directories['/mnt/a "b"\\c/info'] = directory
+    text = prometheus_text(stats, 1700000000.0, 1.5)
+    assert 'autotrash_freed_bytes{directory="/mnt/a \\"b\\"\\\\c/info"} 4096\n' in text
+    assert 'autotrash_phase_seconds{phase="purging"} 0.25\n' in text
+    assert "autotrash_duration_seconds 1.5\n" in text
+    assert text.count("# TYPE autotrash_freed_bytes gauge") == 1
+
+
+def test_write_atomically_replaces_the_file(tmp_path):
+    path = str(tmp_path / "autotrash.prom")
+    write_atomically(path, "old\n")
+    write_atomically(path, "new\n")
+    with open(path) as f:
+        assert f.read() == "new\n"
+    assert os.listdir(str(tmp_path)) == ["autotrash.prom"]
+
+
+def test_cli_writes_metrics(trash, tmp_path, monkeypatch):
+    trash.add_file("old", datetime.datetime.now() - datetime.timedelta(days=40), size=100)
+    metrics_json = str(tmp_path / "metrics.json")
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["autotrash", "-d", "30", "-T", trash.path, "--metrics-json", metrics_json],
+    )
+    assert app.cli() == 0
+    with open(metrics_json) as f:
+        document = json.load(f)
+    assert document["counters"]["deleted_files"] == 1
+    assert document["counters"]["syscalls"] > 0
+    assert "discovery" in document["phases"]
+    assert document["directories"][trash.info_path]["counters"]["bytes_freed"] > 0
+    assert "syscalls" not in document["directories"][trash.info_path]["counters"]
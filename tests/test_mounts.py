@@ -0,0 +1,75 @@
+import threading
+import time
+
+from autotrash import mounts
+from autotrash.mounts import Mount, find_mount_trashes, parse_mountinfo, writable_mounts
+
+MOUNTINFO = b"""\
+22 28 0:20 / /proc rw,nosuid,nodev,noexec,relatime shared:12 - proc proc rw
+23 28 0:21 / /sys rw,nosuid,nodev,noexec,relatime shared:2 - sysfs sysfs rw
+28 1 8:2 / / rw,relatime shared:1 - ext4 /dev/sda2 rw,errors=remount-ro
+29 28 8:3 / /home rw,relatime shared:3 - ext4 /dev/sda3 rw
+30 28 8:3 /user/media /srv/media rw,relatime shared:3 - ext4 /dev/sda3 rw
+31 28 8:3 / /mnt/home\\040again rw,relatime shared:3 - ext4 /dev/sda3 rw
+32 28 7:1 / /snap/core/1 ro,nodev,relatime shared:4 - squashfs /dev/loop1 ro
+33 28 0:40 / /mnt/nfs rw,relatime shared:5 - nfs4 server:/export rw,vers=4.2
+34 28 0:41 / /mnt/ssh rw,nosuid,nodev shared:6 - fuse.sshfs user@host: rw,user_id=1000
+35 28 0:42 / /media/usb rw shared:7 master:1 - vfat /dev/sdb1 ro
+36 28 0:43 / /tmp rw shared:8 - tmpfs tmpfs rw
+37 28 0:44 / /tmp rw shared:9 - tmpfs tmpfs rw
+"""
+
+
+def test_parse_mountinfo():
+    parsed = parse_mountinfo(MOUNTINFO.splitlines())
+    assert parsed[2] == Mount("8:2", "/", "/", "ext4", False)
+    assert parsed[4].root == "/user/media"
+    assert parsed[5].mount_point == "/mnt/home again"
+    assert parsed[6].read_only
+    # Read-only filesystem, even though the mount itself is not
+    assert parsed[9].read_only
+    assert [mount.network for mount in parsed[7:10]] == [True, True, False]
+
+
+def test_writable_mounts_skips_pseudo_read_only_hidden_and_duplicate_mounts():
+    mount_points = [
+        mount.mount_point for mount in writable_mounts(parse_mountinfo(MOUNTINFO.splitlines()))
+    ]
+    assert mount_points == ["/", "/home", "/srv/media", "/mnt/nfs", "/mnt/ssh", "/tmp"]
+
+
+def test_find_mount_trashes_finds_both_kinds_of_trash_directory(tmp_path):
+    (tmp_path / "a" / ".Trash" / "1000").mkdir(parents=True)
+    (tmp_path / "b" / ".Trash-1000").mkdir(parents=True)
+    (tmp_path / "c" / ".Trash-1001").mkdir(parents=True)
+    found = find_mount_trashes(
+        [Mount("0:1", "/", str(tmp_path / name), "ext4", False) for name in "abc"], 1000, 1.0
+    )
+    assert found == [str(tmp_path / "a" / ".Trash" / "1000"), str(tmp_path / "b" / ".Trash-1000")]
+
+
+def test_find_mount_trashes_skips_hanging_network_mounts(caplog):
+    release = threading.Event()
+
+    def find(mount_point, uid):
+        if mount_point == "/mnt/dead":
+            release.wait()
+        return mount_point + "/.Trash-%d" % uid
+
+    found_mounts = [
+        Mount("0:40", "/", "/mnt/dead", "nfs4", False),
+        Mount("8:2", "/", "/", "ext4", False),
+        Mount("0:41", "/", "/mnt/ssh", "fuse.sshfs", False),
+    ]
+    start = time.monotonic()
+    found = find_mount_trashes(found_mounts, 1000, 0.2, find)
+    assert time.monotonic() - start < 5
+    release.set()
+    assert found == ["//.Trash-1000", "/mnt/ssh/.Trash-1000"]
+    assert "Skipping /mnt/dead" in caplog.text
+
+
+def test_read_mountinfo(tmp_path):
+    path = tmp_path / "mountinfo"
+    path.write_bytes(MOUNTINFO)
+    assert len(mounts.read_mountinfo(str(path))) == 12
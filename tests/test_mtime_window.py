@@ -0,0 +1,64 @@
+import datetime
+import os
+import random
+import time
+
+from conftest import Trash
+from test_app import OptionsClass
+
+from autotrash import app
+
+
+def fill(trash, now):
+    """Entries trashed over the last 60 days, their .trashinfo mtime close to their DeletionDate"""
+    rng = random.Random(21)
+    for i in range(300):
+        deletion_date = now - datetime.timedelta(seconds=rng.uniform(0, 60 * 24 * 3600))
+        trash_info = trash.add_file("file%03d" % i, deletion_date)
+        mtime = deletion_date.timestamp() + rng.uniform(-2 * 3600, 2 * 3600)
+        os.utime(trash_info, (mtime, mtime))
+    # mtimes that say nothing about the DeletionDate: in the future and reset to the epoch
+    trash_info = trash.add_file("future", now - datetime.timedelta(days=40))
+    os.utime(trash_info, (now.timestamp() + 10 * 24 * 3600,) * 2)
+    trash_info = trash.add_file("epoch", now - datetime.timedelta(days=1))
+    os.utime(trash_info, (0, 0))
+
+
+def test_mtime_window_purges_the_same_entries_as_reading_every_trash_info(tmp_path):
+    now = datetime.datetime.now()
+    trashes = [Trash(tmp_path / "parsed"), Trash(tmp_path / "by mtime")]
+    for trash in trashes:
+        fill(trash, now)
+
+    os_access = app.new_os_access()
+    os_access.get_cur_time = lambda: now.timestamp()
+    options = OptionsClass()
+    options.days = 30
+    options.dryrun = False
+    parsed = app.StatsClass()
+    assert app.process_path(trashes[0].info_path, options, parsed, os_access) == 0
+    options.mtime_window = 6
+    by_mtime = app.StatsClass()
+    assert app.process_path(trashes[1].info_path, options, by_mtime, os_access) == 0
+
+    remaining = [sorted(os.listdir(trash.files_path)) for trash in trashes]
+    assert remaining[0] == remaining[1]
+    assert "future" not in remaining[1] and "epoch" in remaining[1]
+    assert 100 < len(remaining[1]) < 200
+    assert parsed.trash_infos_read == 302
+    # Only those near the cutoff and the two with a useless mtime are read
+    assert by_mtime.trash_infos_read < 30
+
+
+def test_mtime_window_is_ignored_when_sizes_are_needed(trash):
+    trash_info = trash.add_file("young", datetime.datetime.now(), size=10)
+    os.utime(trash_info, (time.time() - 90 * 24 * 3600,) * 2)
+    options = OptionsClass()
+    options.days = 30
+    options.dryrun = False
+    options.stat = True
+    options.mtime_window = 6
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, app.new_os_access()) == 0
+    assert os.listdir(trash.files_path) == ["young"]
+    assert stats.trash_infos_read == 1
@@ -0,0 +1,147 @@
+import datetime
+import os
+import time
+
+from test_app import OptionsClass
+
+from autotrash import app
+
+
+def later_os_access():
+    """OsAccess for a run long enough after the orphans were made for them to be settled"""
+    os_access = app.new_os_access()
+    os_access.get_cur_time = lambda: time.time() + 2 * app.ORPHAN_GRACE_SECONDS
+    return os_access
+
+
+def add_orphans(trash):
+    with open(os.path.join(trash.files_path, "lost"), "wb") as f:
+        f.write(b"x" * 10000)
+    os.makedirs(os.path.join(trash.files_path, "lost directory", "sub"))
+    with open(os.path.join(trash.files_path, "lost directory", "sub", "file"), "wb") as f:
+        f.write(b"x" * 10000)
+    trash.add_info("gone", datetime.datetime.now())
+
+
+def test_find_orphans_matches_names_byte_for_byte(trash):
+    now = datetime.datetime.now()
+    # A trashed .trashinfo file, a name with an undecodable byte and one that looks escaped
+    for name in ["notes.trashinfo", "a%20b", "plain"]:
+        trash.add_file(name, now)
+    for path in [
+        os.path.join(os.fsencode(trash.files_path), b"caf\xe9"),
+        os.path.join(os.fsencode(trash.info_path), b"caf\xe9.trashinfo"),
+    ]:
+        with open(path, "wb"):
+            pass
+    os.unlink(os.path.join(trash.files_path, "plain"))
+    with open(os.path.join(trash.files_path, "a b"), "w"):
+        pass
+    with open(os.path.join(trash.info_path, "partial.trashinfo.tmp"), "w"):
+        pass
+
+    (orphan_files, orphan_infos) = app.find_orphans(
+        app.scan_info_directory(trash.info_path), app.scan_files_directory(trash.files_path)
+    )
+    assert [entry.name for entry in orphan_files] == ["a b"]
+    assert [entry.name for entry in orphan_infos] == ["plain.trashinfo"]
+
+
+def test_orphans_purge_removes_both_kinds_and_counts_their_bytes(trash):
+    now = datetime.datetime.now()
+    trash.add_file("kept", now, size=100)
+    add_orphans(trash)
+
+    options = OptionsClass()
+    options.days = 30
+    options.dryrun = False
+    options.stat = True
+    options.orphans = "purge"
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, later_os_access()) == 0
+    assert os.listdir(trash.files_path) == ["kept"]
+    assert os.listdir(trash.info_path) == ["kept.trashinfo"]
+    assert stats.orphan_files == 2
+    assert stats.orphan_bytes > 20000
+    assert stats.deleted_files == 2
+    assert stats.deleted_size == stats.bytes_freed == stats.orphan_bytes
+    assert stats.total_size > stats.orphan_bytes
+    assert "orphans" in stats.phases
+
+
+def test_orphans_report_leaves_them_but_trash_limit_sees_them(trash, caplog):
+    now = datetime.datetime.now()
+    trash.add_file("old", now - datetime.timedelta(days=2), size=100)
+    trash.add_file("new", now, size=100)
+    add_orphans(trash)
+
+    options = OptionsClass()
+    options.days = 30
+    options.dryrun = False
+    options.orphans = "report"
+    options.trash_limit = 1
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, later_os_access()) == 0
+    assert stats.deleted_files == 0
+    assert "gone.trashinfo" in os.listdir(trash.info_path)
+    # With the orphans the trash exceeds the limit, so the oldest entry has to go
+    with open(os.path.join(trash.files_path, "lost"), "ab") as f:
+        f.write(b"x" * 1024 * 1024)
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, later_os_access()) == 0
+    files = os.listdir(trash.files_path)
+    assert "old" not in files
+    assert "lost" in files and "lost directory" in files
+    assert "lost has no .trashinfo file" in caplog.text
+    assert "gone.trashinfo has no real file" in caplog.text
+
+
+def test_orphans_are_left_alone_while_they_may_still_be_trashed(trash):
+    add_orphans(trash)
+    options = OptionsClass()
+    options.days = 30
+    options.dryrun = False
+    options.orphans = "purge"
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, app.new_os_access()) == 0
+    assert sorted(os.listdir(trash.files_path)) == ["lost", "lost directory"]
+    assert stats.orphan_files == 0
+
+
+def test_orphans_purged_count_towards_the_trash_limit(trash):
+    now = datetime.datetime.now()
+    for i in range(10):
+        trash.add_file("file%d" % i, now - datetime.timedelta(days=i), size=1024 * 1024)
+    with open(os.path.join(trash.files_path, "lost"), "wb") as f:
+        f.write(b"x" * 5 * 1024 * 1024)
+
+    options = OptionsClass()
+    options.days = 30
+    options.dryrun = False
+    options.orphans = "purge"
+    options.trash_limit = 5
+    assert app.process_path(trash.info_path, options, app.StatsClass(), later_os_access()) == 0
+    # The purged orphan freed 5 MB of the 15 MB, the oldest entries go until 5 MB are left
+    assert sorted(os.listdir(trash.files_path)) == ["file%d" % i for i in range(4)]
+
+
+def test_orphans_that_cannot_be_purged_are_not_counted_as_deleted(trash):
+    now = datetime.datetime.now()
+    for i in range(3):
+        trash.add_file("file%d" % i, now - datetime.timedelta(days=i), size=1024 * 1024)
+    with open(os.path.join(trash.files_path, "lost"), "wb") as f:
+        f.write(b"x" * 2 * 1024 * 1024)
+
+    options = OptionsClass()
+    options.days = 30
+    options.dryrun = False
+    options.orphans = "purge"
+    options.trash_limit = 4
+    os_access = later_os_access()
+    os_access.purge_orphan = lambda path, dryrun, entry: False
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, os_access) == 0
+    # The orphan is still there and counts towards the 5 MB, so the two oldest entries have to go
+    assert sorted(os.listdir(trash.files_path)) == ["file0", "lost"]
+    assert stats.deleted_files == 2
+    assert stats.deleted_size == stats.bytes_freed < 3 * 1024 * 1024
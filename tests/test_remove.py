@@ -0,0 +1,167 @@
+import datetime
+import os
+import sys
+
+import pytest
+from test_app import OptionsClass
+
+from autotrash import app, remove
+from autotrash.remove import remove_tree
+
+
+def make_tree(root: str) -> None:
+    os.makedirs(os.path.join(root, "directory", "sub"))
+    with open(os.path.join(root, "directory", "sub", "file"), "wb") as f:
+        f.write(b"x" * 5000)
+    with open(os.path.join(root, "file"), "wb") as f:
+        f.write(b"x" * 100)
+    os.symlink("file", os.path.join(root, "file-link"))
+    os.symlink("missing", os.path.join(root, "broken-link"))
+
+
+def test_removes_tree_without_following_links(tmp_path):
+    outside = tmp_path / "outside"
+    make_tree(str(outside))
+    tree = tmp_path / "tree"
+    make_tree(str(tree))
+    os.symlink(str(outside), str(tree / "directory-link"))
+
+    assert remove_tree(str(tree)) == []
+    assert not tree.exists()
+    assert (outside / "directory" / "sub" / "file").exists()
+    assert remove_tree(str(tree / "missing")) == []
+
+
+def test_removes_read_only_directories(tmp_path):
+    tree = tmp_path / "tree"
+    make_tree(str(tree))
+    (tree / "directory" / "sub").chmod(0o500)
+    (tree / "directory").chmod(0)
+    assert remove_tree(str(tree)) == []
+    assert not tree.exists()
+
+
+def test_removes_trees_deeper_than_the_recursion_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(remove, "MAX_OPEN_DIRECTORIES", 10)
+    depth = sys.getrecursionlimit() + 100
+    path = str(tmp_path / "deep")
+    # os.makedirs would recurse as well, so build the tree by hand
+    os.mkdir(path)
+    fd = os.open(path, os.O_RDONLY)
+    for _ in range(depth):
+        os.mkdir("d", dir_fd=fd)
+        parent_fd, fd = fd, os.open("d", os.O_RDONLY, dir_fd=fd)
+        os.close(parent_fd)
+        with open("file", "wb", opener=lambda name, flags: os.open(name, flags, dir_fd=fd)):
+            pass
+    os.close(fd)
+    assert remove_tree(path) == []
+    assert not os.path.exists(path)
+
+
+def test_reports_what_could_not_be_removed(tmp_path, monkeypatch):
+    tree = tmp_path / "tree"
+    make_tree(str(tree))
+    unlink = os.unlink
+
+    def failing_unlink(path, *args, **kwargs):
+        if path == "file" and kwargs.get("dir_fd") is not None:
+            raise OSError(5, "Input/output error")
+        return unlink(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "unlink", failing_unlink)
+    errors = remove_tree(str(tree))
+    assert sorted(path for (path, _) in errors) == [
+        str(tree / "directory" / "sub" / "file"),
+        str(tree / "file"),
+    ]
+    assert (tree / "directory" / "sub" / "file").exists()
+    assert tree.exists()
+
+
+def test_purge_keeps_trash_info_when_removing_fails(trash, monkeypatch, caplog):
+    trash.add_directory("directory", datetime.datetime.now(), files=3)
+    trash_info = trash.trash_info("directory")
+    # Without a staging directory the directory is removed where it is
+    with open(os.path.join(trash.path, app.STAGING_DIRECTORY), "w"):
+        pass
+    monkeypatch.setattr(
+        remove, "remove_tree", lambda path, st, throttle: [(path, OSError(5, "I/O error"))]
+    )
+    target_entry = app.scan_files_directory(trash.files_path)["directory"]
+    assert app.purge(None, trash_info, False, target_entry) is False
+    assert os.path.exists(trash_info)
+    assert "Failed to remove" in caplog.text
+
+
+def test_interrupted_purge_is_resumed_first_without_counting_it_again(trash, monkeypatch):
+    now = datetime.datetime.now()
+    trash.add_directory("huge", now - datetime.timedelta(days=40), files=50, size=1000)
+    trash.add_file("old", now - datetime.timedelta(days=10), size=1024 * 1024)
+    trash.add_file("new", now, size=1024 * 1024)
+    staged = os.path.join(trash.path, app.STAGING_DIRECTORY, "huge")
+    real_remove_tree = remove.remove_tree
+
+    def interrupted(path, st=None, throttle=None):
+        # Stands in for a run that was killed while removing the staged directory
+        return [(path, OSError(4, "Interrupted"))] if path == staged else real_remove_tree(path, st)
+
+    options = OptionsClass()
+    options.days = 30
+    options.dryrun = False
+    monkeypatch.setattr(remove, "remove_tree", interrupted)
+    assert app.process_path(trash.info_path, options, app.StatsClass(), app.new_os_access()) == 0
+    assert os.path.isdir(staged)
+    assert sorted(os.listdir(trash.info_path)) == ["new.trashinfo", "old.trashinfo"]
+
+    monkeypatch.setattr(remove, "remove_tree", real_remove_tree)
+    options.days = 0
+    options.delete = 1
+    options.stat = True
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, app.new_os_access()) == 0
+    assert not os.path.exists(os.path.dirname(staged))
+    assert stats.purges_resumed == 1
+    assert "resuming" in stats.phases
+    # The resumed purge does not count towards --delete, so the oldest entry still goes
+    assert stats.deleted_files == 1
+    assert os.listdir(trash.files_path) == ["new"]
+
+
+def test_resume_removes_the_trash_info_left_behind(trash):
+    now = datetime.datetime.now()
+    staging = os.path.join(trash.path, app.STAGING_DIRECTORY)
+    for name in ["left", "reused"]:
+        os.makedirs(os.path.join(staging, name, "sub"))
+        trash.add_info(name, now)
+    # A new entry trashed since under the same name
+    trash.add_file("reused", now)
+    assert app.resume_purges(trash.path, True) == 0
+    assert sorted(os.listdir(staging)) == ["left", "reused"]
+    assert app.resume_purges(trash.path, False) == 2
+    assert not os.path.exists(staging)
+    assert os.listdir(trash.info_path) == ["reused.trashinfo"]
+    assert os.listdir(trash.files_path) == ["reused"]
+
+
+@pytest.mark.parametrize("purge_workers", [1, 4])
+def test_purge_workers_remove_the_same_entries(trash, purge_workers):
+    now = datetime.datetime.now()
+    for i in range(40):
+        trash.add_directory("directory%02d" % i, now - datetime.timedelta(days=i), files=3, size=1)
+        trash.add_file("file%02d" % i, now - datetime.timedelta(days=i, hours=1), size=1)
+
+    options = OptionsClass()
+    options.days = 30
+    options.dryrun = False
+    options.stat = True
+    options.purge_workers = purge_workers
+    stats = app.StatsClass()
+    assert app.process_path(trash.info_path, options, stats, app.new_os_access()) == 0
+
+    remaining = sorted(os.listdir(trash.files_path))
+    assert remaining == sorted(
+        ["directory%02d" % i for i in range(31)] + ["file%02d" % i for i in range(31)]
+    )
+    assert sorted(os.listdir(trash.info_path)) == [name + ".trashinfo" for name in remaining]
+    assert stats.deleted_files == 18
@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+# Modules only needed once the trash is scanned or purged, or for other modes than a plain run
+SCAN_MODULES = [
+    "autotrash.directorysizes",
+    "autotrash.evict",
+    "autotrash.index",
+    "autotrash.metrics",
+    "autotrash.remove",
+    "autotrash.usage",
+    "autotrash.watch",
+    "concurrent.futures",
+    "ctypes",
+    "hashlib",
+    "importlib.metadata",
+    "json",
+    "multiprocessing",
+    "shutil",
+    "sqlite3",
+    "subprocess",
+    "tempfile",
+]
+
+# Microseconds, plenty for a slow machine, but not for importing the modules above
+MAX_IMPORT_TIME = 200000
+
+
+def run_with_importtime(args):
+    """Run autotrash with args under -X importtime, returning its exit code and import times"""
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import sys; from autotrash.app import cli; sys.argv[1:] = %r; sys.exit(cli())" % args,
+        ],
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    imports = {}
+    for line in process.stderr.splitlines():
+        if line.startswith("import time:") and "self [us]" not in line:
+            (_, cumulative, name) = line.split("|")
+            imports[name.strip()] = int(cumulative)
+    return (process.returncode, imports)
+
+
+def test_max_free_exits_before_importing_what_scanning_needs(trash):
+    (returncode, imports) = run_with_importtime(["-d", "30", "--max-free", "1", "-T", trash.path])
+    assert returncode == 0
+    assert "autotrash.app" in imports
+    assert [name for name in SCAN_MODULES if name in imports] == []
+    assert imports["autotrash.app"] < MAX_IMPORT_TIME
@@ -0,0 +1,123 @@
+import ctypes
+import datetime
+import os
+import platform
+
+from test_app import OptionsClass
+
+from autotrash import app, throttle
+from autotrash.throttle import RateLimiter, Throttle, dirent_size
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = 0.0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+def test_dirent_size():
+    assert dirent_size("a") == 24
+    assert dirent_size("abcd") == 24
+    assert dirent_size("abcde") == 32
+    assert dirent_size("\udcff") == 24
+
+
+def test_rate_limiter_allows_one_second_of_burst():
+    fake = FakeTime()
+    limiter = RateLimiter(10, fake.clock, fake.sleep)
+    for _ in range(10):
+        limiter.take(1)
+    assert fake.slept == 0
+    for _ in range(20):
+        limiter.take(1)
+    assert abs(fake.slept - 2) < 1e-9
+    # More than a second's worth at once is allowed, the debt is paid by waiting
+    limiter.take(50)
+    assert abs(fake.slept - 7) < 1e-9
+
+
+def test_unlink_rate_backs_off_when_unlinking_gets_slow():
+    fake = FakeTime()
+    pacer = Throttle(unlink_rate=100, clock=fake.clock, sleep=fake.sleep)
+    assert pacer.unlinks is not None
+
+    def unlink_taking(seconds):
+        def unlink():
+            fake.now += seconds
+
+        return unlink
+
+    for _ in range(300):
+        pacer.unlink(unlink_taking(0.002))
+    assert pacer.unlinks.rate == 100
+
+    for _ in range(100):
+        pacer.unlink(unlink_taking(0.05))
+    assert pacer.unlinks.rate < 10
+
+    for _ in range(1000):
+        pacer.unlink(unlink_taking(0.002))
+    assert pacer.unlinks.rate == 100
+
+
+class CountingThrottle(Throttle):
+    def __init__(self):
+        super().__init__()
+        self.metadata_bytes_taken = 0
+        self.unlinked = []
+
+    def metadata(self, size):
+        self.metadata_bytes_taken += size
+
+    def unlink(self, function, *args, **kwargs):
+        self.unlinked.append(args[0])
+        function(*args, **kwargs)
+
+
+def test_process_path_is_throttled(trash):
+    old = datetime.datetime.now() - datetime.timedelta(days=10)
+    trash.add_file("file", old, size=10)
+    trash.add_directory("directory", old, files=3, size=10)
+    trash.add_file("new", datetime.datetime.now(), size=10)
+
+    options = OptionsClass()
+    options.days = 5
+    options.dryrun = False
+    options.stat = True
+    counting = CountingThrottle()
+    stats = app.StatsClass()
+    names = ["file", "directory", "new"]
+    # Reading .trashinfo files and listing info/ and files/
+    expected_metadata = sum(os.path.getsize(trash.trash_info(name)) for name in names)
+    expected_metadata += sum(dirent_size(name + ".trashinfo") + dirent_size(name) for name in names)
+    # Listing the trashed directory to size it, and again to remove it
+    directory_entries = ["sub", "file0", "file1", "file2"]
+    expected_metadata += 2 * sum(dirent_size(name) for name in directory_entries)
+
+    assert app.process_path(trash.info_path, options, stats, app.new_os_access(counting)) == 0
+    assert stats.deleted_files == 2
+    # file, its .trashinfo, three files and two directories, and the directory's .trashinfo
+    assert len(counting.unlinked) == 8
+    assert counting.metadata_bytes_taken == expected_metadata
+
+
+def test_set_io_priority(monkeypatch):
+    calls = []
+
+    class FakeLibc:
+        def syscall(self, *args):
+            calls.append(args)
+            return 0
+
+    monkeypatch.setattr(platform, "machine", lambda: "x86_64")
+    monkeypatch.setattr(ctypes, "CDLL", lambda *args, **kwargs: FakeLibc())
+    throttle.lower_priority(0, "idle")
+    throttle.lower_priority(0, "best-effort")
+    assert calls == [(251, 1, 0, 3 << 13), (251, 1, 0, 2 << 13 | 7)]
@@ -0,0 +1,87 @@
+import configparser
+import datetime
+import os
+
+import pytest
+
+from autotrash import app
+from autotrash.trashinfo import parse_trash_info, read_datetime
+
+
+def test_read_datetime_for_all_known_formats():
+    assert read_datetime("2019-10-17T15:33:57") == datetime.datetime(2019, 10, 17, 15, 33, 57)
+    assert read_datetime("2019-10-17T15:33:57.710Z") == datetime.datetime(
+        2019, 10, 17, 15, 33, 57, 710000
+    )
+    assert read_datetime("2019-10-17T15:33:57.000001Z") == datetime.datetime(
+        2019, 10, 17, 15, 33, 57, 1
+    )
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "",
+        "2019-10-17",
+        "2019-10-17 15:33:57",
+        "2019-1O-17T15:33:57",
+        "2019-13-17T15:33:57",
+        "2019-10-17T15:33:57Z",
+        "2019-10-17T15:33:57.710",
+        "2019-10-17T15:33:57.1234567Z",
+        "2019-10-17T15:33:57+02:00",
+    ],
+)
+def test_read_datetime_rejects_what_strptime_rejects(value):
+    with pytest.raises(ValueError):
+        read_datetime(value)
+    for format in ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%S.%fZ"]:
+        with pytest.raises(ValueError):
+            datetime.datetime.strptime(value, format)
+
+
+def test_parse_trash_info():
+    info = parse_trash_info(
+        b"[Trash Info]\r\nPath=/home/user/with%20space/%C3%A9\r\n"
+        b"DeletionDate=2019-10-17T15:33:57\r\n"
+    )
+    assert info.path == "/home/user/with space/é"
+    assert info.deletion_date == datetime.datetime(2019, 10, 17, 15, 33, 57)
+
+
+def test_parse_trash_info_agrees_with_configparser():
+    data = (
+        b"# comment\n[Other]\nDeletionDate=2000-01-01T00:00:00\n\n"
+        b"[Trash Info]\n  DeletionDate = 2019-10-17T15:33:57  \nPath=/a\n"
+    )
+    parser = configparser.ConfigParser()
+    parser.read_string(data.decode())
+    expected = read_datetime(parser.get("Trash Info", "DeletionDate"))
+    assert parse_trash_info(data).deletion_date == expected
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"\0x0\0x0\0x0\0x0",
+        b"DeletionDate=2019-10-17T15:33:57\n[Trash Info]\n",
+        b"[Trash Info\nDeletionDate=2019-10-17T15:33:57\n",
+        b"[Trash Info]\nDeletionDate\n",
+        b"[Trash Info]\nDeletionDate=yesterday\n",
+        b"[Trash Info]\nPath=\xff\nDeletionDate=2019-10-17T15:33:57\n",
+    ],
+)
+def test_corrupt_trash_info_is_reported(tmp_path, caplog, data):
+    trash_info = tmp_path / "corrupt.trashinfo"
+    trash_info.write_bytes(data)
+    assert app.get_trash_info_date(str(trash_info)) is None
+    assert "Failed to read %s" % trash_info in caplog.text
+
+
+def test_missing_deletion_date_is_not_an_error(tmp_path, caplog):
+    empty = tmp_path / "empty.trashinfo"
+    empty.write_bytes(b"")
+    assert app.get_trash_info_date(str(empty)) is None
+    assert app.get_trash_info_date(os.devnull) is None
+    assert app.get_trash_info_date(str(tmp_path / "missing.trashinfo")) is None
+    assert caplog.text == ""
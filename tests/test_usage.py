@@ -0,0 +1,138 @@
+import logging
+import os
+import sys
+
+import pytest
+
+from autotrash import remove, usage
+from autotrash.usage import TreeUsage, get_tree_usage
+
+
+def recursive_usage(path):
+    """The straightforward recursive definition of the consumed size and number of entries"""
+    st = os.lstat(path)
+    if os.path.islink(path):
+        return (st.st_size, 1)
+    size, files = (st.st_blocks * 512, 1)
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            (child_size, child_files) = recursive_usage(os.path.join(path, name))
+            size += child_size
+            files += child_files
+    return (size, files)
+
+
+def make_tree(root):
+    os.makedirs(os.path.join(root, "a", "b", "c"))
+    os.makedirs(os.path.join(root, "empty"))
+    for i, directory in enumerate(["", "a", "a/b", "a/b/c"]):
+        with open(os.path.join(root, directory, "file"), "wb") as f:
+            f.write(b"x" * 5000 * i)
+    os.symlink("a/b", os.path.join(root, "directory-link"))
+    os.symlink("missing", os.path.join(root, "a", "broken-link"))
+    os.link(os.path.join(root, "file"), os.path.join(root, "a", "hardlink"))
+
+
+def test_matches_recursive_definition(tmp_path):
+    make_tree(str(tmp_path))
+    expected = recursive_usage(str(tmp_path))
+    assert get_tree_usage(str(tmp_path)) == expected
+    assert get_tree_usage(str(tmp_path), os.lstat(str(tmp_path))) == expected
+    assert get_tree_usage(str(tmp_path / "a" / "b" / "file")).files == 1
+
+
+def test_does_not_follow_links(tmp_path):
+    make_tree(str(tmp_path / "tree"))
+    link = str(tmp_path / "link")
+    os.symlink("tree", link)
+    assert get_tree_usage(link) == (os.lstat(link).st_size, 1)
+
+
+def test_walks_trees_deeper_than_the_recursion_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(usage, "MAX_OPEN_DIRECTORIES", 10)
+    depth = sys.getrecursionlimit() + 100
+    path = str(tmp_path / "deep")
+    # os.makedirs and shutil.rmtree would recurse as well, so build and remove the tree by hand
+    os.mkdir(path)
+    fd = os.open(path, os.O_RDONLY)
+    for _ in range(depth):
+        os.mkdir("d", dir_fd=fd)
+        parent_fd, fd = fd, os.open("d", os.O_RDONLY, dir_fd=fd)
+        os.close(parent_fd)
+    os.close(fd)
+    try:
+        assert get_tree_usage(path).files == depth + 1
+    finally:
+        for level in range(depth, -1, -1):
+            os.rmdir(os.path.join(path, *(["d"] * level)))
+
+
+def make_long_deep_tree(path, depth, name):
+    """A chain of depth directories named name with a file at the bottom, longer than PATH_MAX"""
+    os.mkdir(path)
+    fd = os.open(path, os.O_RDONLY)
+    for _ in range(depth):
+        os.mkdir(name, dir_fd=fd)
+        parent_fd, fd = fd, os.open(name, os.O_RDONLY, dir_fd=fd)
+        os.close(parent_fd)
+    os.close(os.open("file", os.O_WRONLY | os.O_CREAT, dir_fd=fd))
+    os.close(fd)
+
+
+def test_walks_trees_with_paths_longer_than_the_system_allows(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(usage, "MAX_OPEN_DIRECTORIES", 10)
+    monkeypatch.setattr(remove, "MAX_OPEN_DIRECTORIES", 10)
+    path = str(tmp_path / "deep")
+    make_long_deep_tree(path, 200, "d" * 40)
+    try:
+        expected = TreeUsage(get_tree_usage(path).size, 202)
+        assert get_tree_usage(path) == expected
+        assert usage.get_tree_usages([(path, None)], 4) == [expected]
+        # Small tasks, so directories far beyond PATH_MAX are handed over by path
+        monkeypatch.setattr(usage, "SPLIT_ENTRIES", 7)
+        assert usage.get_tree_usages([(path, None)], 4) == [expected]
+        assert "Error" not in caplog.text
+    finally:
+        assert remove.remove_tree(path) == []
+
+
+def test_keeps_going_after_errors(tmp_path, caplog):
+    if os.geteuid() == 0:
+        pytest.skip("permissions are not enforced for root")
+    make_tree(str(tmp_path))
+    locked = tmp_path / "locked"
+    locked.mkdir()
+    (locked / "file").write_bytes(b"x" * 5000)
+    locked.chmod(0)
+    try:
+        with caplog.at_level(logging.ERROR):
+            result = get_tree_usage(str(tmp_path))
+    finally:
+        locked.chmod(0o700)
+    assert "Error getting size for %s" % locked in caplog.text
+    assert result.files == recursive_usage(str(tmp_path))[1] - 1
+
+
+def test_missing_path(tmp_path, caplog):
+    assert get_tree_usage(str(tmp_path / "missing")) == (0, 0)
+    assert "Error getting size for" in caplog.text
+
+
+def test_parallel_usage_matches_serial(tmp_path, monkeypatch):
+    monkeypatch.setattr(usage, "SPLIT_ENTRIES", 3)
+    for i in range(5):
+        make_tree(str(tmp_path / ("tree%d" % i)))
+        for j in range(10):
+            os.makedirs(str(tmp_path / ("tree%d" % i) / "wide" / str(j) / "deeper"))
+    paths = [str(path) for path in sorted(tmp_path.iterdir())]
+    paths += [str(tmp_path / "tree0" / "file"), str(tmp_path / "tree0" / "directory-link")]
+    trees = [(path, None) for path in paths] + [(paths[1], os.lstat(paths[1]))]
+
+    expected = [get_tree_usage(path, st) for (path, st) in trees]
+    assert usage.get_tree_usages(trees, 4) == expected
+    assert usage.get_tree_usages(trees, 1) == expected
+
+
+def test_parallel_usage_of_missing_path(tmp_path, caplog):
+    assert usage.get_tree_usages([(str(tmp_path / "missing"), None)], 2) == [(0, 0)]
+    assert "Error getting size for" in caplog.text
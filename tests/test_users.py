@@ -0,0 +1,112 @@
+import datetime
+import logging
+import os
+import pwd
+
+from conftest import Trash
+from test_app import OptionsClass
+
+from autotrash import app
+from autotrash.mounts import Mount, list_mount_trashes
+from autotrash.users import User, find_users, home_trash
+
+
+def passwd_entry(name, uid, home):
+    return pwd.struct_passwd((name, "x", uid, os.getgid(), "", home, "/bin/sh"))
+
+
+def test_list_mount_trashes_prefers_the_shared_trash_directory(tmp_path):
+    (tmp_path / ".Trash" / "1000").mkdir(parents=True)
+    (tmp_path / ".Trash" / "sticky").mkdir()
+    (tmp_path / ".Trash-1000").mkdir()
+    (tmp_path / ".Trash-1001").mkdir()
+    (tmp_path / ".Trash-other").mkdir()
+    assert list_mount_trashes(str(tmp_path)) == {
+        1000: str(tmp_path / ".Trash" / "1000"),
+        1001: str(tmp_path / ".Trash-1001"),
+    }
+
+
+def test_find_users_only_keeps_trash_directories_owned_by_the_user(tmp_path, caplog):
+    uid = os.getuid()
+    for name in ["me", "other", "linked"]:
+        (tmp_path / name).mkdir()
+    os.makedirs(home_trash(str(tmp_path / "me")))
+    # Owned by the user running the test, not by the user of this home directory
+    os.makedirs(home_trash(str(tmp_path / "other")))
+    os.makedirs(os.path.dirname(home_trash(str(tmp_path / "linked"))))
+    os.symlink(home_trash(str(tmp_path / "me")), home_trash(str(tmp_path / "linked")))
+    (tmp_path / "mnt" / (".Trash-%d" % uid)).mkdir(parents=True)
+
+    users = find_users(
+        [Mount("0:1", "/", str(tmp_path / "mnt"), "ext4", False)],
+        1.0,
+        [
+            passwd_entry("me", uid, str(tmp_path / "me")),
+            passwd_entry("alias", uid, str(tmp_path / "me")),
+            passwd_entry("other", uid + 1, str(tmp_path / "other")),
+            passwd_entry("nobody", uid + 2, str(tmp_path / "missing")),
+            passwd_entry("linked", uid, str(tmp_path / "linked")),
+        ],
+    )
+    assert users == [
+        User(
+            "me",
+            uid,
+            os.getgid(),
+            str(tmp_path / "me"),
+            [home_trash(str(tmp_path / "me")), str(tmp_path / "mnt" / (".Trash-%d" % uid))],
+        )
+    ]
+    assert "not a directory owned by user %d" % (uid + 1) in caplog.text
+
+
+def test_process_users_merges_the_statistics_of_every_user(tmp_path, caplog):
+    now = datetime.datetime.now()
+    first = Trash(tmp_path / "first")
+    first.add_file("old", now - datetime.timedelta(days=40), size=100)
+    first.add_file("new", now, size=100)
+    second = Trash(tmp_path / "second")
+    second.add_file("old", now - datetime.timedelta(days=40), size=100)
+    user = User("me", os.getuid(), os.getgid(), str(tmp_path), [first.path, second.path])
+    empty = User("empty", os.getuid(), os.getgid(), str(tmp_path), [str(tmp_path / "none")])
+
+    options = OptionsClass()
+    options.days = 30
+    options.dryrun = False
+    options.stat = True
+    stats = app.StatsClass()
+    caplog.set_level(logging.INFO)
+    assert app.process_users([user, empty], options, stats, 2) == 0
+    assert stats.deleted_files == 2
+    assert sorted(stats.directories) == [first.info_path, second.info_path]
+    assert os.listdir(first.files_path) == ["new"]
+    assert os.listdir(second.files_path) == []
+    assert "User me: 2 of 3 entries deleted" in caplog.text
+
+
+def test_the_rates_are_shared_by_the_users_processed_at_the_same_time(tmp_path):
+    options = OptionsClass()
+    options.unlink_rate = 100
+    options.metadata_rate = 64
+    throttle = app.new_throttle(options, 4)
+    assert throttle is not None and throttle.unlinks is not None
+    assert throttle.metadata_bytes is not None
+    assert throttle.unlinks.rate == 25
+    assert throttle.metadata_bytes.rate == 16 * 1024
+
+    now = datetime.datetime.now()
+    trashes = [Trash(tmp_path / ("trash%d" % i)) for i in range(2)]
+    for trash in trashes:
+        trash.add_file("old", now - datetime.timedelta(days=40), size=100)
+    users = [
+        User("user%d" % i, os.getuid(), os.getgid(), str(tmp_path), [trash.path])
+        for i, trash in enumerate(trashes)
+    ]
+    options.days = 30
+    options.dryrun = False
+    options.stat = True
+    stats = app.StatsClass()
+    assert app.process_users(users, options, stats, 4) == 0
+    assert stats.deleted_files == 2
+    assert [os.listdir(trash.files_path) for trash in trashes] == [[], []]
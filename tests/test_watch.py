@@ -0,0 +1,137 @@
+import datetime
+import os
+import shutil
+import subprocess
+
+import pytest
+from test_app import OptionsClass
+
+from autotrash import app
+from autotrash.watch import Watcher, open_inotify
+
+
+class FsStat:
+    f_bsize = 1024
+
+    def __init__(self, free_megabytes):
+        self.f_bavail = 1024 * free_megabytes
+
+
+def new_watcher(trash, options, inotify=None, free_megabytes=1000, clock=None):
+    processed = []
+    watcher = Watcher(
+        [trash.info_path],
+        options,
+        processed.append,
+        inotify,
+        lambda path: FsStat(free_megabytes),
+        clock or app.get_cur_time,
+    )
+    return (watcher, processed)
+
+
+def days_ago(days: float) -> datetime.datetime:
+    return datetime.datetime.now() - datetime.timedelta(days=days)
+
+
+def test_processes_expired_entries_at_start(trash):
+    trash.add_file("new", days_ago(0))
+    (watcher, processed) = new_watcher(trash, OptionsClass())
+    watcher.step(0)
+    assert processed == []
+
+    trash.add_file("old", days_ago(3))
+    (watcher, processed) = new_watcher(trash, OptionsClass())
+    watcher.step(0)
+    assert processed == [trash.info_path]
+    watcher.step(0)
+    assert processed == [trash.info_path]
+
+
+def test_processes_entry_once_it_expires(trash):
+    trash.add_file("new", days_ago(0))
+    now = [app.get_cur_time()]
+    (watcher, processed) = new_watcher(trash, OptionsClass(), clock=lambda: now[0])
+    watcher.step(0)
+    assert processed == []
+    now[0] += 24 * 3600
+    watcher.step(0)
+    assert processed == []
+    now[0] += 24 * 3600
+    watcher.step(0)
+    assert processed == [trash.info_path]
+
+
+def test_processes_when_free_space_is_low(trash):
+    options = OptionsClass()
+    options.days = 0
+    options.min_free = 100
+    (watcher, processed) = new_watcher(trash, options, free_megabytes=500)
+    watcher.step(0)
+    assert processed == []
+    (watcher, processed) = new_watcher(trash, options, free_megabytes=50)
+    watcher.step(0)
+    assert processed == [trash.info_path]
+
+
+def test_polls_without_inotify(trash):
+    options = OptionsClass()
+    options.watch_interval = 0
+    (watcher, processed) = new_watcher(trash, options)
+    watcher.step(0)
+    trash.add_file("old", days_ago(3))
+    # Make sure the directory modification time changes on filesystems with a coarse clock
+    os.utime(trash.info_path, ns=(0, 0))
+    watcher.step(0)
+    assert processed == [trash.info_path]
+
+
+@pytest.mark.skipif(open_inotify() is None, reason="inotify is not available")
+def test_inotify_picks_up_new_entries(trash):
+    options = OptionsClass()
+    options.trash_limit = 1
+    (watcher, processed) = new_watcher(trash, options, inotify=open_inotify())
+    trash.add_file("new", days_ago(0), size=1000)
+    watcher.step(1)
+    watcher.step(0)
+    assert processed == []
+    assert "new.trashinfo" in watcher.trashes[0].entries
+
+    trash.add_file("old", days_ago(3))
+    watcher.step(1)
+    watcher.step(0)
+    assert processed == [trash.info_path]
+
+    trash.add_directory("big", days_ago(0), files=2, size=1024 * 1024)
+    watcher.step(1)
+    watcher.step(0)
+    assert processed == [trash.info_path] * 2
+
+    os.unlink(trash.trash_info("old"))
+    watcher.step(1)
+    assert "old.trashinfo" not in watcher.trashes[0].entries
+
+
+def test_install_watch_service(tmp_path, monkeypatch):
+    commands = []
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    monkeypatch.setattr(shutil, "which", lambda name: "/usr/bin/" + name)
+    monkeypatch.setattr(subprocess, "call", commands.append)
+    monkeypatch.setattr(subprocess, "check_output", commands.append)
+    monkeypatch.setattr(app.sys, "argv", ["autotrash", "-d", "30", "--watch", "--install"])
+    systemd_dir = tmp_path / "systemd" / "user"
+
+    options = OptionsClass()
+    options.dryrun = False
+    assert app.install_service(options, []) == 0
+    assert (systemd_dir / "autotrash.timer").exists()
+    assert "Type=oneshot" in (systemd_dir / "autotrash.service").read_text()
+
+    options.watch = True
+    assert app.install_service(options, []) == 0
+    assert not (systemd_dir / "autotrash.timer").exists()
+    service = (systemd_dir / "autotrash.service").read_text()
+    assert "Type=simple" in service
+    assert 'ExecStart="/usr/bin/autotrash" -d 30 --watch\n' in service
+    assert ["systemctl", "--user", "disable", "--now", "autotrash.timer"] in commands
+    assert commands[-1] == ["systemctl", "--user", "is-active", "autotrash.service"]